@@ -0,0 +1,252 @@
+"""
+Admission control for the MyClean API: rate limits, write concurrency and load shedding
+
+AdmissionMiddleware is a plain ASGI middleware, like MetricsMiddleware, that
+decides before any routing or parsing whether a request is served. In
+order:
+
+1. Rate limits. Each request is counted against the first RATE_LIMITS rule
+   matching its method and path, in a token bucket per (rule, client). The
+   client is the peer address, or the first X-Forwarded-For address when
+   the peer is one of MYCLEAN_TRUSTED_PROXIES. An empty bucket answers 429
+   with Retry-After set to when the next token arrives. Login and
+   registration get small buckets against credential stuffing; the order
+   reads a larger one; everything else shares a generous default.
+2. Load shedding. Reads other than shed-exempt ones (the cached catalogue
+   and service durations, health and metrics) get 503 while more than
+   READ_QUEUE_LIMIT database reads are already waiting or running, so a
+   backlog of order queries cannot hold up requests that do not need the
+   database.
+3. Write concurrency. At most WRITE_CONCURRENCY write requests run at
+   once, since they all funnel into SQLite's single writer; up to
+   WRITE_QUEUE_LIMIT more wait, each for at most WRITE_QUEUE_TIMEOUT_SECONDS,
+   and anything beyond gets 503 at once. Writes are POST/PUT/PATCH/DELETE
+   requests other than the NOT_WRITES routes, which spend their time hashing
+   passwords or checking tokens rather than writing, and are shed like reads.
+
+Rejections are cheap (no body is read, no database touched) and are
+counted in the Metrics registry by reason and limit. All state is per
+process and only touched on the event loop thread.
+
+MYCLEAN_RATE_LIMITS=0 turns off the per-client limits, e.g. for load tests
+whose clients all share one address; the other two stay on.
+"""
+import asyncio
+import math
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from typing import NamedTuple
+
+import orjson
+
+RATE_LIMITS_ENABLED = os.environ.get("MYCLEAN_RATE_LIMITS", "1") != "0"
+TRUSTED_PROXIES = {address.strip() for address in os.environ.get("MYCLEAN_TRUSTED_PROXIES", "").split(",")
+                   if address.strip()}
+
+# Token buckets kept; the least recently used (idle, so refilled) go first
+MAX_BUCKETS = 100000
+
+READ_QUEUE_LIMIT = 64
+# Matched exactly: /api/services/search and /api/services/{id}/availability do read the database
+SHED_EXEMPT = {"/api/services", "/api/health", "/metrics"}
+# Whole-path matches for exempt routes with parameters; durations come from the catalogue cache
+SHED_EXEMPT_PATTERNS = (re.compile(r"/api/services/\d+/durations"),)
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Matched exactly. Login and registration are mostly ~350 ms of scrypt, and
+# a burst of them holding write slots would turn order writes away with 503;
+# their own rate limits bound them instead. Refresh is a read and a one-row
+# insert.
+NOT_WRITES = {"/api/auth/login", "/api/auth/register", "/api/auth/refresh"}
+WRITE_CONCURRENCY = 16
+WRITE_QUEUE_LIMIT = 256
+WRITE_QUEUE_TIMEOUT_SECONDS = 2.0
+
+
+class RateLimit(NamedTuple):
+    name: str
+    methods: frozenset  # empty matches every method
+    prefix: str
+    rate: float  # tokens per second
+    burst: int
+
+
+RATE_LIMITS = (
+    RateLimit("login", frozenset({"POST"}), "/api/auth/login", 10 / 60, 10),
+    RateLimit("register", frozenset({"POST"}), "/api/auth/register", 5 / 60, 5),
+    RateLimit("orders", frozenset({"GET"}), "/api/orders", 20, 50),
+    RateLimit("default", frozenset(), "/", 50, 100),
+)
+
+
+def match_rule(method: str, path: str, rules=RATE_LIMITS):
+    for rule in rules:
+        if (not rule.methods or method in rule.methods) and path.startswith(rule.prefix):
+            return rule
+    return None
+
+
+def is_write(method: str, path: str) -> bool:
+    """Whether a request needs a write slot"""
+    return method in WRITE_METHODS and path not in NOT_WRITES
+
+
+def shed_exempt(path: str) -> bool:
+    """Whether a read is served without the database, so is never shed"""
+    return path in SHED_EXEMPT or any(pattern.fullmatch(path) for pattern in SHED_EXEMPT_PATTERNS)
+
+
+def client_address(scope) -> str:
+    peer = scope["client"][0] if scope.get("client") else ""
+    if peer in TRUSTED_PROXIES:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",")[0].strip()
+    return peer
+
+
+class RateLimiter:
+    """Token buckets per (rule, client), at most MAX_BUCKETS of them"""
+
+    def __init__(self, max_buckets: int = MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        # (rule name, client) -> [tokens, monotonic time of the last update]
+        self._buckets = OrderedDict()
+
+    def acquire(self, rule: RateLimit, client: str, now: float = None) -> float:
+        """Take a token; returns 0 if one was available, else seconds until there is one"""
+        now = time.monotonic() if now is None else now
+        key = (rule.name, client)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(rule.burst), now]
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(rule.burst, bucket[0] + (now - bucket[1]) * rule.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rule.rate
+
+
+class WriteSlots:
+    """At most `limit` holders, with a bounded FIFO of waiters"""
+
+    def __init__(self, limit: int = WRITE_CONCURRENCY, queue_limit: int = WRITE_QUEUE_LIMIT):
+        self.limit = limit
+        self.queue_limit = queue_limit
+        self.active = 0
+        self._waiters = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, timeout: float = WRITE_QUEUE_TIMEOUT_SECONDS) -> bool:
+        """Take a slot, waiting up to timeout; False if the queue is full or the wait timed out"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.queue_limit:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # The client went away while queued
+            if waiter.done():
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            raise
+        if waiter.done():
+            # release() handed this waiter its slot, possibly as the wait timed out
+            return True
+        waiter.cancel()
+        self._waiters.remove(waiter)
+        return False
+
+    def release(self):
+        # Hand the slot straight to the oldest waiter still waiting
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+async def _reject(send, status_code: int, detail: str, retry_after: float):
+    """Answer with a JSON error without reading the request"""
+    body = orjson.dumps({"detail": detail})
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying the rate limits, load shedding and write concurrency limit
+
+    `database` returns the Database whose pending reads are the queue depth.
+    """
+
+    def __init__(self, app, metrics, database, rate_limits: bool = RATE_LIMITS_ENABLED):
+        self.app = app
+        self.metrics = metrics
+        self.database = database
+        self.limiter = RateLimiter() if rate_limits else None
+        self.write_slots = WriteSlots()
+        metrics.add_gauge("myclean_write_requests_active", "Write requests holding a concurrency slot.",
+                          lambda: self.write_slots.active)
+        metrics.add_gauge("myclean_write_requests_queued", "Write requests waiting for a concurrency slot.",
+                          lambda: self.write_slots.queued)
+        metrics.add_gauge("myclean_db_reads_pending", "Database reads queued or running.",
+                          lambda: self.database().pending_reads)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        method, path = scope["method"], scope["path"]
+        if self.limiter is not None:
+            rule = match_rule(method, path)
+            if rule is not None:
+                wait = self.limiter.acquire(rule, client_address(scope))
+                if wait:
+                    self.metrics.reject("rate_limit", rule.name)
+                    await _reject(send, 429, "Too many requests", wait)
+                    return
+
+        if is_write(method, path):
+            if not await self.write_slots.acquire():
+                self.metrics.reject("write_queue", "writes")
+                await _reject(send, 503, "Server busy, try again shortly", 1)
+                return
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                self.write_slots.release()
+            return
+
+        if not shed_exempt(path) and self.database().pending_reads > READ_QUEUE_LIMIT:
+            self.metrics.reject("read_queue", "reads")
+            await _reject(send, 503, "Server busy, try again shortly", 1)
+            return
+        await self.app(scope, receive, send)
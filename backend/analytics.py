@@ -0,0 +1,180 @@
+"""
+Order analytics served from incrementally maintained rollups
+
+Usage: python analytics.py --rebuild [--db myclean.db]
+
+Two rollup tables hold the number of orders and their total value in cents
+per service day, service type and status:
+
+- order_daily_stats for all orders
+- provider_daily_stats per provider, for orders with a provider
+
+Every order sits in exactly one bucket of each: insert_orders() adds it and
+apply_status_changes() moves it from its old status to its new one, in the
+same transaction as the order write. Dashboard queries then read at most
+(service types x statuses) rows per day in the range, however many orders
+there are, instead of scanning orders.
+
+Revenue is the value of completed orders. --rebuild recomputes both tables
+from orders and orders_archive, e.g. after loading orders by other means.
+"""
+import argparse
+import sqlite3
+
+from db import DB_PATH
+
+# Applied with the bucket's key columns first, then the two deltas
+_UPSERTS = {
+    "order_daily_stats": """
+        INSERT INTO order_daily_stats (day, service_type_id, status, order_count, value_cents)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (day, service_type_id, status) DO UPDATE
+        SET order_count = order_count + excluded.order_count, value_cents = value_cents + excluded.value_cents
+    """,
+    "provider_daily_stats": """
+        INSERT INTO provider_daily_stats (provider_id, day, service_type_id, status, order_count, value_cents)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (provider_id, day, service_type_id, status) DO UPDATE
+        SET order_count = order_count + excluded.order_count, value_cents = value_cents + excluded.value_cents
+    """,
+}
+
+
+def to_cents(price) -> int:
+    return int(round(float(price) * 100))
+
+
+class RollupDelta:
+    """Bucket changes collected during a write, applied with one executemany per table"""
+
+    def __init__(self):
+        self.buckets = {table: {} for table in _UPSERTS}
+
+    def _add(self, table: str, key: tuple, count: int, cents: int):
+        bucket = self.buckets[table].get(key)
+        if bucket is None:
+            bucket = self.buckets[table][key] = [0, 0]
+        bucket[0] += count
+        bucket[1] += cents
+
+    def add(self, day: str, provider_id, service_type_id: int, status: str, total_price, count: int = 1):
+        cents = count * to_cents(total_price)
+        self._add("order_daily_stats", (day, service_type_id, status), count, cents)
+        if provider_id is not None:
+            self._add("provider_daily_stats", (provider_id, day, service_type_id, status), count, cents)
+
+    def move(self, day: str, provider_id, service_type_id: int, old_status: str, new_status: str, total_price):
+        self.add(day, provider_id, service_type_id, old_status, total_price, -1)
+        self.add(day, provider_id, service_type_id, new_status, total_price)
+
+    def apply(self, conn):
+        for table, buckets in self.buckets.items():
+            rows = [(*key, count, cents) for key, (count, cents) in buckets.items() if count or cents]
+            if rows:
+                conn.executemany(_UPSERTS[table], rows)
+
+
+def add_orders(conn, first_id: int = 0, source: str = "orders"):
+    """Add every order in `source` with id >= first_id to the rollups, one statement per table"""
+    conn.execute(f"""
+        INSERT INTO order_daily_stats (day, service_type_id, status, order_count, value_cents)
+        SELECT service_date, service_type_id, status, COUNT(*), SUM(CAST(ROUND(total_price * 100) AS INTEGER))
+        FROM {source} WHERE id >= ?
+        GROUP BY 1, 2, 3
+        ON CONFLICT (day, service_type_id, status) DO UPDATE
+        SET order_count = order_count + excluded.order_count, value_cents = value_cents + excluded.value_cents
+    """, (first_id,))
+    conn.execute(f"""
+        INSERT INTO provider_daily_stats (provider_id, day, service_type_id, status, order_count, value_cents)
+        SELECT provider_id, service_date, service_type_id, status,
+               COUNT(*), SUM(CAST(ROUND(total_price * 100) AS INTEGER))
+        FROM {source} WHERE id >= ? AND provider_id IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (provider_id, day, service_type_id, status) DO UPDATE
+        SET order_count = order_count + excluded.order_count, value_cents = value_cents + excluded.value_cents
+    """, (first_id,))
+
+
+def rebuild(conn):
+    for table in _UPSERTS:
+        conn.execute(f"DELETE FROM {table}")
+    add_orders(conn)
+    # Archived orders still count (see archive.py)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'orders_archive'").fetchone():
+        add_orders(conn, source="orders_archive")
+
+
+def _source(provider_id) -> tuple:
+    """Rollup table and extra condition for an optional provider filter"""
+    if provider_id is None:
+        return "order_daily_stats", "", []
+    return "provider_daily_stats", " AND provider_id = ?", [provider_id]
+
+
+def daily_stats(conn, date_from: str, date_to: str, provider_id: int = None) -> list:
+    """Per-day order counts by status and revenue, oldest day first"""
+    table, condition, params = _source(provider_id)
+    sql = f"""
+        SELECT day, status, SUM(order_count) AS order_count, SUM(value_cents) AS value_cents
+        FROM {table} WHERE day BETWEEN ? AND ?{condition}
+        GROUP BY day, status ORDER BY day
+    """
+
+    days = []
+    for row in conn.execute(sql, [date_from, date_to, *params]):
+        if not days or days[-1]["date"] != row["day"]:
+            days.append({"date": row["day"], "orders": {}, "revenue": 0.0})
+        if row["order_count"]:
+            days[-1]["orders"][row["status"]] = row["order_count"]
+        if row["status"] == "completed":
+            days[-1]["revenue"] = row["value_cents"] / 100
+    return days
+
+
+def service_stats(conn, date_from: str, date_to: str, provider_id: int = None) -> list:
+    """Per-service order counts by status and revenue over the range"""
+    table, condition, params = _source(provider_id)
+    sql = f"""
+        SELECT s.service_type_id, st.name, s.status,
+               SUM(s.order_count) AS order_count, SUM(s.value_cents) AS value_cents
+        FROM {table} s
+        LEFT JOIN service_types st ON st.id = s.service_type_id
+        WHERE s.day BETWEEN ? AND ?{condition}
+        GROUP BY s.service_type_id, s.status ORDER BY s.service_type_id
+    """
+
+    services = {}
+    for row in conn.execute(sql, [date_from, date_to, *params]):
+        service = services.setdefault(row["service_type_id"], {
+            "service_type_id": row["service_type_id"],
+            "service_type_name": row["name"],
+            "orders": {},
+            "revenue": 0.0,
+        })
+        if row["order_count"]:
+            service["orders"][row["status"]] = row["order_count"]
+        if row["status"] == "completed":
+            service["revenue"] = row["value_cents"] / 100
+    return list(services.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the MyClean order analytics rollups")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--rebuild", action="store_true", help="recompute the rollup tables from orders")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    conn = sqlite3.connect(args.db)
+    with conn:
+        rebuild(conn)
+    for table in _UPSERTS:
+        count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        print(f"Rebuilt {table}: {count} rows")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
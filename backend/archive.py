@@ -0,0 +1,184 @@
+"""
+Hot/cold archival of finished orders
+
+Usage: python archive.py [--db myclean.db] [--days 365] [--batch 1000]
+
+Completed and cancelled orders whose service date is more than
+ARCHIVE_AFTER_DAYS in the past are moved, with their order_status_history
+rows, from the live tables into orders_archive and
+order_status_history_archive in the same database file. The live tables and
+their indexes then only hold orders that can still change, plus a year of
+history for the order list.
+
+Orders move in batches of ARCHIVE_BATCH, one short write transaction each,
+so other writers wait for at most one batch. The app runs a pass at startup
+and every ARCHIVE_INTERVAL_SECONDS through the database writer (set
+MYCLEAN_ARCHIVE_DAYS=0 to turn that off); the command line runs one now.
+
+Archived orders keep their ids (both tables are AUTOINCREMENT, so ids are
+never reused) and are read-only: GET /api/orders/{id} and
+GET /api/orders/{id}/history read both tables, while status changes, the
+order list, search and the event stream only see live orders (archived
+orders leave order_view with them). The analytics rollups are not touched
+by archival, and analytics.rebuild() counts both tables.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from datetime import date, timedelta
+
+from db import BUSY_TIMEOUT_MS, DB_PATH
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("MYCLEAN_ARCHIVE_DAYS", "365"))
+ARCHIVE_BATCH = 1000
+ARCHIVE_INTERVAL_SECONDS = 3600
+# Pause between batches so writers queued behind one get in, as in migrations.backfill()
+ARCHIVE_PAUSE_SECONDS = 0.02
+ARCHIVED_STATUSES = ("completed", "cancelled")
+
+logger = logging.getLogger("myclean.archive")
+
+# Same columns, in the same order, as the live tables, so rows move with
+# SELECT *; a column added to orders or order_status_history must be added
+# here in the same migration
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS orders_archive (
+        id INTEGER PRIMARY KEY,
+        order_number VARCHAR(20) NOT NULL,
+        customer_id INTEGER,
+        provider_id INTEGER,
+        service_type_id INTEGER,
+        service_duration_id INTEGER,
+        service_date DATE NOT NULL,
+        service_time_start TIME NOT NULL,
+        service_time_end TIME NOT NULL,
+        base_price DECIMAL(10,2) NOT NULL,
+        total_price DECIMAL(10,2) NOT NULL,
+        status VARCHAR(20),
+        customer_notes TEXT,
+        provider_notes TEXT,
+        created_at DATETIME,
+        updated_at DATETIME,
+        confirmed_at TIMESTAMP,
+        completed_at TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS order_status_history_archive (
+        id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL,
+        old_status VARCHAR(20),
+        new_status VARCHAR(20),
+        changed_by INTEGER,
+        notes TEXT,
+        created_at DATETIME
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_order_status_history_archive_order ON order_status_history_archive(order_id)",
+)
+
+
+def cutoff(days: int = ARCHIVE_AFTER_DAYS) -> str:
+    """Service dates before this one are archived"""
+    return (date.today() - timedelta(days=days)).isoformat()
+
+
+def archive_batch(conn, before: str, batch_size: int = ARCHIVE_BATCH) -> int:
+    """Move up to batch_size finished orders with a service date before `before` (inside a write)
+
+    Returns the number of orders moved; fewer than batch_size means none are left.
+    """
+    # No ORDER BY: idx_orders_service_date is read only until the batch is full
+    ids = [row[0] for row in conn.execute(f"""
+        SELECT id FROM orders
+        WHERE service_date < ? AND status IN ({", ".join("?" * len(ARCHIVED_STATUSES))})
+        LIMIT ?
+    """, (before, *ARCHIVED_STATUSES, batch_size))]
+    if not ids:
+        return 0
+    placeholders = ", ".join("?" * len(ids))
+    conn.execute(f"INSERT INTO orders_archive SELECT * FROM orders WHERE id IN ({placeholders})", ids)
+    conn.execute(f"""
+        INSERT INTO order_status_history_archive
+        SELECT * FROM order_status_history WHERE order_id IN ({placeholders})
+    """, ids)
+    conn.execute(f"DELETE FROM order_status_history WHERE order_id IN ({placeholders})", ids)
+    conn.execute(f"DELETE FROM order_view WHERE id IN ({placeholders})", ids)
+    conn.execute(f"DELETE FROM orders WHERE id IN ({placeholders})", ids)
+    return len(ids)
+
+
+async def archive_orders(db, days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH) -> int:
+    """Archive every eligible order through db's writer, one batch per write"""
+    before = cutoff(days)
+    moved = 0
+    while True:
+        count = await db.write(archive_batch, before, batch_size)
+        moved += count
+        if count < batch_size:
+            return moved
+        await asyncio.sleep(ARCHIVE_PAUSE_SECONDS)
+
+
+async def run_archiver(db, days: int = ARCHIVE_AFTER_DAYS, interval: float = ARCHIVE_INTERVAL_SECONDS):
+    """Archive now and then every `interval` seconds, until cancelled"""
+    while True:
+        try:
+            moved = await archive_orders(db, days)
+            if moved:
+                logger.info("archived %d orders with a service date before %s", moved, cutoff(days))
+        except Exception:
+            logger.exception("order archival failed")
+        await asyncio.sleep(interval)
+
+
+def fetch_order_history(conn, order_id: int):
+    """Status changes of an order, live or archived, oldest first; None if there is no such order"""
+    rows = conn.execute("""
+        SELECT id, old_status, new_status, changed_by, notes, created_at
+        FROM order_status_history WHERE order_id = ?
+        UNION ALL
+        SELECT id, old_status, new_status, changed_by, notes, created_at
+        FROM order_status_history_archive WHERE order_id = ?
+        ORDER BY id
+    """, (order_id, order_id)).fetchall()
+    if not rows:
+        exists = conn.execute("""
+            SELECT 1 FROM orders WHERE id = ? UNION ALL SELECT 1 FROM orders_archive WHERE id = ?
+        """, (order_id, order_id)).fetchone()
+        if not exists:
+            return None
+    return [dict(row) for row in rows]
+
+
+def main():
+    from migrations import transaction
+
+    parser = argparse.ArgumentParser(description="Move finished orders to the archive tables")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS or 365,
+                        help="archive orders whose service date is more than this many days ago")
+    parser.add_argument("--batch", type=int, default=ARCHIVE_BATCH, help="orders per transaction")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None, timeout=BUSY_TIMEOUT_MS / 1000)
+    before = cutoff(args.days)
+    started = time.perf_counter()
+    moved = 0
+    while True:
+        with transaction(conn):
+            count = archive_batch(conn, before, args.batch)
+        moved += count
+        if count < args.batch:
+            break
+        time.sleep(ARCHIVE_PAUSE_SECONDS)
+    conn.close()
+    print(f"Archived {moved} orders with a service date before {before} ({time.perf_counter() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Token authentication for the MyClean API
+
+Login issues two signed tokens in the JWT compact format (HS256):
+
+- an access token, valid for ACCESS_TOKEN_SECONDS, sent as
+  "Authorization: Bearer <token>" and verified without touching the database
+- a refresh token, valid for REFRESH_TOKEN_SECONDS, exchanged at
+  POST /api/auth/refresh for a new pair; each refresh token works once
+
+Verifying an access token is one HMAC over the first two segments, a JSON
+decode and a set lookup in the revocation list, a few microseconds. The
+user record behind it comes from an LRU cache keyed by user id, so only the
+first request per user after a restart (or eviction) reads the users table.
+
+Logout and refresh revoke tokens by their jti. Revocations are kept in
+revoked_tokens until the token would have expired anyway, and every process
+loads the new ones from there at most every REVOCATION_SYNC_SECONDS.
+
+The signing key comes from MYCLEAN_SECRET_KEY. Without it a random key is
+made at startup, so tokens do not outlive the process.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from collections import OrderedDict
+
+import orjson
+from fastapi import HTTPException
+
+ACCESS_TOKEN_SECONDS = 15 * 60
+REFRESH_TOKEN_SECONDS = 14 * 24 * 3600
+USER_CACHE_SIZE = 10000
+REVOCATION_SYNC_SECONDS = 5
+
+SECRET_KEY = os.environ.get("MYCLEAN_SECRET_KEY", "").encode() or secrets.token_bytes(32)
+
+_HEADER = base64.urlsafe_b64encode(orjson.dumps({"alg": "HS256", "typ": "JWT"})).rstrip(b"=")
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+def _signature(signing_input: bytes, key: bytes) -> bytes:
+    return _b64encode(hmac.new(key, signing_input, hashlib.sha256).digest())
+
+
+def unauthorized(detail: str = "Not authenticated") -> HTTPException:
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+def issue_token(user_id: int, kind: str, lifetime: int, key: bytes = None) -> tuple:
+    """A signed token for user_id; returns (token, claims)"""
+    now = int(time.time())
+    claims = {"sub": user_id, "typ": kind, "iat": now, "exp": now + lifetime, "jti": secrets.token_urlsafe(12)}
+    signing_input = _HEADER + b"." + _b64encode(orjson.dumps(claims))
+    return (signing_input + b"." + _signature(signing_input, key or SECRET_KEY)).decode(), claims
+
+
+def decode_token(token: str, kind: str, key: bytes = None) -> dict:
+    """Claims of a valid, unexpired token of the given kind; raises 401 otherwise"""
+    try:
+        signing_input, signature = token.encode().rsplit(b".", 1)
+        header, payload = signing_input.split(b".")
+    except ValueError:
+        raise unauthorized("Invalid token")
+    if header != _HEADER or not hmac.compare_digest(signature, _signature(signing_input, key or SECRET_KEY)):
+        raise unauthorized("Invalid token")
+    claims = orjson.loads(_b64decode(payload))
+    if claims.get("typ") != kind:
+        raise unauthorized("Invalid token")
+    if claims["exp"] <= time.time():
+        raise unauthorized("Token expired")
+    return claims
+
+
+class RevocationList:
+    """jti -> expiry of revoked tokens, mirrored from the revoked_tokens table"""
+
+    def __init__(self):
+        self._expiry = {}
+        self._last_id = 0
+        self._synced_at = 0.0
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._expiry
+
+    def needs_sync(self) -> bool:
+        return time.monotonic() - self._synced_at >= REVOCATION_SYNC_SECONDS
+
+    def load(self, conn) -> list:
+        """Revocations recorded since the last load (read on a reader thread)"""
+        return conn.execute("SELECT id, jti, expires_at FROM revoked_tokens WHERE id > ? ORDER BY id",
+                            (self._last_id,)).fetchall()
+
+    def merge(self, rows: list):
+        """Apply load() results on the event loop and drop entries whose tokens have expired"""
+        now = time.time()
+        for row_id, jti, expires_at in rows:
+            self._last_id = max(self._last_id, row_id)
+            if expires_at > now:
+                self._expiry[jti] = expires_at
+        for jti in [jti for jti, expires_at in self._expiry.items() if expires_at <= now]:
+            del self._expiry[jti]
+        self._synced_at = time.monotonic()
+
+    def add(self, jti: str, expires_at: int):
+        self._expiry[jti] = expires_at
+
+
+def revoke(conn, claims_list: list):
+    """Record revocations of tokens by their claims (inside a write)"""
+    conn.executemany("INSERT OR IGNORE INTO revoked_tokens (jti, expires_at) VALUES (?, ?)",
+                     [(claims["jti"], claims["exp"]) for claims in claims_list])
+    conn.execute("DELETE FROM revoked_tokens WHERE expires_at <= ?", (int(time.time()),))
+
+
+class UserCache:
+    """LRU cache of user records keyed by id, used from the event loop"""
+
+    def __init__(self, size: int = USER_CACHE_SIZE):
+        self.size = size
+        self._users = OrderedDict()
+
+    def get(self, user_id: int):
+        user = self._users.get(user_id)
+        if user is not None:
+            self._users.move_to_end(user_id)
+        return user
+
+    def put(self, user: dict):
+        self._users[user["id"]] = user
+        self._users.move_to_end(user["id"])
+        if len(self._users) > self.size:
+            self._users.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self._users.pop(user_id, None)
+
+
+def user_record(row) -> dict:
+    """UserResponse-shaped dict for a users row"""
+    return {
+        "id": row["id"],
+        "email": row["email"],
+        "phone": row["phone"],
+        "first_name": row["first_name"],
+        "last_name": row["last_name"],
+        "is_provider": bool(row["is_provider"]),
+    }
+
+
+def fetch_user(conn, user_id: int):
+    row = conn.execute("SELECT id, email, phone, first_name, last_name, is_provider FROM users WHERE id = ?",
+                       (user_id,)).fetchone()
+    return user_record(row) if row else None
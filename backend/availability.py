@@ -0,0 +1,139 @@
+"""
+Slot availability engine for provider bookings
+
+Keeps, per provider per service date, a sorted list of the booked
+(start, end) minute intervals of every order that is not cancelled. New
+bookings never overlap, but legacy and generated orders may, so overlap
+checks do not assume it. A date
+is loaded from the orders table the first time it is needed and is then
+kept up to date incrementally by create_order() and update_order_status().
+
+All loading and mutation happens on the database writer thread, inside the
+write that inserts or updates the order, so the overlap check and the
+insert are atomic with respect to every other booking in this process.
+Readers only take the index lock to copy out a day's intervals. As the
+index is changed before the write commits, clear() is also registered with
+Database.on_rollback(): a write that fails after booking or freeing a slot
+leaves the affected days to be reloaded from the orders table.
+
+With several worker processes, each keeps its own index. clear() is
+registered with Database.on_external_change(), so a write that follows
+another worker's commit reloads the days it needs from the orders table
+before checking for overlaps.
+"""
+import bisect
+import itertools
+import threading
+
+# Bookable hours and the spacing of offered start times, in minutes after midnight
+OPENING_MINUTE = 8 * 60
+CLOSING_MINUTE = 20 * 60
+SLOT_STEP_MINUTES = 30
+
+
+def to_minutes(value: str) -> int:
+    """'HH:MM[:SS]' -> minutes after midnight"""
+    hours, minutes = value.split(":")[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def interval(start: str, end: str) -> tuple:
+    """Minute interval for stored start/end times; a booking past midnight ends at midnight"""
+    start_minute, end_minute = to_minutes(start), to_minutes(end)
+    if end_minute <= start_minute:
+        end_minute = 24 * 60
+    return start_minute, end_minute
+
+
+def _latest_ends(bookings: list) -> list:
+    """Running maximum of the bookings' ends, for _overlaps()"""
+    return list(itertools.accumulate((booking[1] for booking in bookings), max))
+
+
+def _overlaps(bookings: list, start: int, end: int, latest_ends: list = None) -> bool:
+    # Legacy and generated orders can overlap each other, so the booking that
+    # starts last before `end` need not end last: compare with the latest end
+    # of all of them, looked up in latest_ends when the caller has it
+    position = bisect.bisect_left(bookings, (end,))
+    if position == 0:
+        return False
+    if latest_ends is not None:
+        return latest_ends[position - 1] > start
+    return max(booking[1] for booking in itertools.islice(bookings, position)) > start
+
+
+class AvailabilityIndex:
+    """Booked intervals per (provider_id, service_date)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_dates = set()
+        # (provider_id, service_date) -> sorted list of (start, end, order_id)
+        self._bookings = {}
+
+    def is_loaded(self, service_date: str) -> bool:
+        return service_date in self._loaded_dates
+
+    def load_date(self, conn, service_date: str):
+        """Read one day's bookings from the orders table; run on the writer thread"""
+        if service_date in self._loaded_dates:
+            return
+        rows = conn.execute("""
+            SELECT id, provider_id, service_time_start, service_time_end
+            FROM orders
+            WHERE service_date = ? AND provider_id IS NOT NULL AND status != 'cancelled'
+        """, (service_date,)).fetchall()
+        with self._lock:
+            for row in rows:
+                start, end = interval(row["service_time_start"], row["service_time_end"])
+                bookings = self._bookings.setdefault((row["provider_id"], service_date), [])
+                bisect.insort(bookings, (start, end, row["id"]))
+            self._loaded_dates.add(service_date)
+
+    def clear(self, conn=None):
+        """Forget every loaded date; called on the writer thread"""
+        with self._lock:
+            self._loaded_dates.clear()
+            self._bookings.clear()
+
+    def conflicts(self, provider_id: int, service_date: str, start: int, end: int) -> bool:
+        """Whether [start, end) overlaps a booking of the provider that day"""
+        with self._lock:
+            return _overlaps(self._bookings.get((provider_id, service_date), []), start, end)
+
+    def booking_count(self, provider_id: int, service_date: str) -> int:
+        with self._lock:
+            return len(self._bookings.get((provider_id, service_date), []))
+
+    def add(self, provider_id: int, service_date: str, start: int, end: int, order_id: int):
+        with self._lock:
+            bisect.insort(self._bookings.setdefault((provider_id, service_date), []), (start, end, order_id))
+
+    def remove(self, provider_id: int, service_date: str, start: int, end: int, order_id: int):
+        with self._lock:
+            bookings = self._bookings.get((provider_id, service_date), [])
+            position = bisect.bisect_left(bookings, (start, end, order_id))
+            if position < len(bookings) and bookings[position] == (start, end, order_id):
+                del bookings[position]
+
+    def free_slots(self, provider_ids, service_date: str, duration_minutes: int) -> list:
+        """Start times on a loaded date at which at least one provider is free
+
+        Returns [(start_minute, end_minute, [provider_id, ...]), ...] for every
+        SLOT_STEP_MINUTES start between opening and closing time.
+        """
+        with self._lock:
+            busy = {provider_id: list(self._bookings.get((provider_id, service_date), []))
+                    for provider_id in provider_ids}
+        busy = {provider_id: (bookings, _latest_ends(bookings)) for provider_id, bookings in busy.items()}
+
+        slots = []
+        for start in range(OPENING_MINUTE, CLOSING_MINUTE - duration_minutes + 1, SLOT_STEP_MINUTES):
+            end = start + duration_minutes
+            free = []
+            for provider_id, (bookings, latest_ends) in busy.items():
+                if not _overlaps(bookings, start, end, latest_ends):
+                    free.append(provider_id)
+            if free:
+                slots.append((start, end, free))
+        return slots
@@ -0,0 +1,212 @@
+"""
+In-process read-through cache for the service catalogue
+
+Each snapshot keeps its responses encoded, and compressed per encoding, as
+PrecompressedBody objects, so hot catalogue reads do no JSON encoding or
+compression at all; a reload that finds the catalogue unchanged keeps them.
+
+Triggers on the catalogue tables bump the single row of catalogue_version
+in every transaction that changes them, whichever process or script makes
+it. Under several workers each one reads that row before serving its
+snapshot, one primary key lookup, and reloads when it has moved on, so a
+write handled by one worker is seen by all of them on their next request.
+"""
+import asyncio
+import hashlib
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+from compression import PrecompressedBody
+from serialization import duration_row_to_dict, encode, service_row_to_dict
+
+CATALOGUE_TTL_SECONDS = 60
+
+EMPTY_LIST = PrecompressedBody(b"[]")
+
+CATALOGUE_TABLES = ("service_categories", "service_types", "service_durations")
+
+# Applied by migration 11
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS catalogue_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    """,
+    "INSERT OR IGNORE INTO catalogue_version (id, version) VALUES (1, 0)",
+) + tuple(
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_catalogue_{event.lower()} AFTER {event} ON {table} BEGIN
+        UPDATE catalogue_version SET version = version + 1 WHERE id = 1;
+    END
+    """
+    for table in CATALOGUE_TABLES
+    for event in ("INSERT", "UPDATE", "DELETE")
+)
+
+
+class CatalogueSnapshot:
+    """One consistent read of service_types, service_categories and service_durations"""
+
+    def __init__(self, service_rows, duration_rows, last_modified=None, version=None):
+        # catalogue_version when read, or None
+        self.version = version
+        # Rows come ordered by is_active DESC, name ASC, i.e. the include_inactive order
+        self.all_services = [service_row_to_dict(row) for row in service_rows]
+        self.active_services = sorted(
+            (service for service in self.all_services if service["is_active"]),
+            key=lambda service: service["name"],
+        )
+
+        self.durations = {}
+        for row in duration_rows:
+            self.durations.setdefault(row["service_type_id"], []).append(duration_row_to_dict(row))
+
+        digest = hashlib.sha1(repr((self.all_services, sorted(self.durations.items()))).encode())
+        self.etag = digest.hexdigest()[:16]
+        self.last_modified = last_modified or time.time()
+        self.loaded_at = time.monotonic()
+        self._encoded = {}
+
+    def services(self, include_inactive: bool) -> list:
+        return self.all_services if include_inactive else self.active_services
+
+    def service_durations(self, service_type_id: int) -> list:
+        return self.durations.get(service_type_id, [])
+
+    def duration_minutes(self, service_type_id: int, duration_id: int = None):
+        """Booking length for a service (or one of its durations), None if unknown"""
+        if duration_id is None:
+            for service in self.all_services:
+                if service["id"] == service_type_id:
+                    return service["duration_minutes"]
+            return None
+        for duration in self.durations.get(service_type_id, []):
+            if duration["id"] == duration_id:
+                return duration["duration_minutes"]
+        return None
+
+    def services_body(self, include_inactive: bool) -> PrecompressedBody:
+        """services() encoded once per snapshot"""
+        key = ("services", include_inactive)
+        if key not in self._encoded:
+            self._encoded[key] = PrecompressedBody(encode(self.services(include_inactive)))
+        return self._encoded[key]
+
+    def durations_body(self, service_type_id: int) -> PrecompressedBody:
+        """service_durations() encoded once per snapshot"""
+        if service_type_id not in self.durations:
+            return EMPTY_LIST
+        key = ("durations", service_type_id)
+        if key not in self._encoded:
+            self._encoded[key] = PrecompressedBody(encode(self.durations[service_type_id]))
+        return self._encoded[key]
+
+    def cache_headers(self, variant: str) -> dict:
+        """Validators for one representation of the catalogue"""
+        return {
+            "ETag": f'"{self.etag}-{variant}"',
+            "Last-Modified": formatdate(self.last_modified, usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+
+    def not_modified(self, request_headers, variant: str) -> bool:
+        """Whether a conditional GET can be answered with 304"""
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            etag = f'"{self.etag}-{variant}"'
+            return any(tag.strip() in (etag, f"W/{etag}", "*") for tag in if_none_match.split(","))
+
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since is not None:
+            try:
+                return int(self.last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+def catalogue_version(conn):
+    """The catalogue_version counter; called on a reader thread"""
+    return conn.execute("SELECT version FROM catalogue_version WHERE id = 1").fetchone()[0]
+
+
+def load_catalogue(conn):
+    """Read the whole catalogue and its version; called on a reader thread"""
+    # Read first, so that a write landing between the statements leaves the
+    # snapshot looking older than it is, never newer
+    version = catalogue_version(conn)
+    service_rows = conn.execute("""
+        SELECT st.id, st.name, st.description, st.base_price, st.duration_minutes,
+               sc.name as category_name, st.is_active
+        FROM service_types st
+        JOIN service_categories sc ON st.category_id = sc.id
+        ORDER BY st.is_active DESC, st.name ASC
+    """).fetchall()
+    duration_rows = conn.execute("""
+        SELECT service_type_id, id, duration_minutes, duration_label, price_multiplier
+        FROM service_durations
+        ORDER BY service_type_id, id
+    """).fetchall()
+    return service_rows, duration_rows, version
+
+
+class CatalogueCache:
+    """Versioned catalogue snapshot with a TTL and explicit invalidation
+
+    Writers call invalidate() after committing, which bumps the version and
+    drops the snapshot. A load that raced with a write is used to answer the
+    request that triggered it but is not stored, so a stale snapshot cannot
+    outlive the invalidation.
+
+    With shared set, as under several workers, get() also compares the
+    snapshot with catalogue_version before serving it, which catches writes
+    made by other processes. Otherwise the TTL bounds their staleness.
+    """
+
+    def __init__(self, ttl: float = CATALOGUE_TTL_SECONDS, shared: bool = False):
+        self.ttl = ttl
+        self.shared = shared
+        self.version = 0
+        self._snapshot = None
+        self._lock = asyncio.Lock()
+
+    def _fresh(self, snapshot) -> bool:
+        return snapshot is not None and time.monotonic() - snapshot.loaded_at < self.ttl
+
+    async def get(self, db) -> CatalogueSnapshot:
+        """Return the current snapshot, loading it through `db` on a miss"""
+        snapshot = self._snapshot
+        if self.shared and snapshot is not None:
+            if await db.read(catalogue_version) != snapshot.version:
+                # Another process changed the catalogue; unless a reload got
+                # in meanwhile, this is the same as a write of our own
+                if self._snapshot is snapshot:
+                    self.invalidate()
+                snapshot = None
+        if self._fresh(snapshot):
+            return snapshot
+
+        async with self._lock:
+            # Another request may have reloaded while we waited
+            snapshot = self._snapshot
+            if self._fresh(snapshot):
+                return snapshot
+
+            version = self.version
+            service_rows, duration_rows, db_version = await db.read(load_catalogue)
+            previous = snapshot
+            snapshot = CatalogueSnapshot(service_rows, duration_rows, version=db_version)
+            if previous is not None and previous.etag == snapshot.etag:
+                # Unchanged since the last load: keep the validators stable, and
+                # the encoded bodies rather than compressing them again
+                snapshot.last_modified = previous.last_modified
+                snapshot._encoded = previous._encoded
+            if version == self.version:
+                self._snapshot = snapshot
+            return snapshot
+
+    def invalidate(self):
+        """Drop the snapshot after a catalogue write"""
+        self.version += 1
+        self._snapshot = None
@@ -0,0 +1,189 @@
+"""
+Negotiated response compression (zstd, br, gzip)
+
+CompressionMiddleware is a plain ASGI middleware that compresses JSON and
+text responses of at least COMPRESSION_MIN_BYTES with the best encoding the
+client's Accept-Encoding allows, preferring zstd, then br, then gzip among
+those available. gzip comes with the standard library; br and zstd are used
+when the brotli and zstandard packages are installed. Smaller bodies go out
+as they are: a few hundred bytes fit the first packets anyway and are not
+worth the CPU.
+
+Per-request compression uses fast levels (DYNAMIC_LEVELS), as it runs on
+the event loop for every order list page. Bodies that are built once and
+served many times, like the catalogue, are wrapped in a PrecompressedBody,
+which compresses each encoding once at STATIC_LEVELS (slow, smallest) and
+keeps the result; the middleware leaves responses that already have a
+Content-Encoding alone.
+
+Compressed responses carry Vary: Accept-Encoding, and a strong ETag becomes
+weak, since the bytes differ per encoding while the content does not. Time
+spent compressing counts as serialization time in /metrics. Streamed
+responses (the order event stream) are never compressed.
+"""
+import gzip
+import os
+import time
+from functools import lru_cache
+
+from fastapi import Response
+from starlette.datastructures import Headers, MutableHeaders
+
+from metrics import record_serialization_time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_MIN_BYTES = int(os.environ.get("MYCLEAN_COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/csv")
+
+# Levels for per-request compression, about as fast as encoding the JSON
+DYNAMIC_LEVELS = {"zstd": 3, "br": 4, "gzip": 5}
+# Levels for bodies compressed once and served until the data changes
+STATIC_LEVELS = {"zstd": 19, "br": 11, "gzip": 9}
+
+
+def _compressors() -> dict:
+    """Encoding -> compress(body, level), in order of preference"""
+    compressors = {}
+    if zstandard is not None:
+        compressors["zstd"] = lambda body, level: zstandard.ZstdCompressor(level=level).compress(body)
+    if brotli is not None:
+        compressors["br"] = lambda body, level: brotli.compress(body, quality=level)
+    compressors["gzip"] = lambda body, level: gzip.compress(body, level, mtime=0)
+    return compressors
+
+
+COMPRESSORS = _compressors()
+
+
+def compress(body: bytes, encoding: str, levels: dict = DYNAMIC_LEVELS) -> bytes:
+    started = time.perf_counter()
+    compressed = COMPRESSORS[encoding](body, levels[encoding])
+    record_serialization_time(time.perf_counter() - started)
+    return compressed
+
+
+@lru_cache(maxsize=256)
+def negotiate(accept_encoding: str):
+    """The encoding to use for an Accept-Encoding value, None for identity
+
+    Takes the acceptable (q > 0) encoding with the highest q, COMPRESSORS
+    order breaking ties; "*" stands for any encoding not listed.
+    """
+    weights = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                continue
+        weights[name.strip()] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in COMPRESSORS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def _compressed_headers(headers: MutableHeaders, encoding: str, length: int):
+    headers["Content-Encoding"] = encoding
+    headers["Content-Length"] = str(length)
+    headers.add_vary_header("Accept-Encoding")
+    etag = headers.get("etag")
+    if etag is not None and not etag.startswith("W/"):
+        headers["ETag"] = "W/" + etag
+
+
+class PrecompressedBody:
+    """A response body whose compressed forms are made once, on first use
+
+    As the cost is paid once, bodies below COMPRESSION_MIN_BYTES are
+    compressed too; an encoding is only used if it makes the body smaller.
+    """
+
+    def __init__(self, body: bytes, media_type: str = "application/json"):
+        self.body = body
+        self.media_type = media_type
+        # encoding -> compressed body, or None where it would not be smaller
+        self._compressed = {}
+
+    def compressed(self, encoding: str):
+        if encoding not in self._compressed:
+            compressed = compress(self.body, encoding, STATIC_LEVELS)
+            self._compressed[encoding] = compressed if len(compressed) < len(self.body) else None
+        return self._compressed[encoding]
+
+    def response(self, request_headers, headers: dict = None) -> Response:
+        """The body in the encoding request_headers accept best"""
+        response = Response(content=self.body, headers=headers, media_type=self.media_type)
+        encoding = negotiate(request_headers.get("accept-encoding", ""))
+        compressed = self.compressed(encoding) if encoding is not None else None
+        if compressed is not None:
+            response.body = compressed
+            _compressed_headers(response.headers, encoding, len(compressed))
+        else:
+            response.headers.add_vary_header("Accept-Encoding")
+        return response
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing whole (non-streamed) compressible responses"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if "content-encoding" in headers or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Held back until the body shows whether to compress
+                    start = message
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            body = compress(body, encoding)
+            _compressed_headers(MutableHeaders(scope=start), encoding, len(body))
+            passthrough = True
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
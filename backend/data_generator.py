@@ -0,0 +1,423 @@
+"""
+Synthetic data generator for profiling MyClean against production-sized data
+
+Usage: python data_generator.py [--db myclean.db] [--fresh] [--users 10000] [--orders 1000000]
+                                [--seed 42] [--days 365] [--end YYYY-MM-DD] [--growth 2.0]
+                                [--lead-days 21] [--status-weights pending=10,confirmed=15,...]
+                                [--service-weights 1=3,4=2] [--no-history]
+
+Adds users, orders and their order_status_history to the database. Output
+depends only on the options and on the rows already present, so the same
+command against the same starting database always produces the same data.
+
+- Users sign up uniformly over the window; a share of them are providers.
+  All generated users share one password (GENERATED_PASSWORD), since a
+  separate scrypt hash per user would take longer than the whole load.
+- Order creation times follow --growth (volume multiplier per year, 1 means
+  uniform). Each order belongs to a customer who had signed up by then.
+- Service types follow --service-weights, statuses follow --status-weights.
+  Orders whose service date is after --end cannot be in progress or
+  completed, and are generated as confirmed instead.
+- Within one run providers are never double-booked; if no free provider
+  turns up in a few tries the order is left unassigned.
+- Order numbers use the real layout with the order id in the pid/sequence
+  bits, so generated numbers never collide with each other.
+- New ids continue from sqlite_sequence, so ids of orders moved to
+  orders_archive are never handed out again.
+
+Everything is written in one transaction: users and orders with
+executemany batches, status history, the analytics rollups, the order
+search index and order_view with a single INSERT ... SELECT each over the
+new orders. During the load syncs are off and, unless the database is
+already in WAL mode, the journal is kept in memory. When the load at least
+doubles the orders table, the secondary indexes of users, orders,
+order_status_history and order_view are dropped and rebuilt before the
+commit.
+"""
+import argparse
+import bisect
+import math
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+
+import analytics
+from availability import CLOSING_MINUTE, OPENING_MINUTE, SLOT_STEP_MINUTES
+from order_numbers import ORDER_EPOCH_MS, SEQUENCE_BITS, compose_order_number
+import order_view
+from passwords import hash_password
+import search
+
+GENERATED_PASSWORD = "password123"
+BATCH_SIZE = 50000
+YEAR_SECONDS = 365 * 86400
+PROVIDER_TRIES = 3
+
+DEFAULT_STATUS_WEIGHTS = {"pending": 10, "confirmed": 15, "in_progress": 5, "completed": 60, "cancelled": 10}
+
+FIRST_NAMES = ["Olivia", "Jack", "Charlotte", "Noah", "Amelia", "William", "Isla", "Oliver", "Mia", "Leo",
+               "Ava", "Henry", "Grace", "Thomas", "Chloe", "Lucas", "Zoe", "James", "Ruby", "Ethan"]
+LAST_NAMES = ["Smith", "Jones", "Williams", "Brown", "Wilson", "Taylor", "Nguyen", "Johnson", "Martin", "White",
+              "Anderson", "Walker", "Thompson", "Harris", "Lee", "Ryan", "Robinson", "Kelly", "King", "Chen"]
+CUSTOMER_NOTES = ["Please handle with care", "Gift wrapping requested", "Call on arrival", "Side gate is open",
+                  "Pets at home", "Leave at reception"]
+
+BULK_LOAD_PRAGMAS = [
+    "PRAGMA synchronous=OFF",
+    "PRAGMA cache_size=-262144",
+    "PRAGMA temp_store=MEMORY",
+]
+LOADED_TABLES = ("users", "orders", "order_status_history", "order_view")
+# Per-row triggers replaced by one INSERT ... SELECT over the new rows
+SUSPENDED_TRIGGERS = ("order_search_insert",)
+
+# "HH:MM" for every minute of the day
+CLOCK = [f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(24 * 60)]
+UNIX_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def parse_weights(text: str, key=str) -> dict:
+    """"a=1,b=2" -> {"a": 1.0, "b": 2.0}"""
+    weights = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        try:
+            weights[key(name.strip())] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid weight: {item!r}")
+    return weights
+
+
+class WeightedChoice:
+    """Draws keys with probability proportional to their weights"""
+
+    def __init__(self, weights: dict):
+        self.keys = [key for key, weight in weights.items() if weight > 0]
+        if not self.keys:
+            raise ValueError("at least one weight must be positive")
+        self.cumulative = []
+        total = 0.0
+        for key in self.keys:
+            total += weights[key]
+            self.cumulative.append(total)
+        self.total = total
+
+    def draw(self, rng: random.Random):
+        return self.keys[bisect.bisect(self.cumulative, rng.random() * self.total)]
+
+
+def _day_string(day: int, cache: dict = {}) -> str:
+    text = cache.get(day)
+    if text is None:
+        text = cache[day] = date.fromordinal(day + UNIX_EPOCH_ORDINAL).isoformat()
+    return text
+
+
+def timestamp(seconds: float) -> str:
+    """SQLite CURRENT_TIMESTAMP format (UTC) for epoch seconds"""
+    day, second = divmod(int(seconds), 86400)
+    return f"{_day_string(day)} {CLOCK[second // 60]}:{second % 60:02d}"
+
+
+@contextmanager
+def bulk_load(conn, drop_indexes: bool):
+    """One transaction with relaxed durability, optionally rebuilding secondary indexes at the end
+
+    Rebuilding pays off when the load is about as big as what is already
+    there. SUSPENDED_TRIGGERS are dropped for the load and recreated before
+    the commit; the caller does their work in bulk. conn must be in
+    autocommit mode (isolation_level=None).
+    """
+    # A database already in WAL mode may be open in a running server, which
+    # keeps it from switching journal modes; WAL appends are cheap anyway
+    if conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+        conn.execute("PRAGMA journal_mode=MEMORY")
+    for pragma in BULK_LOAD_PRAGMAS:
+        conn.execute(pragma)
+    indexes = []
+    if drop_indexes:
+        indexes = conn.execute(f"""
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({", ".join("?" * len(LOADED_TABLES))})
+        """, LOADED_TABLES).fetchall()
+    triggers = conn.execute(f"""
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'trigger' AND name IN ({", ".join("?" * len(SUSPENDED_TRIGGERS))})
+    """, SUSPENDED_TRIGGERS).fetchall()
+    conn.execute("BEGIN")
+    try:
+        for name, _ in indexes:
+            conn.execute(f"DROP INDEX {name}")
+        for name, _ in triggers:
+            conn.execute(f"DROP TRIGGER {name}")
+        yield
+        for _, sql in indexes + triggers:
+            conn.execute(sql)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+
+
+def next_id(conn, table: str) -> int:
+    """The id an AUTOINCREMENT table would assign next
+
+    Unlike MAX(id) + 1, this counts ids whose rows have since been deleted
+    or moved to an archive table.
+    """
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    return (row[0] if row else 0) + 1
+
+
+def generate_users(conn, rng: random.Random, count: int, start: float, end: float, provider_share: float):
+    """Insert count users who signed up between start and end (epoch seconds)"""
+    if count <= 0:
+        return
+    first_id = next_id(conn, "users")
+    password_hash = hash_password(GENERATED_PASSWORD)
+    signups = sorted(rng.uniform(start, end) for _ in range(count))
+
+    rows = []
+    for offset, signed_up in enumerate(signups):
+        user_id = first_id + offset
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        created_at = timestamp(signed_up)
+        rows.append((user_id, f"{first_name}.{last_name}.{user_id}@example.com".lower(), f"04{user_id:08d}",
+                     password_hash, first_name, last_name, rng.random() < provider_share, created_at, created_at))
+        if len(rows) == BATCH_SIZE:
+            _insert_users(conn, rows)
+            rows = []
+    _insert_users(conn, rows)
+
+
+def _insert_users(conn, rows):
+    conn.executemany("""
+        INSERT INTO users (id, email, phone, password_hash, first_name, last_name, is_provider, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+
+
+def creation_times(rng: random.Random, count: int, start: float, end: float, growth: float) -> list:
+    """Sorted epoch seconds in [start, end] whose density grows by `growth` per year"""
+    span = end - start
+    rate = math.log(growth) / YEAR_SECONDS if growth > 0 else 0.0
+    if abs(rate * span) < 1e-9:
+        return sorted(start + rng.random() * span for _ in range(count))
+    # Inverse CDF of an exponential density on [0, span]
+    scale = math.expm1(rate * span)
+    return sorted(start + math.log1p(rng.random() * scale) / rate for _ in range(count))
+
+
+def generate_orders(conn, rng: random.Random, count: int, start: float, end: float, growth: float,
+                    lead_days: int, statuses: WeightedChoice, services: WeightedChoice) -> int:
+    """Insert count orders created between start and end; returns the first new id"""
+    users = conn.execute("SELECT id, created_at, is_provider, is_active FROM users ORDER BY created_at, id").fetchall()
+    if not users:
+        raise ValueError("no users to place orders for")
+    customer_ids = [row[0] for row in users]
+    signup_times = [datetime.fromisoformat(row[1]).replace(tzinfo=timezone.utc).timestamp() for row in users]
+    provider_ids = [row[0] for row in users if row[2] and row[3]]
+
+    durations = {}
+    for service_type_id, duration_id, minutes, base_price, multiplier in conn.execute("""
+        SELECT sd.service_type_id, sd.id, sd.duration_minutes, st.base_price, sd.price_multiplier
+        FROM service_durations sd JOIN service_types st ON st.id = sd.service_type_id
+    """):
+        # Start minutes that let the service finish by closing time
+        starts = list(range(OPENING_MINUTE, CLOSING_MINUTE - minutes + 1, SLOT_STEP_MINUTES))
+        durations.setdefault(service_type_id, []).append(
+            (duration_id, minutes, base_price, round(base_price * multiplier, 2), starts))
+    missing = [service_type_id for service_type_id in services.keys if service_type_id not in durations]
+    if missing:
+        raise ValueError(f"service types without durations: {missing}")
+
+    first_id = next_id(conn, "orders")
+    last_day = int(end) // 86400
+    sequence_mask = (1 << SEQUENCE_BITS) - 1
+    # provider id -> day -> bitmask of booked SLOT_STEP_MINUTES cells
+    bookings = {provider_id: {} for provider_id in provider_ids}
+    uniform = rng.random
+
+    rows = []
+    for offset, created in enumerate(creation_times(rng, count, start, end, growth)):
+        order_id = first_id + offset
+        signed_up = bisect.bisect_right(signup_times, created)
+        customer_id = customer_ids[int(uniform() * signed_up)] if signed_up else customer_ids[0]
+        service_type_id = services.draw(rng)
+        options = durations[service_type_id]
+        duration_id, minutes, base_price, total_price, starts = options[int(uniform() * len(options))]
+        day = int(created) // 86400 + 1 + int(uniform() * lead_days)
+        start_minute = starts[int(uniform() * len(starts))]
+
+        status = statuses.draw(rng)
+        if day > last_day and (status == "in_progress" or status == "completed"):
+            status = "confirmed"
+        # Cancelled orders were confirmed first about half of the time
+        was_confirmed = status != "pending" and (status != "cancelled" or uniform() < 0.5)
+
+        provider_id = None
+        if was_confirmed and provider_ids:
+            cells = ((1 << (minutes // SLOT_STEP_MINUTES)) - 1) << (start_minute // SLOT_STEP_MINUTES)
+            for _ in range(PROVIDER_TRIES):
+                candidate = provider_ids[int(uniform() * len(provider_ids))]
+                booked = bookings[candidate].get(day, 0)
+                if not booked & cells:
+                    bookings[candidate][day] = booked | cells
+                    provider_id = candidate
+                    break
+
+        updated = created
+        confirmed_at = completed_at = None
+        if was_confirmed:
+            updated = created + 300 + uniform() * 86100
+            confirmed_at = timestamp(updated)
+        service_start = day * 86400 + start_minute * 60
+        if status == "in_progress":
+            updated = max(updated, service_start)
+        elif status == "completed":
+            updated = service_start + minutes * 60
+            completed_at = timestamp(updated)
+        elif status == "cancelled":
+            updated += uniform() * max(0, min(service_start, end) - updated)
+
+        created_at = timestamp(created)
+        rows.append((
+            order_id,
+            compose_order_number(max(0, int(created * 1000) - ORDER_EPOCH_MS),
+                                 order_id >> SEQUENCE_BITS, order_id & sequence_mask),
+            customer_id, provider_id, service_type_id, duration_id, _day_string(day),
+            f"{CLOCK[start_minute]}:00", f"{CLOCK[(start_minute + minutes) % 1440]}:00",
+            base_price, total_price, status,
+            CUSTOMER_NOTES[int(uniform() * len(CUSTOMER_NOTES))] if uniform() < 0.3 else None,
+            created_at, timestamp(updated) if updated != created else created_at, confirmed_at, completed_at,
+        ))
+        if len(rows) == BATCH_SIZE:
+            _insert_orders(conn, rows)
+            rows = []
+    _insert_orders(conn, rows)
+    return first_id
+
+
+def _insert_orders(conn, rows):
+    conn.executemany("""
+        INSERT INTO orders (id, order_number, customer_id, provider_id, service_type_id, service_duration_id,
+                            service_date, service_time_start, service_time_end, base_price, total_price, status,
+                            customer_notes, created_at, updated_at, confirmed_at, completed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+
+
+def derive_status_history(conn, first_id: int):
+    """Write the transitions each order from first_id on went through
+
+    Everything needed is on the order row already, so this runs as one
+    INSERT ... SELECT inside SQLite rather than as Python tuples. Providers
+    record their own transitions; customers cancel and, for unassigned
+    orders, stand in for the provider.
+    """
+    conn.execute("""
+        INSERT INTO order_status_history (order_id, old_status, new_status, changed_by, created_at)
+        SELECT order_id, old_status, new_status, changed_by, changed_at FROM (
+            SELECT id AS order_id, 'pending' AS old_status, 'confirmed' AS new_status,
+                   COALESCE(provider_id, customer_id) AS changed_by, confirmed_at AS changed_at
+            FROM orders WHERE id >= ? AND confirmed_at IS NOT NULL
+            UNION ALL
+            SELECT id, 'confirmed', 'in_progress', COALESCE(provider_id, customer_id),
+                   MAX(confirmed_at, service_date || ' ' || service_time_start)
+            FROM orders WHERE id >= ? AND status IN ('in_progress', 'completed')
+            UNION ALL
+            SELECT id, 'in_progress', 'completed', COALESCE(provider_id, customer_id), completed_at
+            FROM orders WHERE id >= ? AND status = 'completed'
+            UNION ALL
+            SELECT id, CASE WHEN confirmed_at IS NULL THEN 'pending' ELSE 'confirmed' END, 'cancelled',
+                   customer_id, updated_at
+            FROM orders WHERE id >= ? AND status = 'cancelled'
+        )
+        ORDER BY order_id, changed_at
+    """, (first_id,) * 4)
+
+
+def generate(db_path: str = "myclean.db", users: int = 10000, orders: int = 100000, seed: int = 42,
+             days: int = 365, end: date = None, growth: float = 2.0, lead_days: int = 21,
+             provider_share: float = 0.02, status_weights: dict = None, service_weights: dict = None,
+             history: bool = True):
+    """Add users and orders (with history) created in the `days` days up to `end`"""
+    end = end or datetime.now(timezone.utc).date()
+    end_of_day = datetime.combine(end, datetime.min.time(), timezone.utc).timestamp() + 86399
+    start_seconds = end_of_day + 1 - days * 86400
+    # Nothing is created in the future
+    end_seconds = min(end_of_day, time.time())
+    if start_seconds * 1000 < ORDER_EPOCH_MS:
+        raise ValueError("order numbers cannot encode dates before 2025-01-01; use fewer --days or a later --end")
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        if service_weights is None:
+            service_weights = {row[0]: 1.0 for row in conn.execute("""
+                SELECT id FROM service_types st
+                WHERE is_active = 1 AND EXISTS (SELECT 1 FROM service_durations WHERE service_type_id = st.id)
+            """)}
+        statuses = WeightedChoice(status_weights or DEFAULT_STATUS_WEIGHTS)
+        services = WeightedChoice(service_weights)
+        existing = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+        with bulk_load(conn, drop_indexes=orders >= existing):
+            generate_users(conn, rng, users, start_seconds, end_seconds, provider_share)
+            if orders > 0:
+                first_id = generate_orders(conn, rng, orders, start_seconds, end_seconds, growth, lead_days,
+                                           statuses, services)
+                if history:
+                    derive_status_history(conn, first_id)
+                analytics.add_orders(conn, first_id)
+                search.add_orders(conn, first_id)
+                order_view.add_orders(conn, first_id)
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic MyClean users, orders and status history")
+    parser.add_argument("--db", default="myclean.db")
+    parser.add_argument("--fresh", action="store_true", help="delete the database and recreate it from the migrations first")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=365, help="length of the window orders are created in")
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="last day of the window (default: today)")
+    parser.add_argument("--growth", type=float, default=2.0, help="order volume multiplier per year")
+    parser.add_argument("--lead-days", type=int, default=21, help="maximum days between ordering and service")
+    parser.add_argument("--provider-share", type=float, default=0.02, help="share of new users who are providers")
+    parser.add_argument("--status-weights", type=parse_weights, default=None,
+                        help="e.g. pending=10,confirmed=15,in_progress=5,completed=60,cancelled=10")
+    parser.add_argument("--service-weights", type=lambda text: parse_weights(text, int), default=None,
+                        help="service_type_id=weight, e.g. 1=3,4=2 (default: active services equally)")
+    parser.add_argument("--no-history", dest="history", action="store_false",
+                        help="skip order_status_history rows")
+    args = parser.parse_args()
+
+    if args.status_weights and set(args.status_weights) - set(DEFAULT_STATUS_WEIGHTS):
+        parser.error(f"statuses must be among {', '.join(DEFAULT_STATUS_WEIGHTS)}")
+
+    if args.fresh:
+        from database_setup import create_database
+        create_database(args.db, reset=True)
+
+    started = time.perf_counter()
+    try:
+        generate(args.db, users=args.users, orders=args.orders, seed=args.seed, days=args.days, end=args.end,
+                 growth=args.growth, lead_days=args.lead_days, provider_share=args.provider_share,
+                 status_weights=args.status_weights, service_weights=args.service_weights, history=args.history)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Generated {args.users} users and {args.orders} orders in {args.db} "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
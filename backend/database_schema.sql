@@ -1,8 +1,11 @@
 -- MyClean Service Booking Application Database Schema
+--
+-- Baseline schema, applied by migrations.py as migration 1. Do not edit it:
+-- schema and index changes go into a new migration in migrations.py.
 
 -- Users table for authentication and user management
 CREATE TABLE users (
-    id SERIAL PRIMARY KEY,
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
     email VARCHAR(255) UNIQUE NOT NULL,
     phone VARCHAR(20) UNIQUE,
     password_hash VARCHAR(255) NOT NULL,
@@ -10,44 +13,44 @@ CREATE TABLE users (
     last_name VARCHAR(100),
     is_active BOOLEAN DEFAULT TRUE,
     is_provider BOOLEAN DEFAULT FALSE,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Service categories (Flowers, Cleaning, etc.)
 CREATE TABLE service_categories (
-    id SERIAL PRIMARY KEY,
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
     name VARCHAR(100) NOT NULL,
     description TEXT,
     is_active BOOLEAN DEFAULT TRUE,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Service types within categories
 CREATE TABLE service_types (
-    id SERIAL PRIMARY KEY,
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
     category_id INTEGER REFERENCES service_categories(id),
     name VARCHAR(100) NOT NULL,
     description TEXT,
     base_price DECIMAL(10,2),
     duration_minutes INTEGER,
     is_active BOOLEAN DEFAULT TRUE,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Duration options for services
 CREATE TABLE service_durations (
-    id SERIAL PRIMARY KEY,
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
     service_type_id INTEGER REFERENCES service_types(id),
     duration_minutes INTEGER NOT NULL,
     duration_label VARCHAR(50) NOT NULL, -- e.g., "1 hour", "2 hours"
     price_multiplier DECIMAL(3,2) DEFAULT 1.00,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Orders/Bookings
 CREATE TABLE orders (
-    id SERIAL PRIMARY KEY,
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
     order_number VARCHAR(20) UNIQUE NOT NULL,
     customer_id INTEGER REFERENCES users(id),
     provider_id INTEGER REFERENCES users(id),
@@ -71,33 +74,33 @@ CREATE TABLE orders (
     provider_notes TEXT,
 
     -- Timestamps
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     confirmed_at TIMESTAMP,
     completed_at TIMESTAMP
 );
 
 -- Order status history for tracking changes
 CREATE TABLE order_status_history (
-    id SERIAL PRIMARY KEY,
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
     order_id INTEGER REFERENCES orders(id),
     old_status VARCHAR(20),
     new_status VARCHAR(20),
     changed_by INTEGER REFERENCES users(id),
     notes TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Company/Business information
 CREATE TABLE business_info (
-    id SERIAL PRIMARY KEY,
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
     name VARCHAR(100) NOT NULL,
     address TEXT,
     phone VARCHAR(20),
     email VARCHAR(255),
     description TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Create indexes for better performance
@@ -1,54 +1,40 @@
 """
 Database setup and initialization for MyClean application
 """
-import sqlite3
+import argparse
 import os
+import sqlite3
 from datetime import datetime
-import hashlib
-
-def create_database():
-    """Create the SQLite database and tables"""
-    db_path = "myclean.db"
 
-    # Remove existing database if it exists
-    if os.path.exists(db_path):
-        os.remove(db_path)
-
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+from data_generator import generate
+from migrations import migrate
+from passwords import hash_password
 
-    # Read and execute the schema
-    with open('database_schema.sql', 'r') as f:
-        schema_sql = f.read()
+def create_database(db_path="myclean.db", reset=False):
+    """Create the SQLite database, or bring an existing one up to the current schema
 
-    # SQLite doesn't support SERIAL, so we need to modify the schema
-    schema_sql = schema_sql.replace('SERIAL PRIMARY KEY', 'INTEGER PRIMARY KEY AUTOINCREMENT')
-    schema_sql = schema_sql.replace('TIMESTAMP DEFAULT CURRENT_TIMESTAMP', 'DATETIME DEFAULT CURRENT_TIMESTAMP')
-
-    # Execute schema in parts (SQLite doesn't handle multiple statements well)
-    statements = [stmt.strip() for stmt in schema_sql.split(';') if stmt.strip()]
-
-    for statement in statements:
-        if statement:
-            try:
-                cursor.execute(statement)
-            except sqlite3.Error as e:
-                print(f"Error executing statement: {e}")
-                print(f"Statement: {statement[:100]}...")
-
-    conn.commit()
-    conn.close()
-    print(f"Database created successfully at {db_path}")
-
-def hash_password(password: str) -> str:
-    """Hash a password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    With reset=True the existing database is deleted first, data included.
+    """
+    if reset:
+        for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+    applied = migrate(db_path)
+    print(f"Database at {db_path} is up to date ({len(applied)} migrations applied)")
 
 def seed_test_data():
-    """Add some test data to the database"""
+    """Add the test accounts plus a small generated data set
+
+    For production-sized data run data_generator.py instead.
+    """
     conn = sqlite3.connect("myclean.db")
     cursor = conn.cursor()
 
+    if cursor.execute("SELECT 1 FROM users WHERE email = 'customer@test.com'").fetchone():
+        conn.close()
+        print("Test data already present")
+        return
+
     # Create test users
     test_users = [
         ('customer@test.com', '1234567890', hash_password('password123'), 'John', 'Doe', True, False),
@@ -61,24 +47,14 @@ def seed_test_data():
         VALUES (?, ?, ?, ?, ?, ?, ?)
     ''', test_users)
 
-    # Create test orders
-    test_orders = [
-        ('XXX123', 1, 2, 1, 1, '2025-10-05', '11:00:00', '12:00:00', 21.00, 21.00, 'completed', 'Please handle with care', 'Delivered successfully'),
-        ('XXX124', 1, 2, 1, 1, '2025-10-06', '14:00:00', '15:00:00', 21.00, 21.00, 'in_progress', 'Standard delivery', ''),
-        ('XXX125', 1, 2, 2, 2, '2025-10-07', '10:00:00', '12:00:00', 25.00, 37.50, 'pending', 'Gift wrapping requested', '')
-    ]
-
-    cursor.executemany('''
-        INSERT INTO orders (order_number, customer_id, provider_id, service_type_id, service_duration_id,
-                          service_date, service_time_start, service_time_end, base_price, total_price,
-                          status, customer_notes, provider_notes)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', test_orders)
-
     conn.commit()
     conn.close()
+    generate("myclean.db", users=50, orders=500, days=90)
     print("Test data seeded successfully")
 
 if __name__ == "__main__":
-    create_database()
+    parser = argparse.ArgumentParser(description="Create or upgrade myclean.db and add test data")
+    parser.add_argument("--reset", action="store_true", help="delete the existing database first")
+    args = parser.parse_args()
+    create_database(reset=args.reset)
     seed_test_data()
\ No newline at end of file
@@ -0,0 +1,235 @@
+"""
+SQLite connection pool and async data-access layer for the MyClean backend
+
+Settings come from the environment, so that every worker process started
+by `python main.py --workers N` shares them:
+
+- MYCLEAN_DB_PATH         database file (default myclean.db)
+- MYCLEAN_READ_POOL_SIZE  read connections and threads per process (default 8)
+"""
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from metrics import record_db_time
+import query_log
+
+DB_PATH = os.environ.get("MYCLEAN_DB_PATH", "myclean.db")
+POOL_SIZE = int(os.environ.get("MYCLEAN_READ_POOL_SIZE", "8"))
+BUSY_TIMEOUT_MS = 5000
+
+# Applied to the writer connection; WAL persists in the file, so readers get it too
+WRITER_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",         # readers no longer block on writers
+    "PRAGMA synchronous = NORMAL",       # safe with WAL, avoids an fsync per commit
+)
+
+# Applied to every connection when it is opened
+PRAGMAS = (
+    "PRAGMA mmap_size = 268435456",      # 256 MB of memory-mapped reads
+    "PRAGMA cache_size = -16000",        # 16 MB page cache per connection
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+)
+
+
+def connect(db_path: str = DB_PATH, read_only: bool = False) -> sqlite3.Connection:
+    """Open a connection with the pool's PRAGMAs applied
+
+    A read-only connection is opened with mode=ro, so SQLite itself rejects
+    any write attempted through it. Statements are profiled into
+    query_log.query_stats unless that is disabled.
+    """
+    factory = query_log.ProfiledConnection if query_log.ENABLED else sqlite3.Connection
+    if read_only:
+        uri = f"file:{quote(os.path.abspath(db_path))}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                               factory=factory)
+    else:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                               factory=factory)
+        for pragma in WRITER_PRAGMAS:
+            conn.execute(pragma)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    # Load the schema now so the first request does not pay for it
+    conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+    return conn
+
+
+class ConnectionPool:
+    """Fixed-size pool of long-lived, pre-warmed SQLite connections"""
+
+    def __init__(self, db_path: str = DB_PATH, size: int = POOL_SIZE, read_only: bool = False):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            self._idle.put(connect(db_path, read_only))
+
+    def acquire(self, timeout: float = None) -> sqlite3.Connection:
+        """Take a connection, waiting up to `timeout` seconds for one to be returned"""
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No database connection available after {timeout}s")
+
+    def release(self, conn: sqlite3.Connection):
+        """Give a connection back, rolling back anything left uncommitted"""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class Database:
+    """Async access to SQLite that keeps blocking calls off the event loop
+
+    Reads run on a bounded thread pool, one read-only pooled connection per
+    thread, so they proceed concurrently under WAL. Writes are queued onto a
+    single writer thread with its own connection, which serializes them
+    within the process. Each `fn` is called as fn(conn, *args) and may raise
+    HTTPException; a write is committed when fn returns and rolled back if it
+    raises.
+
+    Across processes, each write is one BEGIN IMMEDIATE transaction, so
+    SQLite's write lock serializes the writers of all workers and fn sees
+    every commit made before it. Callbacks registered with
+    on_external_change() run inside the write when PRAGMA data_version shows
+    that another connection has committed since the previous write, so
+    in-process caches can drop what may be stale before fn relies on them.
+    Callbacks registered with on_rollback() run after a write is rolled
+    back, for caches fn updated along with its uncommitted changes.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, readers: int = POOL_SIZE):
+        self.db_path = db_path
+        # The writer opens first: it is the connection that puts the file in WAL mode
+        self._writer = connect(db_path)
+        self._data_version = self._writer.execute("PRAGMA data_version").fetchone()[0]
+        self._external_change_callbacks = []
+        self._rollback_callbacks = []
+        # Reads queued or running, the queue depth admission.py sheds load on
+        self.pending_reads = 0
+        self.pool = ConnectionPool(db_path, readers, read_only=True)
+        self._read_executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-read")
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+    def on_external_change(self, callback):
+        """Call callback(conn) on the writer thread after another connection commits"""
+        self._external_change_callbacks.append(callback)
+
+    def on_rollback(self, callback):
+        """Call callback(conn) on the writer thread after a write is rolled back"""
+        self._rollback_callbacks.append(callback)
+
+    def set_trace_callback(self, callback):
+        """Pass every statement run on any of the connections to callback(sql); None stops it"""
+        readers = [self.pool.acquire() for _ in range(self.pool.size)]
+        for conn in readers + [self._writer]:
+            conn.set_trace_callback(callback)
+        for conn in readers:
+            self.pool.release(conn)
+
+    async def sync(self):
+        """Run the on_external_change() callbacks now if another connection has committed
+
+        Writes do this themselves; it is for readers of in-process state that
+        must not lag behind writes made by other workers.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._write_executor, self._check_data_version)
+
+    async def read(self, fn, *args):
+        """Run fn(conn, *args) on a reader thread"""
+        loop = asyncio.get_running_loop()
+        self.pending_reads += 1
+        try:
+            result, elapsed = await loop.run_in_executor(self._read_executor, self._run_read, fn, args)
+        finally:
+            self.pending_reads -= 1
+        record_db_time(elapsed)
+        return result
+
+    async def write(self, fn, *args):
+        """Run fn(conn, *args) in a transaction on the writer thread"""
+        loop = asyncio.get_running_loop()
+        result, elapsed = await loop.run_in_executor(self._write_executor, self._run_write, fn, args)
+        record_db_time(elapsed)
+        return result
+
+    # Both return (result, seconds spent) so the caller can attribute the time to its request
+
+    def _run_read(self, fn, args):
+        started = time.perf_counter()
+        conn = self.pool.acquire()
+        try:
+            return fn(conn, *args), time.perf_counter() - started
+        finally:
+            self.pool.release(conn)
+
+    def _check_data_version(self):
+        conn = self._writer
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._data_version = data_version
+            for callback in self._external_change_callbacks:
+                callback(conn)
+
+    def _run_write(self, fn, args):
+        started = time.perf_counter()
+        conn = self._writer
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._check_data_version()
+            result = fn(conn, *args)
+            conn.commit()
+            return result, time.perf_counter() - started
+        except BaseException:
+            conn.rollback()
+            for callback in self._rollback_callbacks:
+                callback(conn)
+            raise
+
+    def close(self):
+        """Wait for queued work to finish, then close every connection"""
+        self._write_executor.shutdown(wait=True)
+        self._read_executor.shutdown(wait=True)
+        self._writer.close()
+        self.pool.close()
+
+
+_database = None
+_database_lock = threading.Lock()
+
+
+def get_database() -> Database:
+    """FastAPI dependency returning the process-wide Database, created on first use"""
+    global _database
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                _database = Database()
+    return _database
+
+
+def close_database():
+    """Close the process-wide Database (called on application shutdown)"""
+    global _database
+    with _database_lock:
+        if _database is not None:
+            _database.close()
+            _database = None
@@ -0,0 +1,138 @@
+"""
+Idempotency-Key support for order creation
+
+A client that retries POST /api/orders after a timeout sends the same
+Idempotency-Key header each time. The first request with a key creates the
+order and stores the response body under (user, key) in idempotency_keys,
+in the same write transaction as the order, so the key and the order are
+committed together or not at all. Later requests with that key get the
+stored response back, marked with an Idempotent-Replayed header, and never
+reach the orders table:
+
+- a retry that arrives while the first request is still running waits for
+  its outcome in-process instead of queueing a second write
+- a retry after it finished is answered from one primary key read
+- a retry handled by another worker, or racing one, finds the key inside
+  its own write transaction, which is serialized with the first one's
+
+Reusing a key for a different request body is rejected with 422. Only
+created orders are stored: a request that failed validation or hit a
+booking conflict may be retried with the same key. Keys expire after
+IDEMPOTENCY_TTL_SECONDS and expired ones are purged as new ones are
+stored, so the table holds about a day of order traffic.
+"""
+import asyncio
+import hashlib
+import time
+
+import orjson
+from fastapi import HTTPException
+
+IDEMPOTENCY_TTL_SECONDS = 24 * 3600
+MAX_KEY_LENGTH = 255
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+# Applied by migration 9
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        user_id INTEGER NOT NULL,
+        key TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        response BLOB NOT NULL,
+        expires_at INTEGER NOT NULL,
+        PRIMARY KEY (user_id, key)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at)",
+)
+
+
+def fingerprint(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+def lookup(conn, user_id: int, key: str):
+    """(fingerprint, response) stored for an unexpired key, or None"""
+    return conn.execute("""
+        SELECT fingerprint, response FROM idempotency_keys
+        WHERE user_id = ? AND key = ? AND expires_at > ?
+    """, (user_id, key, int(time.time()))).fetchone()
+
+
+def store(conn, user_id: int, key: str, request_fingerprint: str, response: bytes):
+    """Record a response (inside the write that produced it) and purge expired keys"""
+    now = int(time.time())
+    conn.execute("DELETE FROM idempotency_keys WHERE expires_at <= ?", (now,))
+    conn.execute("""
+        INSERT OR REPLACE INTO idempotency_keys (user_id, key, fingerprint, response, expires_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (user_id, key, request_fingerprint, response, now + IDEMPOTENCY_TTL_SECONDS))
+
+
+def _replay(stored, request_fingerprint: str) -> bytes:
+    stored_fingerprint, response = stored
+    if stored_fingerprint != request_fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    return bytes(response)
+
+
+class IdempotentRequests:
+    """Runs each (user, key) once; used from the event loop
+
+    run() returns (response body, replayed). The write function is called on
+    the writer thread with the connection and must return the response as a
+    dict, or return or raise an HTTPException, which is raised to the caller
+    and every waiter without storing anything.
+    """
+
+    def __init__(self):
+        # (user_id, key) -> future of the request in progress
+        self._in_flight = {}
+
+    async def run(self, db, user_id: int, key: str, request_fingerprint: str, write) -> tuple:
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key is longer than {MAX_KEY_LENGTH} characters")
+
+        while (user_id, key) in self._in_flight:
+            in_flight = self._in_flight[(user_id, key)]
+            try:
+                return _replay(await asyncio.shield(in_flight), request_fingerprint), True
+            except asyncio.CancelledError:
+                if not in_flight.cancelled():
+                    raise
+                # The first request went away; whatever its write did is found below
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[(user_id, key)] = future
+        try:
+            stored = await db.read(lookup, user_id, key)
+            if stored is None:
+                stored, replayed = await db.write(self._write_once, user_id, key, request_fingerprint, write)
+            else:
+                replayed = True
+            future.set_result(stored)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Retrieved here so an outcome nobody waited for is not reported as unhandled
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[(user_id, key)]
+        return _replay(stored, request_fingerprint), replayed
+
+    @staticmethod
+    def _write_once(conn, user_id: int, key: str, request_fingerprint: str, write) -> tuple:
+        # Another worker may have stored the key since the read above
+        stored = lookup(conn, user_id, key)
+        if stored is not None:
+            return tuple(stored), True
+        result = write(conn)
+        if isinstance(result, HTTPException):
+            raise result
+        response = orjson.dumps(result)
+        store(conn, user_id, key, request_fingerprint, response)
+        return (request_fingerprint, response), False
@@ -1,17 +1,69 @@
 """
 FastAPI backend for MyClean service booking application
+
+Usage: python main.py [--workers N] [--port 8000] [--db myclean.db] [--readers 8]
 """
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
-import sqlite3
-import hashlib
+from pydantic import BaseModel, EmailStr, Field
+from typing import Dict, List, Optional
 from datetime import datetime, date, time, timedelta
+from contextlib import asynccontextmanager
+import asyncio
+import base64
 import json
-
-app = FastAPI(title="MyClean API", description="Service booking API for MyClean", version="1.0.0")
+import os
+
+from db import DB_PATH, Database, get_database, close_database
+from migrations import migrate
+from catalogue import CatalogueCache
+from compression import CompressionMiddleware
+from serialization import encode, json_response, order_row_to_dict, service_row_to_dict
+from availability import AvailabilityIndex
+from orders import VALID_STATUSES, apply_status_changes, insert_orders
+import analytics
+import idempotency
+import order_view
+import search
+from order_events import POLL_SECONDS, OrderEventBroker
+from archive import ARCHIVE_AFTER_DAYS, fetch_order_history, run_archiver
+from auth import (ACCESS_TOKEN_SECONDS, REFRESH_TOKEN_SECONDS, RevocationList, UserCache, decode_token,
+                  fetch_user, issue_token, revoke, unauthorized, user_record)
+from metrics import PROMETHEUS_CONTENT_TYPE, Metrics, MetricsMiddleware
+from admission import AdmissionMiddleware
+from query_log import query_stats
+from passwords import hash_password_async, needs_rehash, shutdown_executor, verify_password_async
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Bring the schema up to date (a no-op when it already is), then open and
+    # warm the database connections before serving the first request
+    migrate(DB_PATH)
+    db = get_database()
+    # Another worker's bookings invalidate this one's availability index, and
+    # so does a rolled back write that had already added or removed bookings
+    db.on_external_change(availability.clear)
+    db.on_rollback(availability.clear)
+    poller = asyncio.create_task(order_events.poll(db)) if order_events.poll_seconds else None
+    archiver = asyncio.create_task(run_archiver(db)) if ARCHIVE_AFTER_DAYS > 0 else None
+    yield
+    for task in (poller, archiver):
+        if task:
+            task.cancel()
+    close_database()
+    shutdown_executor()
+
+# Worker processes serving the same database, set by the launcher at the bottom
+WORKERS = int(os.environ.get("MYCLEAN_WORKERS", "1"))
+
+app = FastAPI(title="MyClean API", description="Service booking API for MyClean", version="1.0.0", lifespan=lifespan)
+
+# Rate limits, load shedding and the write concurrency limit; inside CORS,
+# so rejections carry its headers too
+metrics = Metrics()
+app.add_middleware(AdmissionMiddleware, metrics=metrics, database=get_database)
 
 # CORS middleware for frontend integration
 app.add_middleware(
@@ -20,15 +72,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After"],
 )
 
-security = HTTPBearer()
+# Compresses responses on their way out; inside MetricsMiddleware, so the
+# time it takes counts as serialization time
+app.add_middleware(CompressionMiddleware)
+
+# Added last so it wraps everything else, including CORS preflights
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+security = HTTPBearer(auto_error=False)
+
+# Users behind verified access tokens, and the tokens revoked before expiry
+user_cache = UserCache()
+revocations = RevocationList()
+
+# Service catalogue shared by GET /api/services and /api/services/{id}/durations
+catalogue = CatalogueCache(shared=WORKERS > 1)
 
-# Database connection helper
-def get_db_connection():
-    conn = sqlite3.connect("myclean.db")
-    conn.row_factory = sqlite3.Row
-    return conn
+# Booked provider time slots, maintained by create_order() and update_order_status()
+availability = AvailabilityIndex()
+
+# Open GET /api/orders/events streams, fed by the order status endpoints, or
+# by polling the history table when other workers change orders too
+order_events = OrderEventBroker(POLL_SECONDS if WORKERS > 1 else None)
+
+# POST /api/orders requests in progress per Idempotency-Key
+idempotent_requests = idempotency.IdempotentRequests()
+
+# Largest batch accepted by the bulk order endpoints
+MAX_BULK_ITEMS = 10000
 
 # Pydantic models for request/response
 class UserCreate(BaseModel):
@@ -50,6 +124,15 @@ class UserResponse(BaseModel):
     last_name: Optional[str]
     is_provider: bool
 
+class AuthResponse(UserResponse):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
 class ServiceType(BaseModel):
     id: int
     name: str
@@ -71,6 +154,7 @@ class OrderCreate(BaseModel):
     service_date: date
     service_time_start: time
     customer_notes: Optional[str] = None
+    provider_id: Optional[int] = None
 
 class ServiceUpdate(BaseModel):
     name: Optional[str] = None
@@ -98,148 +182,382 @@ class OrderResponse(BaseModel):
     status: str
     service_type_name: str
 
-# Utility functions
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+class OrderStatusChange(BaseModel):
+    id: int
+    old_status: Optional[str]
+    new_status: str
+    changed_by: Optional[int]
+    notes: Optional[str]
+    created_at: datetime
+
+class OrderImport(OrderCreate):
+    customer_id: int
+
+class OrderBulkCreate(BaseModel):
+    orders: List[OrderImport] = Field(max_length=MAX_BULK_ITEMS)
+
+class StatusTransition(BaseModel):
+    order_id: int
+    status: str
+
+class StatusBulkUpdate(BaseModel):
+    transitions: List[StatusTransition] = Field(max_length=MAX_BULK_ITEMS)
+
+class BulkItemResult(BaseModel):
+    index: int
+    status_code: int
+    detail: Optional[str] = None
+    order: Optional[OrderResponse] = None
+    transition: Optional[dict] = None
+
+class BulkResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
+
+class TimeSlot(BaseModel):
+    start: time
+    end: time
+    provider_ids: List[int]
 
-def verify_password(password: str, hashed: str) -> bool:
-    return hash_password(password) == hashed
+class DailyStats(BaseModel):
+    date: date
+    orders: Dict[str, int]
+    revenue: float
 
-def generate_order_number() -> str:
-    import random
-    import string
-    return 'XXX' + ''.join(random.choices(string.digits, k=3))
+class ServiceStats(BaseModel):
+    service_type_id: int
+    service_type_name: Optional[str]
+    orders: Dict[str, int]
+    revenue: float
+
+class ProviderEarnings(BaseModel):
+    provider_id: int
+    date_from: date
+    date_to: date
+    revenue: float
+    orders: Dict[str, int]
+    days: List[DailyStats]
+
+class StatementStats(BaseModel):
+    statement: str
+    count: int
+    total_ms: float
+    mean_ms: float
+    max_ms: float
+    rows: int
+    slow: int
+
+class QueryStatsResponse(BaseModel):
+    since: datetime
+    slow_query_ms: float
+    statements: List[StatementStats]
+
+# Utility functions
+# Page size for GET /api/orders
+ORDER_PAGE_SIZE = 100
+MAX_ORDER_PAGE_SIZE = 500
+# Range of an SQLite INTEGER, which cursor values are bound as
+SQLITE_MIN_INTEGER, SQLITE_MAX_INTEGER = -2 ** 63, 2 ** 63 - 1
+
+def encode_cursor(created: int, order_id: int) -> str:
+    """Opaque keyset cursor for the order list"""
+    raw = json.dumps([created, order_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    """(created, order_id) of a cursor from encode_cursor(); 400 for anything else
+
+    Only two integers SQLite can bind are accepted, so a forged cursor
+    (floats, Infinity, numbers beyond 64 bits) never reaches the query.
+    """
+    try:
+        created, order_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError, RecursionError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    for value in (created, order_id):
+        if type(value) is not int or not SQLITE_MIN_INTEGER <= value <= SQLITE_MAX_INTEGER:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created, order_id
+
+# Default and largest date range of the analytics endpoints
+ANALYTICS_DEFAULT_DAYS = 30
+MAX_ANALYTICS_DAYS = 731
+
+def analytics_range(date_from: Optional[date], date_to: Optional[date]) -> tuple:
+    """Validated (date_from, date_to) ISO strings, defaulting to the last 30 days"""
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+    if (date_to - date_from).days >= MAX_ANALYTICS_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range is limited to {MAX_ANALYTICS_DAYS} days")
+    return date_from.isoformat(), date_to.isoformat()
+
+def issue_tokens(user: dict) -> dict:
+    """AuthResponse-shaped dict with a fresh access/refresh token pair for user"""
+    access_token, _ = issue_token(user["id"], "access", ACCESS_TOKEN_SECONDS)
+    refresh_token, _ = issue_token(user["id"], "refresh", REFRESH_TOKEN_SECONDS)
+    return {**user, "access_token": access_token, "refresh_token": refresh_token,
+            "token_type": "bearer", "expires_in": ACCESS_TOKEN_SECONDS}
+
+async def authenticate(token: Optional[str], db: Database) -> tuple:
+    """(user, claims) for a valid access token; raises 401 otherwise
+
+    No database access unless the user is not cached or the revocation
+    list is due for its periodic sync.
+    """
+    if not token:
+        raise unauthorized()
+    claims = decode_token(token, "access")
+    if revocations.needs_sync():
+        revocations.merge(await db.read(revocations.load))
+    if claims["jti"] in revocations:
+        raise unauthorized("Token revoked")
+    user = user_cache.get(claims["sub"])
+    if user is None:
+        user = await db.read(fetch_user, claims["sub"])
+        if user is None:
+            raise unauthorized("User not found")
+        user_cache.put(user)
+    return user, claims
+
+async def access_claims(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+                        db: Database = Depends(get_database)) -> tuple:
+    return await authenticate(credentials.credentials if credentials else None, db)
+
+async def current_user(authenticated: tuple = Depends(access_claims)) -> dict:
+    """FastAPI dependency for the user making the request"""
+    return authenticated[0]
+
+# Users allowed on the /api/admin endpoints, by email
+ADMIN_EMAILS = {email.strip().lower() for email in os.environ.get("MYCLEAN_ADMIN_EMAILS", "").split(",") if email.strip()}
+
+def is_admin(user: dict) -> bool:
+    return user["email"].lower() in ADMIN_EMAILS
+
+async def admin_user(user: dict = Depends(current_user)) -> dict:
+    """FastAPI dependency for an administrator making the request"""
+    if not is_admin(user):
+        raise HTTPException(status_code=403, detail="Administrator access required")
+    return user
+
+async def provider_user(user: dict = Depends(current_user)) -> dict:
+    """FastAPI dependency for a provider or administrator making the request"""
+    if not user["is_provider"] and not is_admin(user):
+        raise HTTPException(status_code=403, detail="Provider access required")
+    return user
+
+def order_scope(user: dict) -> tuple:
+    """(customer_id, provider_id) the user's order reads are limited to, None where unrestricted
+
+    Customers see their own orders, providers the orders assigned to them
+    and administrators every order.
+    """
+    if is_admin(user):
+        return None, None
+    if user["is_provider"]:
+        return None, user["id"]
+    return user["id"], None
+
+def can_view_order(user: dict, order) -> bool:
+    """Whether user may read an order, given its customer_id and provider_id"""
+    customer_id, provider_id = order_scope(user)
+    return ((customer_id is None or order["customer_id"] == customer_id)
+            and (provider_id is None or order["provider_id"] == provider_id))
+
+def analytics_provider(user: dict, provider_id: Optional[int]) -> Optional[int]:
+    """The provider_id an analytics read is limited to: the caller's own, unless an administrator"""
+    if is_admin(user):
+        return provider_id
+    if not user["is_provider"] or provider_id not in (None, user["id"]):
+        raise HTTPException(status_code=403, detail="Not allowed to view these statistics")
+    return user["id"]
+
+def status_change_check(user: dict):
+    """apply_status_changes() `allowed` check for user
+
+    The order's provider and administrators may set any status; the order's
+    customer may only cancel it.
+    """
+    admin = is_admin(user)
+
+    def allowed(order: dict, status: str) -> bool:
+        return (admin or order["provider_id"] == user["id"]
+                or (order["customer_id"] == user["id"] and status == "cancelled"))
+    return allowed
+
+def bulk_result(results: list, key: str) -> dict:
+    """BulkResult-shaped summary of per-item dicts and HTTPExceptions"""
+    items = []
+    for index, result in enumerate(results):
+        if isinstance(result, HTTPException):
+            items.append({"index": index, "status_code": result.status_code, "detail": result.detail})
+        else:
+            items.append({"index": index, "status_code": 200, key: result})
+    failed = sum(1 for item in items if item["status_code"] != 200)
+    return {"succeeded": len(items) - failed, "failed": failed, "results": items}
 
 # Authentication endpoints
-@app.post("/api/auth/register", response_model=UserResponse)
-async def register(user: UserCreate):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Check if user already exists
-    cursor.execute("SELECT id FROM users WHERE email = ?", (user.email,))
-    if cursor.fetchone():
-        raise HTTPException(status_code=400, detail="Email already registered")
-
-    # Create new user
-    hashed_password = hash_password(user.password)
-    cursor.execute("""
-        INSERT INTO users (email, phone, password_hash, first_name, last_name)
-        VALUES (?, ?, ?, ?, ?)
-    """, (user.email, user.phone, hashed_password, user.first_name, user.last_name))
-
-    user_id = cursor.lastrowid
-    conn.commit()
-
-    # Return user data
-    cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-    user_data = cursor.fetchone()
-    conn.close()
-
-    return UserResponse(
-        id=user_data["id"],
-        email=user_data["email"],
-        phone=user_data["phone"],
-        first_name=user_data["first_name"],
-        last_name=user_data["last_name"],
-        is_provider=user_data["is_provider"]
-    )
+@app.post("/api/auth/register", response_model=AuthResponse)
+async def register(user: UserCreate, db: Database = Depends(get_database)):
+    # Hash in the process pool before queueing the write
+    hashed_password = await hash_password_async(user.password)
 
-@app.post("/api/auth/login", response_model=UserResponse)
-async def login(user: UserLogin):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    def create_user(conn):
+        cursor = conn.cursor()
 
-    cursor.execute("SELECT * FROM users WHERE email = ?", (user.email,))
-    user_data = cursor.fetchone()
-    conn.close()
+        # Check if user already exists
+        cursor.execute("SELECT id FROM users WHERE email = ?", (user.email,))
+        if cursor.fetchone():
+            raise HTTPException(status_code=400, detail="Email already registered")
+
+        # Create new user
+        cursor.execute("""
+            INSERT INTO users (email, phone, password_hash, first_name, last_name)
+            VALUES (?, ?, ?, ?, ?)
+        """, (user.email, user.phone, hashed_password, user.first_name, user.last_name))
 
-    if not user_data or not verify_password(user.password, user_data["password_hash"]):
+        # Return user data
+        cursor.execute("SELECT * FROM users WHERE id = ?", (cursor.lastrowid,))
+        return cursor.fetchone()
+
+    user_data = await db.write(create_user)
+    user_record_data = user_record(user_data)
+    user_cache.put(user_record_data)
+    return issue_tokens(user_record_data)
+
+@app.post("/api/auth/login", response_model=AuthResponse)
+async def login(user: UserLogin, db: Database = Depends(get_database)):
+    def find_user(conn):
+        return conn.execute("SELECT * FROM users WHERE email = ?", (user.email,)).fetchone()
+
+    user_data = await db.read(find_user)
+    password_hash = user_data["password_hash"] if user_data else None
+
+    if not await verify_password_async(user.password, password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    return UserResponse(
-        id=user_data["id"],
-        email=user_data["email"],
-        phone=user_data["phone"],
-        first_name=user_data["first_name"],
-        last_name=user_data["last_name"],
-        is_provider=user_data["is_provider"]
-    )
+    # Upgrade legacy SHA-256 or outdated-cost hashes now that we know the password
+    if needs_rehash(password_hash):
+        new_hash = await hash_password_async(user.password)
+
+        def store_hash(conn):
+            conn.execute("UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?",
+                         (new_hash, user_data["id"], password_hash))
+
+        await db.write(store_hash)
+
+    user_record_data = user_record(user_data)
+    user_cache.put(user_record_data)
+    return issue_tokens(user_record_data)
+
+@app.post("/api/auth/refresh", response_model=AuthResponse)
+async def refresh_tokens(body: TokenRefresh, db: Database = Depends(get_database)):
+    """Exchange a refresh token for a new token pair; the old refresh token stops working"""
+    claims = decode_token(body.refresh_token, "refresh")
+
+    def use_refresh_token(conn):
+        # Checked against the table rather than the synced copy, so a token
+        # cannot be used twice however quickly the attempts follow each other
+        if conn.execute("SELECT 1 FROM revoked_tokens WHERE jti = ?", (claims["jti"],)).fetchone():
+            raise unauthorized("Token revoked")
+        revoke(conn, [claims])
+        return fetch_user(conn, claims["sub"])
+
+    user = await db.write(use_refresh_token)
+    revocations.add(claims["jti"], claims["exp"])
+    if user is None:
+        raise unauthorized("User not found")
+    user_cache.put(user)
+    return issue_tokens(user)
+
+@app.post("/api/auth/logout", status_code=204)
+async def logout(body: Optional[TokenRefresh] = None, authenticated: tuple = Depends(access_claims),
+                 db: Database = Depends(get_database)):
+    """Revoke the access token used, and the refresh token if one is given"""
+    revoked = [authenticated[1]]
+    if body is not None:
+        refresh_claims = decode_token(body.refresh_token, "refresh")
+        if refresh_claims["sub"] != authenticated[0]["id"]:
+            raise HTTPException(status_code=403, detail="Refresh token belongs to another user")
+        revoked.append(refresh_claims)
+    await db.write(revoke, revoked)
+    for claims in revoked:
+        revocations.add(claims["jti"], claims["exp"])
+    return Response(status_code=204)
+
+@app.get("/api/auth/me", response_model=UserResponse)
+async def get_me(user: dict = Depends(current_user)):
+    return user
 
 # Service endpoints
 @app.get("/api/services", response_model=List[ServiceType])
-async def get_services(include_inactive: bool = False):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
+async def get_services(request: Request, include_inactive: bool = False,
+                       db: Database = Depends(get_database)):
     # For provider management, include inactive services
     # For customer browsing, only show active services
-    if include_inactive:
-        cursor.execute("""
-            SELECT st.id, st.name, st.description, st.base_price, st.duration_minutes,
-                   sc.name as category_name, st.is_active
-            FROM service_types st
-            JOIN service_categories sc ON st.category_id = sc.id
-            ORDER BY st.is_active DESC, st.name ASC
-        """)
-    else:
-        cursor.execute("""
-            SELECT st.id, st.name, st.description, st.base_price, st.duration_minutes,
-                   sc.name as category_name, st.is_active
-            FROM service_types st
-            JOIN service_categories sc ON st.category_id = sc.id
-            WHERE st.is_active = 1
-            ORDER BY st.name ASC
-        """)
-
-    services = []
-    for row in cursor.fetchall():
-        services.append(ServiceType(
-            id=row["id"],
-            name=row["name"],
-            description=row["description"],
-            base_price=row["base_price"],
-            duration_minutes=row["duration_minutes"],
-            category_name=row["category_name"],
-            is_active=bool(row["is_active"])
-        ))
-
-    conn.close()
-    return services
+    snapshot = await catalogue.get(db)
+    variant = "services-all" if include_inactive else "services"
+    headers = snapshot.cache_headers(variant)
+    if snapshot.not_modified(request.headers, variant):
+        return Response(status_code=304, headers=headers)
+
+    return snapshot.services_body(include_inactive).response(request.headers, headers)
+
+@app.get("/api/services/search", response_model=List[ServiceType])
+async def search_services(q: str, include_inactive: bool = False,
+                          limit: int = Query(search.SEARCH_LIMIT, ge=1, le=search.MAX_SEARCH_LIMIT),
+                          db: Database = Depends(get_database)):
+    """Services whose name, description or category match q, best match first"""
+    query = search.fts_query(q)
+    if query is None:
+        return json_response(b"[]")
+    rows = await db.read(search.search_services, query, include_inactive, limit)
+    return json_response(encode([service_row_to_dict(row) for row in rows]))
 
 @app.get("/api/services/{service_id}/durations", response_model=List[ServiceDuration])
-async def get_service_durations(service_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT id, duration_minutes, duration_label, price_multiplier
-        FROM service_durations
-        WHERE service_type_id = ?
-    """, (service_id,))
-
-    durations = []
-    for row in cursor.fetchall():
-        durations.append(ServiceDuration(
-            id=row["id"],
-            duration_minutes=row["duration_minutes"],
-            duration_label=row["duration_label"],
-            price_multiplier=row["price_multiplier"]
-        ))
-
-    conn.close()
-    return durations
+async def get_service_durations(service_id: int, request: Request,
+                                db: Database = Depends(get_database)):
+    snapshot = await catalogue.get(db)
+    variant = f"durations-{service_id}"
+    headers = snapshot.cache_headers(variant)
+    if snapshot.not_modified(request.headers, variant):
+        return Response(status_code=304, headers=headers)
+
+    return snapshot.durations_body(service_id).response(request.headers, headers)
+
+@app.get("/api/services/{service_id}/availability", response_model=List[TimeSlot])
+async def get_service_availability(service_id: int, service_date: date,
+                                   service_duration_id: Optional[int] = None,
+                                   db: Database = Depends(get_database)):
+    """Start times on a date at which at least one provider can take the service"""
+    snapshot = await catalogue.get(db)
+    duration_minutes = snapshot.duration_minutes(service_id, service_duration_id)
+    if duration_minutes is None:
+        raise HTTPException(status_code=404, detail="Service or duration not found")
 
-@app.put("/api/services/{service_id}")
-async def update_service(service_id: int, service_update: ServiceUpdate):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    day = service_date.isoformat()
+    if WORKERS > 1:
+        # Drop bookings cached before another worker's latest commit
+        await db.sync()
+    if not availability.is_loaded(day):
+        # Loaded on the writer thread so it cannot interleave with a booking for that day
+        await db.write(availability.load_date, day)
 
-    # Check if service exists
-    cursor.execute("SELECT id FROM service_types WHERE id = ?", (service_id,))
-    if not cursor.fetchone():
-        raise HTTPException(status_code=404, detail="Service not found")
+    def fetch_provider_ids(conn):
+        rows = conn.execute("SELECT id FROM users WHERE is_provider = 1 AND is_active = 1 ORDER BY id").fetchall()
+        return [row["id"] for row in rows]
 
+    provider_ids = await db.read(fetch_provider_ids)
+    return [
+        TimeSlot(start=time(start // 60, start % 60), end=time(end // 60, end % 60), provider_ids=free)
+        for start, end, free in availability.free_slots(provider_ids, day, duration_minutes)
+    ]
+
+@app.put("/api/services/{service_id}")
+async def update_service(service_id: int, service_update: ServiceUpdate, user: dict = Depends(provider_user),
+                         db: Database = Depends(get_database)):
     # Build update query dynamically based on provided fields
     update_fields = []
     update_values = []
@@ -264,53 +582,57 @@ async def update_service(service_id: int, service_update: ServiceUpdate):
         update_fields.append("is_active = ?")
         update_values.append(service_update.is_active)
 
-    if not update_fields:
-        raise HTTPException(status_code=400, detail="No fields to update")
+    def apply_update(conn):
+        cursor = conn.cursor()
 
-    # Add service_id for WHERE clause
-    update_values.append(service_id)
+        # Check if service exists
+        cursor.execute("SELECT id FROM service_types WHERE id = ?", (service_id,))
+        if not cursor.fetchone():
+            raise HTTPException(status_code=404, detail="Service not found")
 
-    query = f"UPDATE service_types SET {', '.join(update_fields)} WHERE id = ?"
-    cursor.execute(query, update_values)
+        if not update_fields:
+            raise HTTPException(status_code=400, detail="No fields to update")
 
-    conn.commit()
-    conn.close()
+        query = f"UPDATE service_types SET {', '.join(update_fields)} WHERE id = ?"
+        cursor.execute(query, update_values + [service_id])
+
+    await db.write(apply_update)
+    catalogue.invalidate()
 
     return {"message": "Service updated successfully", "service_id": service_id}
 
 @app.post("/api/services", response_model=ServiceType)
-async def create_service(service: ServiceCreate):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Get category_id from category_name
-    cursor.execute("SELECT id FROM service_categories WHERE name = ?", (service.category_name,))
-    category = cursor.fetchone()
-    if not category:
-        raise HTTPException(status_code=400, detail=f"Category '{service.category_name}' not found")
-
-    category_id = category["id"]
-
-    # Create new service
-    cursor.execute("""
-        INSERT INTO service_types (category_id, name, description, base_price, duration_minutes, is_active)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (category_id, service.name, service.description, service.base_price, service.duration_minutes, service.is_active))
-
-    service_id = cursor.lastrowid
-    conn.commit()
-
-    # Return the created service
-    cursor.execute("""
-        SELECT st.id, st.name, st.description, st.base_price, st.duration_minutes,
-               sc.name as category_name, st.is_active
-        FROM service_types st
-        JOIN service_categories sc ON st.category_id = sc.id
-        WHERE st.id = ?
-    """, (service_id,))
-
-    service_data = cursor.fetchone()
-    conn.close()
+async def create_service(service: ServiceCreate, user: dict = Depends(provider_user),
+                         db: Database = Depends(get_database)):
+    def insert_service(conn):
+        cursor = conn.cursor()
+
+        # Get category_id from category_name
+        cursor.execute("SELECT id FROM service_categories WHERE name = ?", (service.category_name,))
+        category = cursor.fetchone()
+        if not category:
+            raise HTTPException(status_code=400, detail=f"Category '{service.category_name}' not found")
+
+        category_id = category["id"]
+
+        # Create new service
+        cursor.execute("""
+            INSERT INTO service_types (category_id, name, description, base_price, duration_minutes, is_active)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (category_id, service.name, service.description, service.base_price, service.duration_minutes, service.is_active))
+
+        # Return the created service
+        cursor.execute("""
+            SELECT st.id, st.name, st.description, st.base_price, st.duration_minutes,
+                   sc.name as category_name, st.is_active
+            FROM service_types st
+            JOIN service_categories sc ON st.category_id = sc.id
+            WHERE st.id = ?
+        """, (cursor.lastrowid,))
+        return cursor.fetchone()
+
+    service_data = await db.write(insert_service)
+    catalogue.invalidate()
 
     return ServiceType(
         id=service_data["id"],
@@ -324,194 +646,336 @@ async def create_service(service: ServiceCreate):
 
 # Order endpoints
 @app.post("/api/orders", response_model=OrderResponse)
-async def create_order(order: OrderCreate):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Get service and duration details for pricing
-    cursor.execute("""
-        SELECT st.base_price, st.name, sd.duration_minutes, sd.price_multiplier
-        FROM service_types st
-        JOIN service_durations sd ON sd.service_type_id = st.id
-        WHERE st.id = ? AND sd.id = ?
-    """, (order.service_type_id, order.service_duration_id))
-
-    service_data = cursor.fetchone()
-    if not service_data:
-        raise HTTPException(status_code=404, detail="Service or duration not found")
-
-    # Calculate pricing and end time
-    base_price = service_data["base_price"]
-    total_price = base_price * service_data["price_multiplier"]
-    duration_minutes = service_data["duration_minutes"]
-
-    # Calculate end time
-    start_datetime = datetime.combine(order.service_date, order.service_time_start)
-    end_datetime = start_datetime + timedelta(minutes=duration_minutes)
-    service_time_end = end_datetime.time()
-
-    # Generate order number
-    order_number = generate_order_number()
-
-    # Create order (using customer_id = 1 for demo, in real app this would come from auth)
-    cursor.execute("""
-        INSERT INTO orders (order_number, customer_id, service_type_id, service_duration_id,
-                          service_date, service_time_start, service_time_end, base_price, total_price,
-                          customer_notes)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (order_number, 1, order.service_type_id, order.service_duration_id,
-          str(order.service_date), str(order.service_time_start), str(service_time_end),
-          base_price, total_price, order.customer_notes))
-
-    order_id = cursor.lastrowid
-    conn.commit()
-
-    # Get customer name for response
-    cursor.execute("SELECT first_name, last_name FROM users WHERE id = 1")
-    customer = cursor.fetchone()
-    customer_name = f"{customer['first_name']} {customer['last_name']}" if customer else "Unknown"
-
-    conn.close()
-
-    return OrderResponse(
-        id=order_id,
-        order_number=order_number,
-        customer_name=customer_name,
-        service_date=order.service_date,
-        service_time_start=order.service_time_start,
-        service_time_end=service_time_end,
-        total_price=total_price,
-        status="pending",
-        service_type_name=service_data["name"]
-    )
+async def create_order(order: OrderCreate, user: dict = Depends(current_user),
+                       idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+                       db: Database = Depends(get_database)):
+    """Create an order; retries sending the same Idempotency-Key get the first response back"""
+    if idempotency_key is None:
+        result = (await db.write(insert_orders, availability, [order], user["id"]))[0]
+        if isinstance(result, HTTPException):
+            raise result
+        return result
+
+    def create(conn):
+        return insert_orders(conn, availability, [order], user["id"])[0]
+
+    body, replayed = await idempotent_requests.run(
+        db, user["id"], idempotency_key, idempotency.fingerprint(order.model_dump_json().encode()), create)
+    return json_response(body, headers={idempotency.REPLAYED_HEADER: "true"} if replayed else None)
+
+@app.post("/api/orders/bulk", response_model=BulkResult)
+async def create_orders_bulk(bulk: OrderBulkCreate, user: dict = Depends(admin_user),
+                             db: Database = Depends(get_database)):
+    """Import many orders, each for its own customer, in one transaction, reporting each order's outcome"""
+    results = await db.write(insert_orders, availability, bulk.orders)
+    return json_response(encode(bulk_result(results, "order")))
 
 @app.get("/api/orders", response_model=List[OrderResponse])
-async def get_orders(status: Optional[str] = None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    query = """
-        SELECT o.id, o.order_number, o.service_date, o.service_time_start, o.service_time_end,
-               o.total_price, o.status, st.name as service_type_name,
-               u.first_name, u.last_name
-        FROM orders o
-        JOIN users u ON o.customer_id = u.id
-        JOIN service_types st ON o.service_type_id = st.id
+async def get_orders(
+    status: Optional[str] = None,
+    customer_id: Optional[int] = None,
+    provider_id: Optional[int] = None,
+    service_type_id: Optional[int] = None,
+    created_from: Optional[date] = None,
+    created_to: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(ORDER_PAGE_SIZE, ge=1, le=MAX_ORDER_PAGE_SIZE),
+    user: dict = Depends(current_user),
+    db: Database = Depends(get_database),
+):
+    """List orders newest first, one page at a time
+
+    The next page is requested by passing the X-Next-Cursor header of the
+    previous response back as `cursor`; the header is absent on the last page.
+    Customers only list their own orders and providers the ones assigned to
+    them, whatever customer_id or provider_id they pass.
     """
+    own_customer_id, own_provider_id = order_scope(user)
+    customer_id = own_customer_id if own_customer_id is not None else customer_id
+    provider_id = own_provider_id if own_provider_id is not None else provider_id
+
+    query = f"SELECT {order_view.COLUMNS} FROM order_view"
 
+    # Each filter is served by one of the idx_order_view_*_created indexes
+    conditions = []
     params = []
     if status and status != "all":
-        if status == "in_progress":
-            query += " WHERE o.status = 'in_progress'"
-        elif status == "completed":
-            query += " WHERE o.status = 'completed'"
-        else:
-            query += " WHERE o.status = ?"
-            params.append(status)
-
-    query += " ORDER BY o.created_at DESC"
-
-    cursor.execute(query, params)
-
-    orders = []
-    for row in cursor.fetchall():
-        customer_name = f"{row['first_name']} {row['last_name']}" if row['first_name'] else "Unknown"
-        orders.append(OrderResponse(
-            id=row["id"],
-            order_number=row["order_number"],
-            customer_name=customer_name,
-            service_date=datetime.strptime(row["service_date"], "%Y-%m-%d").date(),
-            service_time_start=datetime.strptime(row["service_time_start"], "%H:%M:%S").time(),
-            service_time_end=datetime.strptime(row["service_time_end"], "%H:%M:%S").time(),
-            total_price=row["total_price"],
-            status=row["status"],
-            service_type_name=row["service_type_name"]
-        ))
-
-    conn.close()
-    return orders
+        conditions.append("status = ?")
+        params.append(status)
+    if customer_id is not None:
+        conditions.append("customer_id = ?")
+        params.append(customer_id)
+    if provider_id is not None:
+        conditions.append("provider_id = ?")
+        params.append(provider_id)
+    if service_type_id is not None:
+        conditions.append("service_type_id = ?")
+        params.append(service_type_id)
+    if created_from is not None:
+        conditions.append("created >= ?")
+        params.append(order_view.day_number(created_from) * 86400)
+    if created_to is not None:
+        conditions.append("created < ?")
+        params.append((order_view.day_number(created_to) + 1) * 86400)
+    if cursor:
+        conditions.append("(created, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    # Fetch one extra row to find out whether another page follows
+    query += " ORDER BY created DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    def fetch_orders(conn):
+        return conn.execute(query, params).fetchall()
+
+    rows = await db.read(fetch_orders)
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1]["created"], rows[-1]["id"])
+
+    return json_response(encode([order_row_to_dict(row) for row in rows]), headers=headers)
+
+@app.get("/api/orders/search", response_model=List[OrderResponse])
+async def search_orders(q: str, limit: int = Query(search.SEARCH_LIMIT, ge=1, le=search.MAX_SEARCH_LIMIT),
+                        user: dict = Depends(current_user), db: Database = Depends(get_database)):
+    """Orders whose customer name or notes match q, best match first
+
+    Limited to the orders the user may view, as in GET /api/orders.
+    """
+    query = search.fts_query(q)
+    if query is None:
+        return json_response(b"[]")
+    customer_id, provider_id = order_scope(user)
+    rows = await db.read(search.search_orders, query, customer_id, provider_id, limit)
+    return json_response(encode([order_row_to_dict(row) for row in rows]))
+
+@app.get("/api/orders/events")
+async def stream_order_events(
+    customer_id: Optional[int] = None,
+    provider_id: Optional[int] = None,
+    last_event_id: Optional[int] = None,
+    last_event_id_header: Optional[int] = Header(None, alias="Last-Event-ID"),
+    access_token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Database = Depends(get_database),
+):
+    """Server-sent events for status changes of one customer's or one provider's orders
+
+    Each event's id is its order_status_history id. Browsers resend the last
+    one as the Last-Event-ID header when they reconnect; it can also be given
+    as `last_event_id`. Missed changes are replayed before live ones.
+
+    Users may follow their own orders, and providers the orders assigned to
+    them. EventSource cannot set headers, so the access token may also be
+    passed as `access_token`.
+    """
+    if (customer_id is None) == (provider_id is None):
+        raise HTTPException(status_code=400, detail="Subscribe to exactly one of customer_id or provider_id")
+    user, _ = await authenticate(credentials.credentials if credentials else access_token, db)
+    if customer_id is not None:
+        allowed = customer_id == user["id"]
+    else:
+        allowed = user["is_provider"] and provider_id == user["id"]
+    if not allowed:
+        raise HTTPException(status_code=403, detail="Not allowed to follow these orders")
+    resume_from = last_event_id_header if last_event_id_header is not None else last_event_id
+    return StreamingResponse(
+        order_events.stream(db, resume_from, customer_id, provider_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/api/orders/{order_id}", response_model=OrderResponse)
-async def get_order(order_id: int):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT o.id, o.order_number, o.service_date, o.service_time_start, o.service_time_end,
-               o.total_price, o.status, st.name as service_type_name,
-               u.first_name, u.last_name
-        FROM orders o
-        JOIN users u ON o.customer_id = u.id
-        JOIN service_types st ON o.service_type_id = st.id
-        WHERE o.id = ?
-    """, (order_id,))
-
-    row = cursor.fetchone()
+async def get_order(order_id: int, user: dict = Depends(current_user), db: Database = Depends(get_database)):
+    row = await db.read(order_view.fetch_order, order_id)
     if not row:
         raise HTTPException(status_code=404, detail="Order not found")
+    if not can_view_order(user, row):
+        raise HTTPException(status_code=403, detail="Not allowed to view this order")
+    return json_response(encode(order_row_to_dict(row)))
+
+@app.get("/api/orders/{order_id}/history", response_model=List[OrderStatusChange])
+async def get_order_history(order_id: int, user: dict = Depends(current_user),
+                            db: Database = Depends(get_database)):
+    """Status changes of an order, oldest first, whether it is live or archived"""
+    def fetch_history(conn):
+        order = order_view.fetch_order(conn, order_id)
+        if order is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        if not can_view_order(user, order):
+            raise HTTPException(status_code=403, detail="Not allowed to view this order")
+        return fetch_order_history(conn, order_id)
+
+    return json_response(encode(await db.read(fetch_history)))
+
+# Order status update endpoints
+@app.put("/api/orders/bulk/status", response_model=BulkResult)
+async def update_order_status_bulk(bulk: StatusBulkUpdate, user: dict = Depends(current_user),
+                                   db: Database = Depends(get_database)):
+    """Apply many status transitions in one transaction, reporting each one's outcome"""
+    changes = [(transition.order_id, transition.status) for transition in bulk.transitions]
+    events = []
+    results = await db.write(apply_status_changes, availability, changes, user["id"], events,
+                             status_change_check(user))
+    order_events.publish(events)
+    return json_response(encode(bulk_result(results, "transition")))
 
-    customer_name = f"{row['first_name']} {row['last_name']}" if row['first_name'] else "Unknown"
-
-    conn.close()
-    return OrderResponse(
-        id=row["id"],
-        order_number=row["order_number"],
-        customer_name=customer_name,
-        service_date=datetime.strptime(row["service_date"], "%Y-%m-%d").date(),
-        service_time_start=datetime.strptime(row["service_time_start"], "%H:%M:%S").time(),
-        service_time_end=datetime.strptime(row["service_time_end"], "%H:%M:%S").time(),
-        total_price=row["total_price"],
-        status=row["status"],
-        service_type_name=row["service_type_name"]
-    )
-
-# Order status update endpoint
 @app.put("/api/orders/{order_id}/status")
-async def update_order_status(order_id: int, status: str):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
+async def update_order_status(order_id: int, status: str, user: dict = Depends(current_user),
+                              db: Database = Depends(get_database)):
     # Validate status
-    valid_statuses = ['pending', 'confirmed', 'in_progress', 'completed', 'cancelled']
-    if status not in valid_statuses:
-        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {valid_statuses}")
-
-    # Check if order exists
-    cursor.execute("SELECT id, status FROM orders WHERE id = ?", (order_id,))
-    order = cursor.fetchone()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
+    if status not in VALID_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {VALID_STATUSES}")
 
-    # Update order status
-    update_time = datetime.now().isoformat()
-    cursor.execute("""
-        UPDATE orders
-        SET status = ?, updated_at = ?, confirmed_at = ?, completed_at = ?
-        WHERE id = ?
-    """, (
-        status,
-        update_time,
-        update_time if status == 'confirmed' else None,
-        update_time if status == 'completed' else None,
-        order_id
-    ))
-
-    # Add to status history
-    cursor.execute("""
-        INSERT INTO order_status_history (order_id, old_status, new_status, changed_by, created_at)
-        VALUES (?, ?, ?, ?, ?)
-    """, (order_id, order['status'], status, 1, update_time))  # Using user_id = 1 for demo
-
-    conn.commit()
-    conn.close()
+    events = []
+    result = (await db.write(apply_status_changes, availability, [(order_id, status)], user["id"], events,
+                             status_change_check(user)))[0]
+    order_events.publish(events)
+    if isinstance(result, HTTPException):
+        raise result
 
     return {"message": "Order status updated successfully", "order_id": order_id, "new_status": status}
 
+# Analytics endpoints, served from the order_daily_stats rollups
+@app.get("/api/analytics/daily", response_model=List[DailyStats])
+async def get_daily_stats(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    provider_id: Optional[int] = None,
+    user: dict = Depends(current_user),
+    db: Database = Depends(get_database),
+):
+    """Order counts by status and completed revenue for each service day
+
+    Providers get their own figures; only administrators may see all
+    providers' or another provider's.
+    """
+    provider_id = analytics_provider(user, provider_id)
+    date_range = analytics_range(date_from, date_to)
+    days = await db.read(analytics.daily_stats, *date_range, provider_id)
+    return json_response(encode(days))
+
+@app.get("/api/analytics/services", response_model=List[ServiceStats])
+async def get_service_stats(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    provider_id: Optional[int] = None,
+    user: dict = Depends(current_user),
+    db: Database = Depends(get_database),
+):
+    """Order counts by status and completed revenue for each service type, scoped like /api/analytics/daily"""
+    provider_id = analytics_provider(user, provider_id)
+    date_range = analytics_range(date_from, date_to)
+    services = await db.read(analytics.service_stats, *date_range, provider_id)
+    return json_response(encode(services))
+
+@app.get("/api/providers/{provider_id}/earnings", response_model=ProviderEarnings)
+async def get_provider_earnings(
+    provider_id: int,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    user: dict = Depends(current_user),
+    db: Database = Depends(get_database),
+):
+    """A provider's completed revenue and order counts, in total and per day; for that provider or an administrator"""
+    if provider_id != user["id"] and not is_admin(user):
+        raise HTTPException(status_code=403, detail="Not allowed to view these earnings")
+    date_range = analytics_range(date_from, date_to)
+
+    def fetch_earnings(conn):
+        provider = conn.execute("SELECT 1 FROM users WHERE id = ? AND is_provider = 1", (provider_id,)).fetchone()
+        if not provider:
+            return None
+        return analytics.daily_stats(conn, *date_range, provider_id)
+
+    days = await db.read(fetch_earnings)
+    if days is None:
+        raise HTTPException(status_code=404, detail="Provider not found")
+
+    totals = {}
+    for day in days:
+        for order_status, count in day["orders"].items():
+            totals[order_status] = totals.get(order_status, 0) + count
+    return json_response(encode({
+        "provider_id": provider_id,
+        "date_from": date_range[0],
+        "date_to": date_range[1],
+        "revenue": round(sum(day["revenue"] for day in days), 2),
+        "orders": totals,
+        "days": days,
+    }))
+
+# Per-statement SQLite statistics of this worker process
+@app.get("/api/admin/query-stats", response_model=QueryStatsResponse)
+async def get_query_stats(sort: str = Query("total", pattern="^(total|max|mean|count|rows|slow)$"),
+                          limit: int = Query(50, ge=1, le=1000), user: dict = Depends(admin_user)):
+    """Execution count, total/mean/max time and rows returned per statement fingerprint"""
+    return json_response(encode({
+        "since": datetime.fromtimestamp(query_stats.started_at).isoformat(),
+        "slow_query_ms": query_stats.slow_seconds * 1000,
+        "statements": query_stats.snapshot(sort, limit),
+    }))
+
+@app.delete("/api/admin/query-stats", status_code=204)
+async def reset_query_stats(user: dict = Depends(admin_user)):
+    query_stats.reset()
+    return Response(status_code=204)
+
 # Health check endpoint
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(content=metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+def main():
+    """Serve the API, in one process or in several sharing the database
+
+    Settings reach the workers through the environment, which uvicorn passes
+    on to each of them. The schema is migrated once here, before any worker
+    starts, and a shared signing key is made so that a token issued by one
+    worker is accepted by all.
+    """
+    import argparse
+    import secrets
+    import sys
+
+    parser = argparse.ArgumentParser(description="Run the MyClean API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="worker processes (default 1)")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database file")
+    parser.add_argument("--readers", type=int, help="read connections per worker (default 8)")
+    parser.add_argument("--slow-query-ms", type=float, help="log statements at least this slow (default 100)")
+    parser.add_argument("--no-rate-limits", action="store_true",
+                        help="turn off per-client rate limits, e.g. for load tests from one address")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    os.environ["MYCLEAN_DB_PATH"] = args.db
+    os.environ["MYCLEAN_WORKERS"] = str(args.workers)
+    if args.readers:
+        os.environ["MYCLEAN_READ_POOL_SIZE"] = str(args.readers)
+    if args.slow_query_ms is not None:
+        os.environ["MYCLEAN_SLOW_QUERY_MS"] = str(args.slow_query_ms)
+    if args.no_rate_limits:
+        os.environ["MYCLEAN_RATE_LIMITS"] = "0"
+    if args.workers > 1:
+        os.environ.setdefault("MYCLEAN_SECRET_KEY", secrets.token_urlsafe(32))
+    migrate(args.db)
+
+    # Exec so this module is imported afresh, with the settings above, by each worker
+    os.execv(sys.executable, [sys.executable, "-m", "uvicorn", "main:app",
+                              "--app-dir", os.path.dirname(os.path.abspath(__file__)),
+                              "--host", args.host, "--port", str(args.port), "--workers", str(args.workers),
+                              "--log-level", args.log_level])
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    main()
\ No newline at end of file
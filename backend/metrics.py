@@ -0,0 +1,180 @@
+"""
+Request metrics for the MyClean backend, exposed in Prometheus text format
+
+MetricsMiddleware is a plain ASGI middleware (no BaseHTTPMiddleware task
+hop) that records, per method and route template:
+
+- a latency histogram
+- request counts by status code
+- seconds spent inside SQLite and in JSON serialization (including
+  response compression)
+
+plus the number of requests in flight, the requests turned away by
+admission.py by reason and limit, and gauges other modules register with
+add_gauge(). Handlers report SQLite and serialization time through
+record_db_time() / record_serialization_time(), which add to a per-request
+accumulator held in a contextvar. All updates
+happen on the event loop thread, so no locking is needed.
+"""
+import bisect
+import time
+from contextvars import ContextVar
+
+# Upper bounds in seconds, Prometheus' default buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# [db_seconds, serialization_seconds] of the request being handled
+_request_timings = ContextVar("request_timings", default=None)
+
+
+def record_db_time(seconds: float):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[0] += seconds
+
+
+def record_serialization_time(seconds: float):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[1] += seconds
+
+
+class RouteStats:
+    __slots__ = ("bucket_counts", "latency_sum", "count", "db_seconds", "serialization_seconds", "status_counts")
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)  # last slot is +Inf
+        self.latency_sum = 0.0
+        self.count = 0
+        self.db_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.status_counts = {}
+
+
+class Metrics:
+    """In-memory registry of per-route statistics"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.routes = {}
+        # (reason, limit) -> requests rejected
+        self.rejected = {}
+        # (name, help, function returning the current value)
+        self.gauges = []
+        self.started_at = time.time()
+
+    def observe(self, method: str, route: str, status_code: int, latency: float, db_seconds: float,
+                serialization_seconds: float):
+        stats = self.routes.get((method, route))
+        if stats is None:
+            stats = self.routes[(method, route)] = RouteStats()
+        stats.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        stats.latency_sum += latency
+        stats.count += 1
+        stats.db_seconds += db_seconds
+        stats.serialization_seconds += serialization_seconds
+        stats.status_counts[status_code] = stats.status_counts.get(status_code, 0) + 1
+
+    def reject(self, reason: str, limit: str):
+        self.rejected[(reason, limit)] = self.rejected.get((reason, limit), 0) + 1
+
+    def add_gauge(self, name: str, help_text: str, value):
+        self.gauges.append((name, help_text, value))
+
+    def render(self) -> str:
+        """Prometheus text exposition of everything recorded so far"""
+        lines = [
+            "# HELP myclean_http_requests_in_flight Requests currently being handled.",
+            "# TYPE myclean_http_requests_in_flight gauge",
+            f"myclean_http_requests_in_flight {self.in_flight}",
+            "# HELP myclean_http_requests_total Requests handled, by status code.",
+            "# TYPE myclean_http_requests_total counter",
+        ]
+        routes = sorted(self.routes.items())
+        for (method, route), stats in routes:
+            for status_code, count in sorted(stats.status_counts.items()):
+                lines.append(f'myclean_http_requests_total{{method="{method}",route="{route}",status="{status_code}"}} {count}')
+
+        lines += [
+            "# HELP myclean_http_request_duration_seconds Request latency.",
+            "# TYPE myclean_http_request_duration_seconds histogram",
+        ]
+        for (method, route), stats in routes:
+            labels = f'method="{method}",route="{route}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), stats.bucket_counts):
+                cumulative += count
+                lines.append(f'myclean_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"myclean_http_request_duration_seconds_sum{{{labels}}} {stats.latency_sum:.6f}")
+            lines.append(f"myclean_http_request_duration_seconds_count{{{labels}}} {stats.count}")
+
+        lines += [
+            "# HELP myclean_db_seconds_total Time handlers spent inside SQLite.",
+            "# TYPE myclean_db_seconds_total counter",
+        ]
+        for (method, route), stats in routes:
+            lines.append(f'myclean_db_seconds_total{{method="{method}",route="{route}"}} {stats.db_seconds:.6f}')
+
+        lines += [
+            "# HELP myclean_serialization_seconds_total Time handlers spent encoding JSON.",
+            "# TYPE myclean_serialization_seconds_total counter",
+        ]
+        for (method, route), stats in routes:
+            lines.append(f'myclean_serialization_seconds_total{{method="{method}",route="{route}"}} '
+                         f'{stats.serialization_seconds:.6f}')
+
+        lines += [
+            "# HELP myclean_requests_rejected_total Requests turned away by admission control.",
+            "# TYPE myclean_requests_rejected_total counter",
+        ]
+        for (reason, limit), count in sorted(self.rejected.items()):
+            lines.append(f'myclean_requests_rejected_total{{reason="{reason}",limit="{limit}"}} {count}')
+
+        for name, help_text, value in self.gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value()}"]
+
+        lines += [
+            "# HELP myclean_process_start_time_seconds Start time of the process since the Unix epoch.",
+            "# TYPE myclean_process_start_time_seconds gauge",
+            f"myclean_process_start_time_seconds {self.started_at:.3f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware feeding a Metrics registry"""
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        timings = [0.0, 0.0]
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        token = _request_timings.set(timings)
+        self.metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            latency = time.perf_counter() - started
+            self.metrics.in_flight -= 1
+            _request_timings.reset(token)
+            # The router stores the matched route on the scope; use its template
+            # so /api/orders/1 and /api/orders/2 share one series
+            route = scope.get("route")
+            self.metrics.observe(scope["method"], route.path if route is not None else "unmatched",
+                                 status_code, latency, timings[0], timings[1])
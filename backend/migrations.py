@@ -0,0 +1,350 @@
+"""
+Versioned schema migrations for the MyClean database
+
+Usage: python migrations.py [--db myclean.db] [--status]
+
+Each migration is a function registered with @migration(version, name) and
+called with an autocommit connection. The schema version is kept in
+PRAGMA user_version, so an up-to-date database is recognised with a single
+header read and startup does no other work. Applied migrations are also
+recorded, with their run time, in schema_migrations.
+
+Migrations manage their own transactions with the helpers below, so that
+work on large tables is split into short write transactions instead of one
+long lock:
+
+- add_column() is ALTER TABLE ... ADD COLUMN, which only rewrites the schema
+  entry, not the table, whatever its size
+- backfill() fills a column in rowid ranges of BACKFILL_BATCH rows, one
+  transaction each, pausing between them so waiting writers get in
+- create_index() builds each index in its own transaction
+
+test_scripts/migration_check.py runs add_column() and an interrupted
+backfill() against a seeded orders table to check the above.
+
+Under WAL, readers keep going throughout; writers wait for at most one batch
+or one index build. A migration can be interrupted between transactions, or
+run by two workers starting together, so each one must be safe to run again
+(IF NOT EXISTS, backfills that skip filled rows).
+"""
+import argparse
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import analytics
+import archive
+import catalogue
+import idempotency
+import order_view
+import search
+from db import BUSY_TIMEOUT_MS, DB_PATH
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "database_schema.sql")
+BACKFILL_BATCH = 10000
+# Pause between backfill batches. A blocked writer's busy handler polls at
+# growing intervals, so without a gap the backfill would take the lock again
+# first every time; 20 ms kept writer waits on 1M orders under 40 ms here.
+BACKFILL_PAUSE_SECONDS = 0.02
+
+# (version, name, function), in version order
+MIGRATIONS = []
+
+
+def migration(version: int, name: str):
+    def register(fn):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"migration {version} registered out of order")
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return register
+
+
+@contextmanager
+def transaction(conn):
+    """BEGIN IMMEDIATE ... COMMIT, rolled back if the block raises"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def split_statements(script: str):
+    """Yield the complete SQL statements of a script, in order
+
+    sqlite3.complete_statement understands quoting and comments, so a ';'
+    inside a string literal does not end a statement.
+    """
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement.strip()
+            statement = ""
+    # A last statement without its ';' (anything but comments) still runs
+    remainder = "\n".join(line for line in statement.splitlines() if not line.strip().startswith("--")).strip()
+    if remainder:
+        yield remainder
+
+
+def table_exists(conn, table: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+
+def column_exists(conn, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def add_column(conn, table: str, column: str, definition: str):
+    """Add a column if it is missing; constant defaults only, so no table rewrite"""
+    with transaction(conn):
+        if not column_exists(conn, table, column):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def backfill(conn, table: str, assignments: str, where: str, batch_size: int = BACKFILL_BATCH) -> int:
+    """UPDATE table SET assignments WHERE where, one rowid range per transaction
+
+    `where` should exclude rows that are already filled, so an interrupted
+    backfill resumes cheaply. Returns the number of rows updated.
+    """
+    last = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()[0]
+    updated = 0
+    for low in range(0, last, batch_size):
+        with transaction(conn):
+            updated += conn.execute(
+                f"UPDATE {table} SET {assignments} WHERE rowid > ? AND rowid <= ? AND ({where})",
+                (low, low + batch_size),
+            ).rowcount
+        time.sleep(BACKFILL_PAUSE_SECONDS)
+    return updated
+
+
+def create_index(conn, name: str, table: str, columns: str, where: str = None):
+    """CREATE INDEX IF NOT EXISTS in a transaction of its own"""
+    with transaction(conn):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({columns})"
+                     + (f" WHERE {where}" if where else ""))
+
+
+def drop_index(conn, name: str):
+    with transaction(conn):
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+@migration(1, "initial schema")
+def initial_schema(conn):
+    with open(SCHEMA_PATH) as f:
+        statements = list(split_statements(f.read()))
+    with transaction(conn):
+        # Databases created before migrations existed already have it
+        if table_exists(conn, "users"):
+            return
+        for statement in statements:
+            conn.execute(statement)
+
+
+@migration(2, "keyset pagination indexes for the order list")
+def order_list_indexes(conn):
+    # Composite (filter, created_at) indexes serve the keyset-paginated order list;
+    # the implicit trailing rowid makes ORDER BY created_at DESC, id DESC index-ordered
+    create_index(conn, "idx_orders_created", "orders", "created_at")
+    create_index(conn, "idx_orders_customer_created", "orders", "customer_id, created_at")
+    create_index(conn, "idx_orders_provider_created", "orders", "provider_id, created_at")
+    create_index(conn, "idx_orders_status_created", "orders", "status, created_at")
+    create_index(conn, "idx_orders_service_type_created", "orders", "service_type_id, created_at")
+    # Covered by the composite indexes above
+    for name in ("idx_orders_customer_id", "idx_orders_provider_id", "idx_orders_status"):
+        drop_index(conn, name)
+
+
+@migration(3, "order analytics rollups")
+def order_analytics(conn):
+    # Filled from orders in the same transaction, so no order write can be
+    # missed between the fill and the incremental updates taking over
+    with transaction(conn):
+        if table_exists(conn, "order_daily_stats"):
+            return
+        conn.execute("""
+            CREATE TABLE order_daily_stats (
+                day TEXT NOT NULL,
+                service_type_id INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                order_count INTEGER NOT NULL DEFAULT 0,
+                value_cents INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, service_type_id, status)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE TABLE provider_daily_stats (
+                provider_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                service_type_id INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                order_count INTEGER NOT NULL DEFAULT 0,
+                value_cents INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (provider_id, day, service_type_id, status)
+            ) WITHOUT ROWID
+        """)
+        analytics.add_orders(conn)
+
+
+@migration(4, "revoked access and refresh tokens")
+def revoked_tokens(conn):
+    # AUTOINCREMENT so ids are never reused after expired rows are purged;
+    # processes pick up new revocations by id
+    with transaction(conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS revoked_tokens (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                jti TEXT NOT NULL UNIQUE,
+                expires_at INTEGER NOT NULL
+            )
+        """)
+
+
+@migration(5, "full-text search over services and orders")
+def full_text_search(conn):
+    # Triggers keep both indexes in step with every write path; they are
+    # created and the indexes filled in one transaction so none is missed
+    with transaction(conn):
+        if table_exists(conn, "service_search"):
+            return
+        for statement in search.SCHEMA:
+            conn.execute(statement)
+        search.rebuild(conn)
+
+
+@migration(6, "indexes found missing by the query plan check")
+def query_plan_indexes(conn):
+    # Active providers, listed for every availability request; the implicit
+    # trailing rowid keeps them in id order
+    create_index(conn, "idx_users_provider_active", "users", "is_provider, is_active")
+    # Purge of expired revocations on every logout and refresh
+    create_index(conn, "idx_revoked_tokens_expires_at", "revoked_tokens", "expires_at")
+
+
+@migration(7, "order archive tables")
+def order_archive(conn):
+    with transaction(conn):
+        for statement in archive.SCHEMA:
+            conn.execute(statement)
+    # Archival moves and the history endpoint look up history rows by order
+    create_index(conn, "idx_order_status_history_order", "order_status_history", "order_id")
+
+
+@migration(8, "order read model")
+def order_read_model(conn):
+    # Filled in the same transaction as it is created, like the rollups, so
+    # no order write is missed; the indexes follow one transaction each
+    with transaction(conn):
+        if not table_exists(conn, "order_view"):
+            for statement in order_view.SCHEMA:
+                conn.execute(statement)
+            order_view.add_orders(conn)
+    for name, columns in order_view.INDEXES:
+        create_index(conn, name, "order_view", columns)
+    # The order list's, now on order_view; customer and status lookups on
+    # orders remain (order_search_customer, archival)
+    for name in ("idx_orders_provider_created", "idx_orders_service_type_created"):
+        drop_index(conn, name)
+
+
+@migration(9, "idempotency keys")
+def idempotency_keys(conn):
+    with transaction(conn):
+        for statement in idempotency.SCHEMA:
+            conn.execute(statement)
+
+
+@migration(10, "provider keys in the order search index")
+def order_search_owner_keys(conn):
+    # Rebuilt in one transaction, like the first version, so no order write
+    # is missed; databases created since have it already
+    with transaction(conn):
+        if column_exists(conn, "order_search", "owner_keys"):
+            return
+        for name in search.ORDER_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute("DROP TABLE order_search")
+        for statement in search.ORDER_SCHEMA:
+            conn.execute(statement)
+        search.add_orders(conn)
+
+
+@migration(11, "catalogue version")
+def catalogue_version(conn):
+    with transaction(conn):
+        for statement in catalogue.SCHEMA:
+            conn.execute(statement)
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1][0]
+
+
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db_path: str = DB_PATH) -> list:
+    """Apply pending migrations; returns the (version, name) pairs applied"""
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=BUSY_TIMEOUT_MS / 1000)
+    try:
+        if schema_version(conn) >= latest_version():
+            return []
+
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                duration_ms REAL,
+                applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        applied = []
+        for version, name, fn in MIGRATIONS:
+            if version <= schema_version(conn):
+                continue
+            started = time.perf_counter()
+            fn(conn)
+            with transaction(conn):
+                # Another process may have finished it meanwhile
+                if version > schema_version(conn):
+                    conn.execute("INSERT OR REPLACE INTO schema_migrations (version, name, duration_ms) VALUES (?, ?, ?)",
+                                 (version, name, (time.perf_counter() - started) * 1000))
+                    conn.execute(f"PRAGMA user_version = {version}")
+            applied.append((version, name))
+        return applied
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending MyClean schema migrations")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--status", action="store_true", help="list migrations without applying any")
+    args = parser.parse_args()
+
+    if args.status:
+        conn = sqlite3.connect(args.db)
+        current = schema_version(conn)
+        conn.close()
+        for version, name, _ in MIGRATIONS:
+            print(f"{version:4d}  {'applied' if version <= current else 'pending':8}  {name}")
+        return
+
+    started = time.perf_counter()
+    applied = migrate(args.db)
+    for version, name in applied:
+        print(f"Applied migration {version}: {name}")
+    print(f"Schema at version {latest_version()} ({time.perf_counter() - started:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
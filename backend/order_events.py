@@ -0,0 +1,182 @@
+"""
+Order status change events for the server-sent events stream
+
+update_order_status() and the bulk status endpoint publish one event per
+order_status_history row after their transaction commits. Each open
+GET /api/orders/events connection holds a Subscriber: a small queue
+registered under the customer or provider it follows, so publishing costs
+one dict lookup per order and an idle connection costs no thread and no
+polling, only its queue and a heartbeat every HEARTBEAT_SECONDS.
+
+Event ids are order_status_history ids. A client reconnecting with
+Last-Event-ID is first sent the rows it missed, read from the history
+table, then live events from its queue, skipping any it has already seen.
+A subscriber that falls more than QUEUE_SIZE events behind is disconnected
+rather than buffered without bound; it resumes the same way.
+
+In a single process, events reach the streams straight from the endpoint
+that made the change. With several worker processes a change may have been
+made by any of them, so each process instead polls the history table every
+poll_seconds (see poll()) and publishing from the endpoints is skipped;
+events then arrive up to poll_seconds late, still in id order.
+"""
+import asyncio
+
+import orjson
+
+HEARTBEAT_SECONDS = 15
+QUEUE_SIZE = 1000
+# History rows per query while replaying to a resuming client
+REPLAY_BATCH = 500
+# Client reconnection delay suggested in the stream's first message
+RETRY_MS = 3000
+# History polling interval when running with several worker processes
+POLL_SECONDS = 0.5
+
+
+def history_event(row) -> dict:
+    """Event payload for an order_status_history row joined with its order"""
+    return {
+        "id": row["id"],
+        "order_id": row["order_id"],
+        "customer_id": row["customer_id"],
+        "provider_id": row["provider_id"],
+        "old_status": row["old_status"],
+        "new_status": row["new_status"],
+        "changed_at": row["created_at"],
+    }
+
+
+def format_event(event: dict) -> bytes:
+    return b"id: %d\nevent: order_status\ndata: %s\n\n" % (event["id"], orjson.dumps(event))
+
+
+def fetch_history(conn, after_id: int, customer_id: int = None, provider_id: int = None,
+                  limit: int = REPLAY_BATCH) -> list:
+    """Events after history id after_id for the given customer or provider, oldest first"""
+    # The unary + keeps idx_order_status_history_order out of the plan: walking
+    # the history from after_id is cheap, reading all of a provider's is not
+    sql = """
+        SELECT h.id, h.order_id, h.old_status, h.new_status, h.created_at, o.customer_id, o.provider_id
+        FROM order_status_history h
+        JOIN orders o ON o.id = +h.order_id
+        WHERE h.id > ?
+    """
+    params = [after_id]
+    if customer_id is not None:
+        sql += " AND o.customer_id = ?"
+        params.append(customer_id)
+    if provider_id is not None:
+        sql += " AND o.provider_id = ?"
+        params.append(provider_id)
+    sql += " ORDER BY h.id LIMIT ?"
+    params.append(limit)
+    return [history_event(row) for row in conn.execute(sql, params)]
+
+
+def latest_history_id(conn) -> int:
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM order_status_history").fetchone()[0]
+
+
+def recorded_events(conn, first_id: int) -> list:
+    """Events for the history rows written from id first_id on (called inside the write)"""
+    return fetch_history(conn, first_id - 1, limit=-1)
+
+
+class Subscriber:
+    def __init__(self, key: tuple):
+        self.key = key
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class OrderEventBroker:
+    """Fans committed status changes out to the subscribers of each order's customer and provider"""
+
+    def __init__(self, poll_seconds: float = None):
+        # Set when other processes also write orders; events then come from poll()
+        self.poll_seconds = poll_seconds
+        self._subscribers = {}
+
+    def __len__(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def subscribe(self, customer_id: int = None, provider_id: int = None) -> Subscriber:
+        key = ("customer", customer_id) if customer_id is not None else ("provider", provider_id)
+        subscriber = Subscriber(key)
+        self._subscribers.setdefault(key, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._subscribers.get(subscriber.key)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[subscriber.key]
+
+    def publish(self, events: list):
+        """Called on the event loop, after the transaction that wrote the events committed"""
+        if self.poll_seconds is None:
+            self._deliver(events)
+
+    def _deliver(self, events: list):
+        for event in events:
+            for key in (("customer", event["customer_id"]), ("provider", event["provider_id"])):
+                for subscriber in self._subscribers.get(key, ()):
+                    subscriber.deliver(event)
+
+    async def poll(self, db):
+        """Deliver history rows written by any process, until cancelled
+
+        History ids are assigned inside the database write lock, so they
+        commit in id order and reading past the last one seen misses none.
+        """
+        last_id = await db.read(latest_history_id)
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            while True:
+                events = await db.read(fetch_history, last_id)
+                if events:
+                    last_id = events[-1]["id"]
+                    self._deliver(events)
+                if len(events) < REPLAY_BATCH:
+                    break
+
+    async def stream(self, db, last_event_id: int = None, customer_id: int = None, provider_id: int = None):
+        """SSE body: events after last_event_id from the history table, then live ones until disconnect
+
+        Without last_event_id only changes made from now on are sent.
+        """
+        # Subscribe before reading so nothing committed meanwhile is lost;
+        # the queue may then repeat events already sent, which are skipped by id
+        subscriber = self.subscribe(customer_id, provider_id)
+        try:
+            yield b"retry: %d\n\n" % RETRY_MS
+            if last_event_id is None:
+                last_event_id = await db.read(latest_history_id)
+            while True:
+                events = await db.read(fetch_history, last_event_id, customer_id, provider_id)
+                for event in events:
+                    yield format_event(event)
+                if events:
+                    last_event_id = events[-1]["id"]
+                if len(events) < REPLAY_BATCH:
+                    break
+
+            while not subscriber.overflowed:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": heartbeat\n\n"
+                    continue
+                if event["id"] > last_event_id:
+                    last_event_id = event["id"]
+                    yield format_event(event)
+        finally:
+            self.unsubscribe(subscriber)
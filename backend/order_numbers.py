@@ -0,0 +1,86 @@
+"""
+Collision-free, time-sortable order numbers
+
+An order number is "MC" followed by 15 Crockford base32 characters encoding
+a 75-bit value laid out Snowflake-style:
+
+    41 bits  milliseconds since ORDER_EPOCH_MS (good for ~69 years)
+    22 bits  process id (Linux pid_max is at most 2**22)
+    12 bits  per-process sequence within the millisecond
+
+Live processes on one host never share a pid, so uvicorn workers cannot
+collide with each other, and within a process the (millisecond, sequence)
+pair only ever increases, so no retry on the UNIQUE constraint is needed.
+Fixed-width base32 in ascending ASCII order makes the strings sort by
+creation time, so inserts into idx_orders_order_number land at the right
+edge of the B-tree instead of at random pages.
+"""
+import os
+import threading
+import time
+
+PREFIX = "MC"
+ORDER_EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+
+TIMESTAMP_BITS = 41
+PID_BITS = 22
+SEQUENCE_BITS = 12
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+ENCODED_LENGTH = (TIMESTAMP_BITS + PID_BITS + SEQUENCE_BITS) // 5
+CROCKFORD_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+
+# Every two-character combination, so encoding takes 10 bits per step
+CROCKFORD_PAIRS = [high + low for high in CROCKFORD_ALPHABET for low in CROCKFORD_ALPHABET]
+
+
+def encode_base32(value: int, length: int = ENCODED_LENGTH) -> str:
+    chunks = []
+    if length % 2:
+        chunks.append(CROCKFORD_ALPHABET[value & 31])
+        value >>= 5
+    for _ in range(length // 2):
+        chunks.append(CROCKFORD_PAIRS[value & 1023])
+        value >>= 10
+    return "".join(reversed(chunks))
+
+
+def compose_order_number(timestamp_ms: int, pid: int, sequence: int, prefix: str = PREFIX) -> str:
+    """Order number for a millisecond offset from ORDER_EPOCH_MS, pid and sequence"""
+    value = (timestamp_ms << (PID_BITS + SEQUENCE_BITS)) | (pid << SEQUENCE_BITS) | sequence
+    return prefix + encode_base32(value)
+
+
+class OrderNumberGenerator:
+    """Thread-safe generator of monotonic order numbers for this process"""
+
+    def __init__(self, prefix: str = PREFIX):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def next(self) -> str:
+        with self._lock:
+            now_ms = int(time.time() * 1000) - ORDER_EPOCH_MS
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            elif self._sequence < MAX_SEQUENCE:
+                # Same millisecond, or the clock stepped back: keep counting
+                self._sequence += 1
+            else:
+                # Sequence exhausted: borrow the next millisecond
+                self._last_ms += 1
+                self._sequence = 0
+
+            pid = os.getpid() & ((1 << PID_BITS) - 1)
+            return compose_order_number(self._last_ms, pid, self._sequence, self.prefix)
+
+
+_generator = OrderNumberGenerator()
+
+
+def generate_order_number() -> str:
+    return _generator.next()
@@ -0,0 +1,166 @@
+"""
+Read model of orders for the order list, detail and search endpoints
+
+Usage: python order_view.py --rebuild [--db myclean.db]
+
+order_view holds one row per live order with everything an OrderResponse
+needs: the customer's and the service's names are copied in, so reads do
+not join users and service_types, and dates and times are integers, so
+nothing is parsed and ranges compare as numbers:
+
+- service_day: days since 1970-01-01
+- start_minute, end_minute: minutes after midnight, like availability.py
+- created: seconds since 1970-01-01 UTC, the order list's sort key
+
+Each list filter is served by one (filter, created) index, and a detail
+read is a primary key lookup. The rows are written in the same transaction
+as the orders they mirror: insert_orders() calls add_orders() for the ids it
+inserted and apply_status_changes() calls set_statuses(); archive.py deletes
+the rows of orders it moves. Renaming a customer or a service, which the
+order write paths never do, is handled by the triggers in SCHEMA.
+
+Service times are stored to the minute, as bookings are made; seconds given
+with a start time are not kept. --rebuild recomputes the table from orders.
+"""
+import argparse
+import sqlite3
+from datetime import date
+from functools import lru_cache
+
+from db import DB_PATH
+
+UNIX_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# "HH:MM:SS" for every minute of the day
+CLOCK = [f"{minute // 60:02d}:{minute % 60:02d}:00" for minute in range(24 * 60)]
+
+_CUSTOMER_NAME = "CASE WHEN u.first_name != '' THEN u.first_name || ' ' || COALESCE(u.last_name, '') ELSE 'Unknown' END"
+
+
+def _minute(column: str) -> str:
+    """SQL for the minute after midnight of an 'HH:MM[:SS]' column"""
+    return f"(CAST(substr({column}, 1, 2) AS INTEGER) * 60 + CAST(substr({column}, 4, 2) AS INTEGER))"
+
+
+# order_view's columns computed from an orders-shaped table aliased o
+PROJECTION = f"""
+    SELECT o.id, o.order_number, o.customer_id, o.provider_id, o.service_type_id,
+           {_CUSTOMER_NAME} AS customer_name, st.name AS service_type_name,
+           CAST(julianday(o.service_date) - 2440587.5 AS INTEGER) AS service_day,
+           {_minute("o.service_time_start")} AS start_minute, {_minute("o.service_time_end")} AS end_minute,
+           o.total_price, o.status, COALESCE(CAST(strftime('%s', o.created_at) AS INTEGER), 0) AS created
+"""
+
+# Applied by migration 8, together with INDEXES
+SCHEMA = (
+    """
+    CREATE TABLE order_view (
+        id INTEGER PRIMARY KEY,
+        order_number TEXT NOT NULL,
+        customer_id INTEGER,
+        provider_id INTEGER,
+        service_type_id INTEGER,
+        customer_name TEXT NOT NULL,
+        service_type_name TEXT,
+        service_day INTEGER NOT NULL,
+        start_minute INTEGER NOT NULL,
+        end_minute INTEGER NOT NULL,
+        total_price REAL NOT NULL,
+        status TEXT,
+        created INTEGER NOT NULL
+    )
+    """,
+    f"""
+    CREATE TRIGGER order_view_customer AFTER UPDATE OF first_name, last_name ON users BEGIN
+        UPDATE order_view SET customer_name = (SELECT {_CUSTOMER_NAME} FROM users u WHERE u.id = new.id)
+        WHERE customer_id = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER order_view_service AFTER UPDATE OF name ON service_types BEGIN
+        UPDATE order_view SET service_type_name = new.name WHERE service_type_id = new.id;
+    END
+    """,
+)
+
+# (name, columns): the order list's filters, each followed by its sort key
+INDEXES = (
+    ("idx_order_view_created", "created"),
+    ("idx_order_view_customer_created", "customer_id, created"),
+    ("idx_order_view_provider_created", "provider_id, created"),
+    ("idx_order_view_status_created", "status, created"),
+    ("idx_order_view_service_type_created", "service_type_id, created"),
+)
+
+# What an OrderResponse is built from, plus who may read it and the list's sort key
+COLUMNS = """
+    id, order_number, customer_name, service_day, start_minute, end_minute, total_price, status,
+    service_type_name, customer_id, provider_id, created
+"""
+
+
+def add_orders(conn, first_id: int = 0):
+    """Project every order with id >= first_id, in one statement"""
+    conn.execute(f"""
+        INSERT INTO order_view (id, order_number, customer_id, provider_id, service_type_id, customer_name,
+                                service_type_name, service_day, start_minute, end_minute, total_price,
+                                status, created)
+        {PROJECTION}
+        FROM orders o
+        LEFT JOIN users u ON u.id = o.customer_id
+        LEFT JOIN service_types st ON st.id = o.service_type_id
+        WHERE o.id >= ?
+    """, (first_id,))
+
+
+def set_statuses(conn, statuses: list):
+    """Apply (status, order_id) pairs"""
+    conn.executemany("UPDATE order_view SET status = ? WHERE id = ?", statuses)
+
+
+def rebuild(conn):
+    conn.execute("DELETE FROM order_view")
+    add_orders(conn)
+
+
+def fetch_order(conn, order_id: int):
+    """COLUMNS of one order; archived orders are projected from orders_archive on the fly"""
+    row = conn.execute(f"SELECT {COLUMNS} FROM order_view WHERE id = ?", (order_id,)).fetchone()
+    if row is None:
+        row = conn.execute(f"""
+            SELECT {COLUMNS} FROM ({PROJECTION}
+                FROM orders_archive o
+                LEFT JOIN users u ON u.id = o.customer_id
+                LEFT JOIN service_types st ON st.id = o.service_type_id
+                WHERE o.id = ?)
+        """, (order_id,)).fetchone()
+    return row
+
+
+@lru_cache(maxsize=4096)
+def day_to_iso(day: int) -> str:
+    return date.fromordinal(day + UNIX_EPOCH_ORDINAL).isoformat()
+
+
+def day_number(value: date) -> int:
+    return value.toordinal() - UNIX_EPOCH_ORDINAL
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the MyClean order read model")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--rebuild", action="store_true", help="recompute order_view from orders")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    conn = sqlite3.connect(args.db)
+    with conn:
+        rebuild(conn)
+    count = conn.execute("SELECT COUNT(*) FROM order_view").fetchone()[0]
+    print(f"Rebuilt order_view: {count} rows")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Order write paths shared by the single-order and bulk endpoints
+
+Both helpers take a whole batch, validate each item, then write every
+valid item with executemany inside the caller's transaction. An item that
+fails validation is reported by returning the HTTPException it would have
+raised on its own; it does not abort the rest of the batch. The single-order
+endpoints call them with a batch of one and raise that exception.
+"""
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+
+import order_view
+from analytics import RollupDelta
+from availability import AvailabilityIndex, interval
+from order_events import recorded_events
+from order_numbers import generate_order_number
+
+VALID_STATUSES = ['pending', 'confirmed', 'in_progress', 'completed', 'cancelled']
+
+# Ids per IN (...) lookup, well under SQLite's bound-variable limit
+LOOKUP_CHUNK = 500
+
+
+def _chunks(items: list, size: int = LOOKUP_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _placeholders(values) -> str:
+    return ", ".join("?" * len(values))
+
+
+def _free_provider(availability: AvailabilityIndex, batch_bookings: AvailabilityIndex, provider_ids: list,
+                   service_date: str, slot: tuple):
+    """The provider free for slot with the fewest bookings that day, lowest id first; None if all are busy"""
+    best, best_count = None, None
+    for provider_id in provider_ids:
+        if (availability.conflicts(provider_id, service_date, *slot)
+                or batch_bookings.conflicts(provider_id, service_date, *slot)):
+            continue
+        count = (availability.booking_count(provider_id, service_date)
+                 + batch_bookings.booking_count(provider_id, service_date))
+        if best is None or count < best_count:
+            best, best_count = provider_id, count
+    return best
+
+
+def insert_orders(conn, availability: AvailabilityIndex, orders: list, customer_id: int = None) -> list:
+    """Price, check and insert OrderCreate items
+
+    The orders are booked for customer_id or, without it, for each item's
+    own customer_id (OrderImport items), which must be an existing user.
+    An item without a provider_id is assigned the active provider who is
+    free at that time and has the fewest bookings that day, so that every
+    order has a provider to confirm it. Returns, per item, an
+    OrderResponse-shaped dict or an HTTPException.
+    """
+    # Pricing for every service in the batch
+    pricing = {}
+    service_ids = sorted({order.service_type_id for order in orders})
+    for chunk in _chunks(service_ids):
+        for row in conn.execute(f"""
+            SELECT st.id as service_type_id, sd.id as duration_id, st.base_price, st.name,
+                   sd.duration_minutes, sd.price_multiplier
+            FROM service_types st
+            JOIN service_durations sd ON sd.service_type_id = st.id
+            WHERE st.id IN ({_placeholders(chunk)})
+        """, chunk):
+            pricing[(row["service_type_id"], row["duration_id"])] = row
+
+    providers = set()
+    provider_ids = sorted({order.provider_id for order in orders if order.provider_id is not None})
+    for chunk in _chunks(provider_ids):
+        rows = conn.execute(f"SELECT id FROM users WHERE is_provider = 1 AND id IN ({_placeholders(chunk)})", chunk)
+        providers.update(row["id"] for row in rows)
+    # Candidates for the items that leave the provider to us, in id order
+    active_providers = []
+    if any(order.provider_id is None for order in orders):
+        active_providers = [row["id"] for row in conn.execute(
+            "SELECT id FROM users WHERE is_provider = 1 AND is_active = 1 ORDER BY id")]
+
+    # Customer names, as order_view spells them
+    customers = {}
+    customer_ids = sorted({customer_id} if customer_id is not None else {order.customer_id for order in orders})
+    for chunk in _chunks(customer_ids):
+        for row in conn.execute(f"SELECT id, first_name, last_name FROM users WHERE id IN ({_placeholders(chunk)})",
+                                chunk):
+            customers[row["id"]] = (f"{row['first_name']} {row['last_name'] or ''}"
+                                    if row["first_name"] else "Unknown")
+
+    results = [None] * len(orders)
+    accepted = []
+    # Bookings made earlier in this batch, so two items cannot take the same slot
+    batch_bookings = AvailabilityIndex()
+
+    for index, order in enumerate(orders):
+        order_customer_id = customer_id if customer_id is not None else order.customer_id
+        if order_customer_id not in customers:
+            results[index] = HTTPException(status_code=400, detail="Customer not found")
+            continue
+
+        service_data = pricing.get((order.service_type_id, order.service_duration_id))
+        if not service_data:
+            results[index] = HTTPException(status_code=404, detail="Service or duration not found")
+            continue
+
+        # Calculate pricing and end time
+        base_price = service_data["base_price"]
+        total_price = base_price * service_data["price_multiplier"]
+        start_datetime = datetime.combine(order.service_date, order.service_time_start)
+        service_time_end = (start_datetime + timedelta(minutes=service_data["duration_minutes"])).time()
+
+        # Reject the booking if the provider is already busy at that time
+        service_date = str(order.service_date)
+        slot = interval(str(order.service_time_start), str(service_time_end))
+        provider_id = order.provider_id
+        if provider_id is not None and provider_id not in providers:
+            results[index] = HTTPException(status_code=400, detail="Provider not found")
+            continue
+        availability.load_date(conn, service_date)
+        if provider_id is None:
+            provider_id = _free_provider(availability, batch_bookings, active_providers, service_date, slot)
+            if provider_id is None:
+                results[index] = HTTPException(status_code=409, detail="No provider is available at that time")
+                continue
+        elif (availability.conflicts(provider_id, service_date, *slot)
+                or batch_bookings.conflicts(provider_id, service_date, *slot)):
+            results[index] = HTTPException(status_code=409, detail="Provider is already booked at that time")
+            continue
+        batch_bookings.add(provider_id, service_date, *slot, index)
+
+        accepted.append((index, order, order_customer_id, provider_id, generate_order_number(), service_date, slot,
+                         service_time_end, base_price, total_price, service_data["name"]))
+
+    if not accepted:
+        return results
+
+    conn.executemany("""
+        INSERT INTO orders (order_number, customer_id, provider_id, service_type_id, service_duration_id,
+                          service_date, service_time_start, service_time_end, base_price, total_price,
+                          customer_notes)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [
+        (order_number, order_customer_id, provider_id, order.service_type_id, order.service_duration_id,
+         service_date, str(order.service_time_start), str(service_time_end),
+         base_price, total_price, order.customer_notes)
+        for (_, order, order_customer_id, provider_id, order_number, service_date, _, service_time_end, base_price,
+             total_price, _) in accepted
+    ])
+
+    # Order numbers increase monotonically within this process, so one range
+    # scan of idx_orders_order_number recovers every new id
+    order_ids = dict(conn.execute(
+        "SELECT order_number, id FROM orders WHERE order_number BETWEEN ? AND ?",
+        (accepted[0][4], accepted[-1][4])
+    ).fetchall())
+
+    rollups = RollupDelta()
+    for (index, order, order_customer_id, provider_id, order_number, service_date, slot, service_time_end, _,
+         total_price, service_name) in accepted:
+        order_id = order_ids[order_number]
+        rollups.add(service_date, provider_id, order.service_type_id, "pending", total_price)
+        availability.add(provider_id, service_date, *slot, order_id)
+        results[index] = {
+            "id": order_id,
+            "order_number": order_number,
+            "customer_name": customers[order_customer_id],
+            "service_date": service_date,
+            "service_time_start": order_view.CLOCK[slot[0]],
+            "service_time_end": order_view.CLOCK[slot[1] % (24 * 60)],
+            "total_price": float(total_price),
+            "status": "pending",
+            "service_type_name": service_name,
+        }
+    rollups.apply(conn)
+    # Ids are assigned in increasing order and the writer is alone, so the
+    # batch is every order from its first id on
+    order_view.add_orders(conn, min(order_ids.values()))
+    return results
+
+
+def apply_status_changes(conn, availability: AvailabilityIndex, changes: list, changed_by: int,
+                         events: list = None, allowed=None) -> list:
+    """Apply (order_id, new_status) transitions in order
+
+    Writes the orders and order_view updates, the order_status_history rows
+    and the analytics rollup changes with one executemany each. Returns, per item,
+    {"order_id", "old_status", "new_status"} or an HTTPException. If `events`
+    is given, the order events for the history rows written are appended to
+    it, for publishing once the transaction has committed. If `allowed` is
+    given, allowed(order, new_status) is asked about each order (a dict with
+    its customer_id and provider_id) and a refused change gets a 403.
+    """
+    current = {}
+    order_ids = sorted({order_id for order_id, _ in changes})
+    for chunk in _chunks(order_ids):
+        for row in conn.execute(f"""
+            SELECT id, status, customer_id, provider_id, service_type_id, service_date, service_time_start,
+                   service_time_end, total_price
+            FROM orders WHERE id IN ({_placeholders(chunk)})
+        """, chunk):
+            current[row["id"]] = dict(row)
+
+    update_time = datetime.now().isoformat()
+    results = [None] * len(changes)
+    updates = []
+    history = []
+    rollups = RollupDelta()
+
+    for index, (order_id, status) in enumerate(changes):
+        if status not in VALID_STATUSES:
+            results[index] = HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {VALID_STATUSES}")
+            continue
+
+        order = current.get(order_id)
+        if not order:
+            results[index] = HTTPException(status_code=404, detail="Order not found")
+            continue
+        if allowed is not None and not allowed(order, status):
+            results[index] = HTTPException(status_code=403, detail="Not allowed to change this order's status")
+            continue
+
+        # Cancelling frees the provider's slot; reinstating a cancelled order takes it back
+        old_status = order["status"]
+        was_booked = old_status != "cancelled"
+        is_booked = status != "cancelled"
+        provider_id = order["provider_id"]
+        if provider_id is not None and was_booked != is_booked:
+            availability.load_date(conn, order["service_date"])
+            slot = interval(order["service_time_start"], order["service_time_end"])
+            if is_booked:
+                if availability.conflicts(provider_id, order["service_date"], *slot):
+                    results[index] = HTTPException(status_code=409, detail="Provider is already booked at that time")
+                    continue
+                availability.add(provider_id, order["service_date"], *slot, order_id)
+            else:
+                availability.remove(provider_id, order["service_date"], *slot, order_id)
+
+        order["status"] = status
+        rollups.move(order["service_date"], provider_id, order["service_type_id"], old_status, status,
+                     order["total_price"])
+        updates.append((
+            status,
+            update_time,
+            update_time if status == 'confirmed' else None,
+            update_time if status == 'completed' else None,
+            order_id
+        ))
+        history.append((order_id, old_status, status, changed_by, update_time))
+        results[index] = {"order_id": order_id, "old_status": old_status, "new_status": status}
+
+    conn.executemany("""
+        UPDATE orders
+        SET status = ?, updated_at = ?, confirmed_at = ?, completed_at = ?
+        WHERE id = ?
+    """, updates)
+    order_view.set_statuses(conn, [(update[0], update[-1]) for update in updates])
+    first_history_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM order_status_history").fetchone()[0]
+    conn.executemany("""
+        INSERT INTO order_status_history (order_id, old_status, new_status, changed_by, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, history)
+    rollups.apply(conn)
+    if events is not None and history:
+        events.extend(recorded_events(conn, first_history_id))
+    return results
@@ -0,0 +1,120 @@
+"""
+Password hashing for the MyClean backend
+
+Hashes are salted scrypt, stored as
+
+    scrypt$<n>$<r>$<p>$<salt>$<hash>
+
+so each hash carries the cost settings it was made with and the settings
+can be raised later without invalidating existing passwords. Rows still
+holding the original unsalted SHA-256 hex digest are accepted and reported
+by needs_rehash() so login() can upgrade them.
+
+scrypt deliberately burns tens of milliseconds of CPU, so the async helpers
+run it in a process pool: login bursts spread across cores and the event
+loop keeps serving other requests.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Cost settings for new hashes (scrypt needs 128 * N * r bytes, 16 MB here)
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+HASH_BYTES = 32
+SCHEME = "scrypt"
+
+HASH_WORKERS = os.cpu_count() or 2
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.b64encode(raw).decode().rstrip("=")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p, dklen=HASH_BYTES)
+
+
+def hash_password(password: str) -> str:
+    """Salted scrypt hash with the current cost settings"""
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"{SCHEME}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def _is_legacy(hashed: str) -> bool:
+    return not hashed.startswith(SCHEME + "$")
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    """Check a password against a scrypt hash or a legacy SHA-256 digest"""
+    if _is_legacy(hashed):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, hashed)
+
+    try:
+        _, n, r, p, salt, digest = hashed.split("$")
+        expected = _b64decode(digest)
+        actual = _scrypt(password, _b64decode(salt), int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """Whether a stored hash is legacy SHA-256 or uses outdated cost settings"""
+    if _is_legacy(hashed):
+        return True
+    return hashed.split("$")[1:4] != [str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)]
+
+
+# Compared against when the email is unknown, so that case costs the same
+_DUMMY_HASH = f"{SCHEME}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64encode(bytes(SALT_BYTES))}${_b64encode(bytes(HASH_BYTES))}"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn: the server process has threads, which fork does not copy safely
+                _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS,
+                                                mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password() run in the process pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), hash_password, password)
+
+
+async def verify_password_async(password: str, hashed: str = None) -> bool:
+    """verify_password() run in the process pool; hashed=None always fails"""
+    loop = asyncio.get_running_loop()
+    matched = await loop.run_in_executor(_get_executor(), verify_password, password, hashed or _DUMMY_HASH)
+    return matched and hashed is not None
+
+
+def shutdown_executor():
+    """Stop the hashing processes (called on application shutdown)"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
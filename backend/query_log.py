@@ -0,0 +1,224 @@
+"""
+Per-statement SQLite profiling and the slow-query log
+
+Every connection opened by db.connect() is a ProfiledConnection, whose
+cursors time each statement from execute() until its last row is fetched
+(or the cursor is dropped). The time and row count are added to the
+process-wide `query_stats` under the statement's fingerprint: its text with
+literals as ? and IN lists folded, so one query with different values or
+list lengths counts once. Fingerprints are cached by statement text, so the
+cost per statement is two clock reads, a dict lookup and a short locked
+update, a few microseconds.
+
+A statement that takes SLOW_QUERY_MS or longer is also written to the
+"myclean.slow_queries" logger as one JSON object per line, and to the file
+named by MYCLEAN_SLOW_QUERY_LOG when that is set. Bound parameters are left
+out of the log, as they may hold personal data.
+
+Statistics are per process, like /metrics; GET /api/admin/query-stats
+returns them.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import orjson
+
+from query_plans import normalize
+
+# MYCLEAN_QUERY_STATS=0 opens plain connections, without any profiling
+ENABLED = os.environ.get("MYCLEAN_QUERY_STATS", "1") != "0"
+SLOW_QUERY_MS = float(os.environ.get("MYCLEAN_SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG = os.environ.get("MYCLEAN_SLOW_QUERY_LOG")
+FINGERPRINT_CACHE_SIZE = 4096
+
+logger = logging.getLogger("myclean.slow_queries")
+if SLOW_QUERY_LOG:
+    _handler = logging.FileHandler(SLOW_QUERY_LOG)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+
+fingerprint = lru_cache(maxsize=FINGERPRINT_CACHE_SIZE)(normalize)
+
+
+class StatementStats:
+    __slots__ = ("count", "total_seconds", "max_seconds", "rows", "slow")
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.slow = 0
+
+
+class QueryStats:
+    """Execution count, total and max time, rows returned and slow runs per statement fingerprint"""
+
+    # snapshot() sort orders -> the field they sort by
+    SORT_FIELDS = {"total": "total_ms", "max": "max_ms", "mean": "mean_ms", "count": "count",
+                   "rows": "rows", "slow": "slow"}
+
+    def __init__(self, slow_ms: float = SLOW_QUERY_MS):
+        self.slow_seconds = slow_ms / 1000
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._statements = {}
+
+    def record(self, sql: str, seconds: float, rows: int):
+        """Called from any thread when a statement has finished"""
+        key = fingerprint(sql)
+        slow = seconds >= self.slow_seconds
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                stats = self._statements[key] = StatementStats()
+            stats.count += 1
+            stats.total_seconds += seconds
+            stats.rows += rows
+            if seconds > stats.max_seconds:
+                stats.max_seconds = seconds
+            stats.slow += slow
+        if slow:
+            logger.warning(orjson.dumps({
+                "event": "slow_query",
+                "at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                "statement": key,
+                "ms": round(seconds * 1000, 3),
+                "rows": rows,
+                "thread": threading.current_thread().name,
+            }).decode())
+
+    def snapshot(self, sort: str = "total", limit: int = None) -> list:
+        """Per-statement statistics, largest first by the SORT_FIELDS entry `sort`"""
+        with self._lock:
+            statements = [{
+                "statement": key,
+                "count": stats.count,
+                "total_ms": round(stats.total_seconds * 1000, 3),
+                "mean_ms": round(stats.total_seconds * 1000 / stats.count, 3),
+                "max_ms": round(stats.max_seconds * 1000, 3),
+                "rows": stats.rows,
+                "slow": stats.slow,
+            } for key, stats in self._statements.items()]
+        field = self.SORT_FIELDS[sort]
+        statements.sort(key=lambda statement: statement[field], reverse=True)
+        return statements[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._statements = {}
+            self.started_at = time.time()
+
+
+query_stats = QueryStats()
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor adding each statement's time and rows to query_stats once it is finished
+
+    A statement is finished when a fetch runs out of rows, or when the cursor
+    executes the next statement, is closed or is garbage collected, whichever
+    comes first.
+    """
+
+    _sql = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._start(sql, time.perf_counter() - started)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._start(sql, time.perf_counter() - started)
+        return self
+
+    def _start(self, sql, seconds):
+        self._sql = sql
+        self._seconds = seconds
+        self._rows = 0
+        if self.description is None:
+            # Nothing to fetch: the statement ran to completion in execute()
+            self._finish()
+
+    def _finish(self):
+        if self._sql is not None:
+            query_stats.record(self._sql, self._seconds, self._rows)
+            self._sql = None
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        if self._sql is not None:
+            self._seconds += time.perf_counter() - started
+            if row is None:
+                self._finish()
+            else:
+                self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._sql is not None:
+            self._seconds += time.perf_counter() - started
+            self._rows += len(rows)
+            if len(rows) < (self.arraysize if size is None else size):
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        if self._sql is not None:
+            self._seconds += time.perf_counter() - started
+            self._rows += len(rows)
+            self._finish()
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            if self._sql is not None:
+                self._seconds += time.perf_counter() - started
+                self._finish()
+            raise
+        if self._sql is not None:
+            self._seconds += time.perf_counter() - started
+            self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            # Module globals may already be gone at interpreter shutdown
+            pass
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements are profiled by ProfiledCursor"""
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -0,0 +1,166 @@
+"""
+EXPLAIN QUERY PLAN checks for the statements the backend runs
+
+StatementLog records, through Database.set_trace_callback(), every statement
+the app executes while a workload runs: one example per distinct statement,
+with literals folded so the same query with other values counts once.
+check() explains each of them against a database (which should be large, or
+the planner's choices do not mean much) and reports:
+
+- a full SCAN of a table, unless the table is in SMALL_TABLES
+- a temporary B-tree built to sort, group or deduplicate rows, unless the
+  statement only reads SMALL_TABLES or is in BOUNDED_SORTS because the rows
+  it sorts are few by design
+
+For each problem it suggests an index made of the columns the statement
+compares with values, then the one it ranges over or orders by. It is a
+starting point for reading the plan, not a substitute.
+"""
+import re
+import threading
+
+# Tables with a fixed handful of rows, which a scan reads faster than an index
+SMALL_TABLES = {"service_categories", "service_types", "service_durations", "schema_migrations"}
+
+# Statements allowed to sort in a temporary B-tree: (fragment of the
+# normalized SQL, why the sorted set stays small)
+BOUNDED_SORTS = [
+    ("FROM order_daily_stats", "one row per day, service and status in the requested range"),
+    ("FROM provider_daily_stats", "one row per day, service and status of one provider in the range"),
+    ("MATCH ?", "full-text results, capped at the search candidate limit"),
+]
+
+# Statements that do not read tables, so have no plan worth checking
+_SKIPPED = re.compile(r"^\s*(BEGIN|COMMIT|ROLLBACK|END|SAVEPOINT|RELEASE|PRAGMA|--)", re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_TABLE_REF = re.compile(
+    r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)"
+    r"(?:\s+(?:AS\s+)?(?!(?:WHERE|JOIN|ON|LEFT|INNER|CROSS|NATURAL|GROUP|ORDER|LIMIT|SET|VALUES|USING|"
+    r"INDEXED|NOT|SELECT|DEFAULT|WITH)\b)(\w+))?",
+    re.IGNORECASE,
+)
+_BARE_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def normalize(sql: str) -> str:
+    """Statement text with literals as ? and whitespace collapsed, the key statements are grouped by"""
+    sql = _NUMBER.sub("?", _STRING.sub("?", sql))
+    return _LIST.sub("(?, ...)", " ".join(sql.split()))
+
+
+class StatementLog:
+    """Distinct statements seen by a trace callback, in first-seen order"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # normalized text -> [example with its values, times executed]
+        self.statements = {}
+
+    def __call__(self, sql: str):
+        if _SKIPPED.match(sql):
+            return
+        key = normalize(sql)
+        with self._lock:
+            entry = self.statements.setdefault(key, [sql, 0])
+            entry[1] += 1
+
+    def __len__(self) -> int:
+        return len(self.statements)
+
+
+def explain(conn, sql: str) -> list:
+    """EXPLAIN QUERY PLAN detail lines of sql"""
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+
+def table_aliases(sql: str) -> dict:
+    """alias (or bare table name) -> table for every table the statement names"""
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        aliases[alias or table] = table
+        aliases.setdefault(table, table)
+    return aliases
+
+
+def _columns(conn, table: str) -> set:
+    """Columns of table, less an INTEGER PRIMARY KEY, which every index already ends with"""
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")
+            if not (row[5] == 1 and row[2].upper() == "INTEGER")}
+
+
+def suggest_index(conn, sql: str, table: str, alias: str) -> str:
+    """CREATE INDEX for the columns of table that sql filters by, then orders or ranges over"""
+    columns = _columns(conn, table)
+    # Qualified references when the statement joins, also bare ones when it reads one table
+    qualified = rf"\b{re.escape(alias)}\."
+    prefix = qualified if len(set(table_aliases(sql).values())) > 1 else rf"(?<![\w.])(?:{qualified})?"
+    equal = re.findall(prefix + r"(\w+)\s*(?:=\s*\?|IN\s*\()", sql, re.IGNORECASE)
+    ranged = re.findall(prefix + r"(\w+)\s*(?:[<>]=?\s*\?|BETWEEN\b)", sql, re.IGNORECASE)
+    order_by = re.search(r"\bORDER BY\s+(.*?)(?:\bLIMIT\b|$)", sql, re.IGNORECASE | re.DOTALL)
+    ordered = re.findall(prefix + r"(\w+)", order_by.group(1)) if order_by else []
+
+    chosen = []
+    for column in equal + (ranged or ordered)[:1]:
+        if column in columns and column not in chosen:
+            chosen.append(column)
+    if not chosen:
+        return None
+    return f"CREATE INDEX idx_{table}_{'_'.join(chosen)} ON {table}({', '.join(chosen)})"
+
+
+def bounded_sort(sql: str):
+    """Why sql may sort in a temporary B-tree, or None"""
+    for fragment, reason in BOUNDED_SORTS:
+        if fragment in sql:
+            return reason
+    return None
+
+
+def check_statement(conn, sql: str) -> list:
+    """Problems in the plan of one statement, as dicts with a detail and a suggested index"""
+    key = normalize(sql)
+    aliases = table_aliases(key)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    problems = []
+    for detail in explain(conn, sql):
+        scan = _BARE_SCAN.match(detail)
+        if scan:
+            alias = scan.group(1)
+            table = aliases.get(alias, alias)
+            if table not in tables or table in SMALL_TABLES:
+                continue
+            problems.append({"problem": "full scan", "detail": detail,
+                             "suggestion": suggest_index(conn, key, table, alias)})
+        elif detail.startswith("USE TEMP B-TREE") and not bounded_sort(key):
+            large = [(alias, table) for alias, table in aliases.items()
+                     if table in tables and table not in SMALL_TABLES]
+            if not large:
+                continue
+            suggestion = None
+            for alias, table in large:
+                suggestion = suggest_index(conn, key, table, alias)
+                if suggestion:
+                    break
+            problems.append({"problem": "temp b-tree", "detail": detail, "suggestion": suggestion})
+    return problems
+
+
+def check(conn, statements: dict) -> list:
+    """check_statement() over StatementLog.statements; returns one report entry per statement
+
+    Each entry holds the normalized statement, how often it ran, its plan and
+    its problems; a statement that fails to prepare is reported as an error.
+    """
+    report = []
+    for key, (example, count) in statements.items():
+        entry = {"statement": key, "executions": count}
+        try:
+            entry["plan"] = explain(conn, example)
+            entry["problems"] = check_statement(conn, example)
+        except Exception as exc:
+            entry["plan"] = []
+            entry["problems"] = [{"problem": "error", "detail": str(exc), "suggestion": None}]
+        report.append(entry)
+    return report
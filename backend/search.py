@@ -0,0 +1,224 @@
+"""
+Full-text search over the service catalogue and orders with SQLite FTS5
+
+Usage: python search.py --rebuild [--db myclean.db]
+
+service_search indexes each service's name, description and category name;
+order_search indexes each order's customer name, customer notes and provider
+notes. Both use the indexed table's id as their rowid and are kept in step
+by the triggers in SCHEMA, so every write path (the API, bulk imports, the
+data generator) updates them in the same transaction as the row itself.
+
+Queries are built from the words of the search text: every word must match,
+the last one as a prefix so results appear while typing. Results are ranked
+with bm25, weighted towards names. Only the words' posting lists are read,
+never the tables, and two bounds keep common words cheap at millions of
+orders:
+
+- an order search ranks only the SEARCH_CANDIDATES newest matches, so a
+  word found in 50,000 orders costs about as much as one found in 2,000
+- each order row also holds its customer as a "c<id>" token and its
+  provider as a "p<id>" token in owner_keys, so a customer's or a
+  provider's search is an AND with that short posting list instead of a
+  filter over every match
+
+--rebuild recomputes both indexes from their tables.
+"""
+import argparse
+import re
+import sqlite3
+
+import order_view
+from db import DB_PATH
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# Newest matching orders ranked per search
+SEARCH_CANDIDATES = 2000
+# Shorter last words are matched whole: a one-letter prefix matches most of the index
+MIN_PREFIX_LENGTH = 2
+# bm25 column weights, in column order
+SERVICE_WEIGHTS = (10.0, 1.0, 5.0)
+ORDER_WEIGHTS = (5.0, 1.0, 1.0, 0.0)
+ORDER_TEXT_COLUMNS = "{customer_name customer_notes provider_notes}"
+
+_CUSTOMER_NAME = "TRIM(COALESCE(first_name, '') || ' ' || COALESCE(last_name, ''))"
+
+
+def _owner_keys(order: str) -> str:
+    """SQL for the owner_keys of an orders row"""
+    return f"'c' || {order}.customer_id || COALESCE(' p' || {order}.provider_id, '')"
+
+
+# Applied by migration 5
+SERVICE_SCHEMA = (
+    """
+    CREATE VIRTUAL TABLE service_search USING fts5(
+        name, description, category_name,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER service_search_insert AFTER INSERT ON service_types BEGIN
+        INSERT INTO service_search (rowid, name, description, category_name)
+        VALUES (new.id, new.name, new.description,
+                (SELECT name FROM service_categories WHERE id = new.category_id));
+    END
+    """,
+    """
+    CREATE TRIGGER service_search_update AFTER UPDATE OF name, description, category_id ON service_types BEGIN
+        UPDATE service_search
+        SET name = new.name, description = new.description,
+            category_name = (SELECT name FROM service_categories WHERE id = new.category_id)
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER service_search_delete AFTER DELETE ON service_types BEGIN
+        DELETE FROM service_search WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER service_search_category AFTER UPDATE OF name ON service_categories BEGIN
+        UPDATE service_search SET category_name = new.name
+        WHERE rowid IN (SELECT id FROM service_types WHERE category_id = new.id);
+    END
+    """,
+)
+
+# Applied by migration 5, and by migration 10 in place of its first version
+ORDER_SCHEMA = (
+    """
+    CREATE VIRTUAL TABLE order_search USING fts5(
+        customer_name, customer_notes, provider_notes, owner_keys,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER order_search_insert AFTER INSERT ON orders BEGIN
+        INSERT INTO order_search (rowid, customer_name, customer_notes, provider_notes, owner_keys)
+        VALUES (new.id, (SELECT {_CUSTOMER_NAME} FROM users WHERE id = new.customer_id),
+                new.customer_notes, new.provider_notes, {_owner_keys("new")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER order_search_update AFTER UPDATE OF customer_id, provider_id, customer_notes, provider_notes
+    ON orders BEGIN
+        UPDATE order_search
+        SET customer_name = (SELECT {_CUSTOMER_NAME} FROM users WHERE id = new.customer_id),
+            customer_notes = new.customer_notes, provider_notes = new.provider_notes,
+            owner_keys = {_owner_keys("new")}
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER order_search_delete AFTER DELETE ON orders BEGIN
+        DELETE FROM order_search WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER order_search_customer AFTER UPDATE OF first_name, last_name ON users BEGIN
+        UPDATE order_search SET customer_name = (SELECT {_CUSTOMER_NAME} FROM users WHERE id = new.id)
+        WHERE rowid IN (SELECT id FROM orders WHERE customer_id = new.id);
+    END
+    """,
+)
+
+SCHEMA = SERVICE_SCHEMA + ORDER_SCHEMA
+ORDER_TRIGGERS = ("order_search_insert", "order_search_update", "order_search_delete", "order_search_customer")
+
+
+def rebuild(conn):
+    conn.execute("DELETE FROM service_search")
+    conn.execute("""
+        INSERT INTO service_search (rowid, name, description, category_name)
+        SELECT st.id, st.name, st.description, sc.name
+        FROM service_types st LEFT JOIN service_categories sc ON sc.id = st.category_id
+    """)
+    conn.execute("DELETE FROM order_search")
+    add_orders(conn)
+
+
+def add_orders(conn, first_id: int = 0):
+    """Index every order with id >= first_id in one statement
+
+    For bulk loads that suspend order_search_insert: tokenizing a million
+    orders here takes a fraction of the time the per-row trigger would.
+    """
+    conn.execute(f"""
+        INSERT INTO order_search (rowid, customer_name, customer_notes, provider_notes, owner_keys)
+        SELECT o.id, (SELECT {_CUSTOMER_NAME} FROM users WHERE id = o.customer_id),
+               o.customer_notes, o.provider_notes, {_owner_keys("o")}
+        FROM orders o WHERE o.id >= ?
+    """, (first_id,))
+
+
+def fts_query(text: str):
+    """FTS5 query matching every word of text, the last as a prefix; None if text has no words
+
+    Words are quoted, so FTS5 operators typed by users are searched for
+    literally rather than parsed.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    query = " ".join(f'"{word}"' for word in words)
+    return query + "*" if len(words[-1]) >= MIN_PREFIX_LENGTH else query
+
+
+def search_services(conn, query: str, include_inactive: bool = False, limit: int = SEARCH_LIMIT) -> list:
+    """Service rows matching an fts_query(), best match first"""
+    return conn.execute(f"""
+        SELECT st.id, st.name, st.description, st.base_price, st.duration_minutes, st.is_active,
+               sc.name AS category_name
+        FROM service_search s
+        JOIN service_types st ON st.id = s.rowid
+        JOIN service_categories sc ON sc.id = st.category_id
+        WHERE service_search MATCH ? AND (? OR st.is_active = 1)
+        ORDER BY bm25(service_search, {", ".join(map(str, SERVICE_WEIGHTS))}), st.name
+        LIMIT ?
+    """, (query, include_inactive, limit)).fetchall()
+
+
+def search_orders(conn, query: str, customer_id: int = None, provider_id: int = None,
+                  limit: int = SEARCH_LIMIT) -> list:
+    """order_view rows matching an fts_query(), best match first, optionally one customer's or provider's only"""
+    match = f"{ORDER_TEXT_COLUMNS}: ({query})"
+    if customer_id is not None:
+        match = f"owner_keys:c{int(customer_id)} AND {match}"
+    if provider_id is not None:
+        match = f"owner_keys:p{int(provider_id)} AND {match}"
+    # Rank inside the index, then read only the page of rows returned
+    return conn.execute(f"""
+        SELECT {order_view.COLUMNS}
+        FROM (SELECT rowid, score FROM (
+                  SELECT rowid, bm25(order_search, {", ".join(map(str, ORDER_WEIGHTS))}) AS score
+                  FROM order_search WHERE order_search MATCH ?
+                  ORDER BY rowid DESC LIMIT ?)
+              ORDER BY score, rowid DESC LIMIT ?) s
+        JOIN order_view v ON v.id = s.rowid
+        ORDER BY s.score, s.rowid DESC
+    """, (match, SEARCH_CANDIDATES, limit)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the MyClean full-text search indexes")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--rebuild", action="store_true", help="recompute service_search and order_search")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    conn = sqlite3.connect(args.db)
+    with conn:
+        rebuild(conn)
+        conn.execute("INSERT INTO order_search (order_search) VALUES ('optimize')")
+    for table in ("service_search", "order_search"):
+        count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        print(f"Rebuilt {table}: {count} rows")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,49 @@ const api = axios.create({
   },
 })
 
+// Tokens from login/register, sent with every request
+const ACCESS_TOKEN_KEY = 'access_token'
+const REFRESH_TOKEN_KEY = 'refresh_token'
+
+export const tokenStorage = {
+  save: (tokens: AuthTokens) => {
+    localStorage.setItem(ACCESS_TOKEN_KEY, tokens.access_token)
+    localStorage.setItem(REFRESH_TOKEN_KEY, tokens.refresh_token)
+  },
+  clear: () => {
+    localStorage.removeItem(ACCESS_TOKEN_KEY)
+    localStorage.removeItem(REFRESH_TOKEN_KEY)
+  },
+  access: () => localStorage.getItem(ACCESS_TOKEN_KEY),
+  refresh: () => localStorage.getItem(REFRESH_TOKEN_KEY),
+}
+
+api.interceptors.request.use((config) => {
+  const token = tokenStorage.access()
+  if (token) {
+    config.headers.Authorization = `Bearer ${token}`
+  }
+  return config
+})
+
+// Access tokens are short-lived: on a 401, swap the refresh token for a new pair once and retry
+api.interceptors.response.use(undefined, async (error) => {
+  const original = error.config
+  const refreshToken = tokenStorage.refresh()
+  if (error.response?.status !== 401 || !refreshToken || original._retried || original.url === '/auth/refresh') {
+    throw error
+  }
+  original._retried = true
+  try {
+    const response = await api.post('/auth/refresh', { refresh_token: refreshToken })
+    tokenStorage.save(response.data)
+  } catch (refreshError) {
+    tokenStorage.clear()
+    throw error
+  }
+  return api(original)
+})
+
 export interface User {
   id: number
   email: string
@@ -18,6 +61,15 @@ export interface User {
   is_provider: boolean
 }
 
+export interface AuthTokens {
+  access_token: string
+  refresh_token: string
+  token_type: string
+  expires_in: number
+}
+
+export type AuthResponse = User & AuthTokens
+
 export interface ServiceType {
   id: number
   name: string
@@ -62,18 +114,25 @@ export interface OrderCreate {
 
 // Auth API
 export const authAPI = {
-  login: async (email: string, password: string): Promise<User> => {
+  login: async (email: string, password: string): Promise<AuthResponse> => {
     const response = await api.post('/auth/login', { email, password })
     return response.data
   },
 
+  // Takes the tokens explicitly since the caller clears the stored ones straight away
+  logout: async (accessToken: string, refreshToken: string | null): Promise<void> => {
+    await api.post('/auth/logout', refreshToken ? { refresh_token: refreshToken } : undefined, {
+      headers: { Authorization: `Bearer ${accessToken}` },
+    })
+  },
+
   register: async (userData: {
     email: string
     password: string
     phone?: string
     first_name?: string
     last_name?: string
-  }): Promise<User> => {
+  }): Promise<AuthResponse> => {
     const response = await api.post('/auth/register', userData)
     return response.data
   }
@@ -110,6 +169,9 @@ export const servicesAPI = {
   }
 }
 
+// The backend's largest order list page
+const ORDERS_PAGE_SIZE = 500
+
 // Orders API
 export const ordersAPI = {
   createOrder: async (orderData: OrderCreate): Promise<Order> => {
@@ -117,10 +179,17 @@ export const ordersAPI = {
     return response.data
   },
 
+  // The list comes a page at a time: follow X-Next-Cursor until the last page, which has none
   getOrders: async (status?: string): Promise<Order[]> => {
-    const params = status ? { status } : {}
-    const response = await api.get('/orders', { params })
-    return response.data
+    const orders: Order[] = []
+    let cursor: string | undefined
+    do {
+      const params = { limit: ORDERS_PAGE_SIZE, ...(status ? { status } : {}), ...(cursor ? { cursor } : {}) }
+      const response = await api.get('/orders', { params })
+      orders.push(...response.data)
+      cursor = response.headers['x-next-cursor'] as string | undefined
+    } while (cursor)
+    return orders
   },
 
   getOrder: async (orderId: number): Promise<Order> => {
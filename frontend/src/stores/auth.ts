@@ -1,5 +1,5 @@
 import { ref, computed, reactive } from 'vue'
-import { authAPI, type User } from '../services/api'
+import { authAPI, tokenStorage, type AuthResponse, type User } from '../services/api'
 
 // Global reactive state
 const authState = reactive({
@@ -8,6 +8,15 @@ const authState = reactive({
   error: null as string | null
 })
 
+// Keep the tokens for API calls and only the user fields in the user state
+const signIn = (response: AuthResponse): User => {
+  const { access_token, refresh_token, token_type, expires_in, ...user } = response
+  tokenStorage.save({ access_token, refresh_token, token_type, expires_in })
+  authState.user = user
+  localStorage.setItem('user', JSON.stringify(user))
+  return user
+}
+
 // Computed properties
 const isAuthenticated = computed(() => !!authState.user)
 const isProvider = computed(() => authState.user?.is_provider || false)
@@ -25,13 +34,7 @@ const login = async (email: string, password: string) => {
   authState.error = null
 
   try {
-    const userData = await authAPI.login(email, password)
-    authState.user = userData
-
-    // Store user data in localStorage for persistence
-    localStorage.setItem('user', JSON.stringify(userData))
-
-    return userData
+    return signIn(await authAPI.login(email, password))
   } catch (err: any) {
     // Handle axios error response
     if (err.response && err.response.data && err.response.data.detail) {
@@ -56,13 +59,7 @@ const register = async (userData: {
   authState.error = null
 
   try {
-    const newUser = await authAPI.register(userData)
-    authState.user = newUser
-
-    // Store user data in localStorage for persistence
-    localStorage.setItem('user', JSON.stringify(newUser))
-
-    return newUser
+    return signIn(await authAPI.register(userData))
   } catch (err: any) {
     // Handle axios error response
     if (err.response && err.response.data && err.response.data.detail) {
@@ -77,9 +74,15 @@ const register = async (userData: {
 }
 
 const logout = () => {
+  // Revoke the tokens server-side; the local session ends either way
+  const accessToken = tokenStorage.access()
+  if (accessToken) {
+    authAPI.logout(accessToken, tokenStorage.refresh()).catch(() => {})
+  }
   authState.user = null
   authState.error = null
   localStorage.removeItem('user')
+  tokenStorage.clear()
 }
 
 const initializeAuth = () => {
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+MyClean Benchmark Suite
+Reproducible capacity benchmarks for the MyClean API
+
+Usage: python benchmark_suite.py [--sizes 10000 100000 1000000] [--duration 5] [--concurrency 8]
+                                 [--output results.json] [--baseline benchmark_baseline.json]
+                                 [--update-baseline] [--tolerance 0.25]
+
+Starts a throwaway copy of backend/ (the tracked myclean.db is untouched),
+seeds it with backend/data_generator.py, and measures requests/sec and
+p50/p95/p99 latency for:
+
+- catalogue_browse     GET /api/services and /api/services/{id}/durations
+- login_storm          POST /api/auth/login as seeded users
+- order_creation       POST /api/orders
+- mixed_read/write     the load_test.py mix of browsing and order writes
+- order_listing_<N>    paginated GET /api/orders with N orders in the table
+
+Results are written as JSON, with the machine they were measured on. When
+a baseline file recorded on the same hardware (architecture, CPU model and
+core count) exists, each workload is compared with it and the script exits
+non-zero if throughput fell, or p99 latency rose, by more than --tolerance.
+A baseline from other hardware says nothing about this machine, so it is
+not compared against; record one here with --update-baseline.
+"""
+
+import argparse
+import functools
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+
+from load_test import BACKEND_DIR, TEST_ADMIN, auth_headers, launch_backend, prepare_workdir, run_load, summarize
+
+sys.path.insert(0, BACKEND_DIR)
+from data_generator import GENERATED_PASSWORD, generate
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(SCRIPT_DIR, "benchmark_baseline.json")
+
+USERS_PER_ORDER = 0.1
+# Results are only comparable when these meta entries match
+HARDWARE_KEYS = ("machine", "processor", "cpu_count")
+
+
+def seed(db_path, total_orders, seed_value):
+    """Grow the orders table to total_orders rows with backend/data_generator.py"""
+    conn = sqlite3.connect(db_path)
+    existing = conn.execute("SELECT count(*) FROM orders").fetchone()[0]
+    conn.close()
+    added = max(0, total_orders - existing)
+    generate(db_path, users=int(added * USERS_PER_ORDER), orders=added, seed=seed_value + total_orders)
+
+
+def generated_emails(db_path):
+    conn = sqlite3.connect(db_path)
+    emails = [row[0] for row in conn.execute("SELECT email FROM users WHERE email LIKE '%@example.com'")]
+    conn.close()
+    return emails
+
+
+def run_workload(url, duration, concurrency, make_request, headers=None):
+    """Call make_request(session, url, rng) from `concurrency` threads for `duration` seconds"""
+    deadline = time.perf_counter() + duration
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+
+    def worker(slot):
+        rng = random.Random(slot)
+        session = requests.Session()
+        session.headers.update(headers or {})
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                ok = make_request(session, url, rng).status_code < 400
+            except requests.RequestException:
+                ok = False
+            if ok:
+                latencies[slot].append((time.perf_counter() - started) * 1000)
+            else:
+                errors[slot] += 1
+
+    threads = [threading.Thread(target=worker, args=(slot,), daemon=True) for slot in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    result = summarize([ms for samples in latencies for ms in samples], duration)
+    result["errors"] = sum(errors)
+    return result
+
+
+def browse_catalogue(session, url, rng):
+    if rng.random() < 0.5:
+        return session.get(f"{url}/api/services", timeout=30)
+    return session.get(f"{url}/api/services/{rng.randint(1, 6)}/durations", timeout=30)
+
+
+def login(emails, session, url, rng):
+    return session.post(f"{url}/api/auth/login", json={
+        "email": rng.choice(emails), "password": GENERATED_PASSWORD,
+    }, timeout=30)
+
+
+def create_order(session, url, rng):
+    service_date = datetime.now().date() + timedelta(days=rng.randint(1, 365))
+    return session.post(f"{url}/api/orders", json={
+        "service_type_id": 1,
+        "service_duration_id": 1,
+        "service_date": service_date.isoformat(),
+        "service_time_start": f"{rng.randint(8, 17):02d}:00:00",
+    }, timeout=30)
+
+
+def list_orders(session, url, rng):
+    # A mix of first pages, filtered pages and following the cursor one page on
+    params = {"limit": 50}
+    choice = rng.random()
+    if choice < 0.3:
+        params["status"] = rng.choice(["pending", "confirmed", "completed"])
+    elif choice < 0.6:
+        params["customer_id"] = rng.randint(1, 1000)
+    response = session.get(f"{url}/api/orders", params=params, timeout=30)
+    cursor = response.headers.get("X-Next-Cursor")
+    if cursor and rng.random() < 0.5:
+        response = session.get(f"{url}/api/orders", params={**params, "cursor": cursor}, timeout=30)
+    return response
+
+
+def run_suite(args):
+    work_dir = prepare_workdir()
+    db_path = os.path.join(work_dir, "myclean.db")
+    sizes = sorted(args.sizes)
+    seed(db_path, sizes[0], args.seed)
+    emails = generated_emails(db_path)
+    process, url = launch_backend(work_dir, args.port)
+
+    workloads = {}
+    try:
+        def record(name, result):
+            workloads[name] = result
+            print(f"  {name:24} {result['rps']:9.1f} req/s  p50 {result['p50_ms']:7.1f} ms  "
+                  f"p95 {result['p95_ms']:7.1f} ms  p99 {result['p99_ms']:7.1f} ms  errors {result.get('errors', 0)}")
+
+        record("catalogue_browse", run_workload(url, args.duration, args.concurrency, browse_catalogue))
+        record("login_storm", run_workload(url, args.duration, args.concurrency,
+                                                   functools.partial(login, emails)))
+        record("order_creation", run_workload(url, args.duration, args.concurrency, create_order,
+                                              auth_headers(url)))
+        mixed = run_load(url, args.duration, args.concurrency, args.write_ratio)
+        record("mixed_read", {**mixed["read"], "errors": mixed["errors"]})
+        record("mixed_write", mixed["write"])
+
+        for size in sizes:
+            seed(db_path, size, args.seed)
+            # As the administrator, who may list every customer's orders
+            record(f"order_listing_{size}", run_workload(url, args.duration, args.concurrency, list_orders,
+                                                         auth_headers(url, TEST_ADMIN)))
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "processor": cpu_model(),
+            "cpu_count": os.cpu_count(),
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+        },
+        "workloads": workloads,
+    }
+
+
+def cpu_model():
+    """The CPU model name; platform.processor() is empty on most Linux systems"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+def hardware(meta):
+    return {key: meta.get(key) for key in HARDWARE_KEYS}
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of results against baseline, as human-readable lines"""
+    regressions = []
+    for name, base in baseline["workloads"].items():
+        current = results["workloads"].get(name)
+        if current is None:
+            continue
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {current['rps']:.1f} req/s vs baseline {base['rps']:.1f}")
+        if current["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {current['p99_ms']:.1f} ms vs baseline {base['p99_ms']:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MyClean API benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="order table sizes for the order_listing workloads")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per workload")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="write share of the mixed workload")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed fractional drop in req/s or rise in p99 before failing")
+    args = parser.parse_args()
+
+    print(f"Benchmark suite: {args.concurrency} clients, {args.duration:.0f}s per workload, "
+          f"order tables of {', '.join(str(size) for size in sorted(args.sizes))}")
+    results = run_suite(args)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against (run with --update-baseline to store one)")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if hardware(baseline["meta"]) != hardware(results["meta"]):
+        print(f"Baseline was recorded on other hardware ({hardware(baseline['meta'])}, "
+              f"this is {hardware(results['meta'])}); not comparing")
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if not regressions:
+        print(f"No regressions beyond {args.tolerance:.0%} of the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    exit(main())
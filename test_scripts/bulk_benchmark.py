@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+MyClean Bulk Order Benchmark
+Throughput of POST /api/orders/bulk and PUT /api/orders/bulk/status against the 10k transitions/s target
+
+Usage: python bulk_benchmark.py [--orders 10000] [--batch 10000] [--single 300] [--target 10000]
+
+Imports --orders orders into a throwaway copy of backend/ through the bulk
+endpoint, --batch per request, spread over its customers, dates and times
+so that a provider is free for each. All of them are then moved through
+confirmed, in_progress and completed with the bulk status endpoint, and
+--single of them are cancelled one PUT /api/orders/{id}/status call at a
+time for comparison. Requests go through the whole app in-process, so the
+rates include request validation and response encoding but no network.
+Exits non-zero if the bulk transitions are slower than --target per
+second.
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+from load_test import TEST_ADMIN, prepare_workdir
+
+TRANSITIONS = ("confirmed", "in_progress", "completed")
+# One-hour bookings at 08:00 .. 17:00
+START_HOURS = range(8, 18)
+
+
+def import_items(customer_ids, providers, count):
+    """Order items for the bulk import, none of which compete for a provider"""
+    first_day = date.today() + timedelta(days=400)
+    per_day = providers * len(START_HOURS)
+    items = []
+    for index in range(count):
+        items.append({
+            "customer_id": customer_ids[index % len(customer_ids)],
+            "service_type_id": 1,
+            "service_duration_id": 1,
+            "service_date": (first_day + timedelta(days=index // per_day)).isoformat(),
+            "service_time_start": f"{START_HOURS[index % len(START_HOURS)]:02d}:00:00",
+        })
+    return items
+
+
+def timed(client, method, path, batch, key):
+    """Send the batch in one request; (seconds, results)"""
+    started = time.perf_counter()
+    response = client.request(method, path, json={key: batch})
+    elapsed = time.perf_counter() - started
+    response.raise_for_status()
+    return elapsed, response.json()["results"]
+
+
+def run_benchmark(work_dir, args):
+    os.chdir(work_dir)
+    sys.path.insert(0, work_dir)
+    # Every request comes from one client address
+    os.environ.setdefault("MYCLEAN_RATE_LIMITS", "0")
+    # Only administrators import orders
+    os.environ.setdefault("MYCLEAN_ADMIN_EMAILS", TEST_ADMIN["email"])
+    from fastapi.testclient import TestClient
+    import main
+
+    conn = sqlite3.connect("myclean.db")
+    customer_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE is_provider = 0 ORDER BY id")]
+    providers = conn.execute("SELECT count(*) FROM users WHERE is_provider = 1 AND is_active = 1").fetchone()[0]
+    conn.close()
+
+    rows = []
+    with TestClient(main.app) as client:
+        token = client.post("/api/auth/login", json=TEST_ADMIN).json()["access_token"]
+        client.headers["Authorization"] = f"Bearer {token}"
+
+        items = import_items(customer_ids, providers, args.orders)
+        order_ids = []
+        elapsed = 0.0
+        for start in range(0, len(items), args.batch):
+            seconds, results = timed(client, "POST", "/api/orders/bulk", items[start:start + args.batch], "orders")
+            elapsed += seconds
+            order_ids.extend(result["order"]["id"] for result in results if result["status_code"] == 200)
+        if len(order_ids) != len(items):
+            raise RuntimeError(f"only {len(order_ids)} of {len(items)} orders were imported")
+        rows.append(("bulk import", len(items), elapsed))
+
+        for status in TRANSITIONS:
+            elapsed = 0.0
+            for start in range(0, len(order_ids), args.batch):
+                batch = [{"order_id": order_id, "status": status} for order_id in order_ids[start:start + args.batch]]
+                seconds, results = timed(client, "PUT", "/api/orders/bulk/status", batch, "transitions")
+                elapsed += seconds
+                failed = sum(result["status_code"] != 200 for result in results)
+                if failed:
+                    raise RuntimeError(f"{failed} transitions to {status} failed")
+            rows.append((f"bulk -> {status}", len(order_ids), elapsed))
+
+        single = order_ids[:args.single]
+        started = time.perf_counter()
+        for order_id in single:
+            client.put(f"/api/orders/{order_id}/status", params={"status": "cancelled"}).raise_for_status()
+        rows.append(("single -> cancelled", len(single), time.perf_counter() - started))
+
+    main.close_database()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MyClean bulk order benchmark")
+    parser.add_argument("--orders", type=int, default=10000, help="orders imported and transitioned")
+    parser.add_argument("--batch", type=int, default=10000, help="items per bulk request (at most 10000)")
+    parser.add_argument("--single", type=int, default=300, help="orders changed one request at a time")
+    parser.add_argument("--target", type=float, default=10000.0, help="minimum bulk transitions per second")
+    args = parser.parse_args()
+
+    work_dir = prepare_workdir()
+    try:
+        rows = run_benchmark(work_dir, args)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'operation':22}  {'items':>7}  {'seconds':>8}  {'items/s':>9}")
+    for name, items, seconds in rows:
+        print(f"{name:22}  {items:>7}  {seconds:>8.3f}  {items / seconds:>9.0f}")
+
+    transitions = [items / seconds for name, items, seconds in rows if name.startswith("bulk ->")]
+    slowest = min(transitions)
+    print(f"\nSlowest bulk transition rate: {slowest:.0f}/s (target {args.target:.0f}/s)")
+    return 0 if slowest >= args.target else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
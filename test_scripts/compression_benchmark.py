@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+MyClean Compression Benchmark
+CPU cost versus bytes on the wire for each response encoding and level
+
+Usage: python compression_benchmark.py [--orders 20000] [--pages 20 100 500] [--links 1.5 10]
+
+Seeds a throwaway copy of backend/ with --orders orders, fetches the
+catalogue and order list pages of each --pages size in-process, and
+compresses each body with every encoding backend/compression.py supports
+at a fast, the default and the smallest level. For each it prints the
+compressed size, the compression time, and the time to deliver the body
+(compression plus transfer) over links of each --links Mbit/s, with the
+identity encoding as the baseline. Levels marked * are the ones the
+backend compresses responses with per request; levels marked s are the
+ones the catalogue is precompressed with, once per change.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import time
+
+from benchmark_suite import seed
+from load_test import TEST_ADMIN, prepare_workdir
+
+# (encoding, level) pairs tried, fastest first
+LEVELS = {"gzip": (1, 5, 9), "br": (1, 4, 11), "zstd": (1, 3, 19)}
+
+
+def fetch_payloads(work_dir, pages):
+    """(name, body) of the catalogue and of an order list page per size"""
+    os.chdir(work_dir)
+    sys.path.insert(0, work_dir)
+    # Every request comes from one client address
+    os.environ.setdefault("MYCLEAN_RATE_LIMITS", "0")
+    # An administrator lists every customer's orders
+    os.environ.setdefault("MYCLEAN_ADMIN_EMAILS", TEST_ADMIN["email"])
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as client:
+        token = client.post("/api/auth/login", json=TEST_ADMIN).json()["access_token"]
+        identity = {"Accept-Encoding": "identity", "Authorization": f"Bearer {token}"}
+        payloads = [("services", client.get("/api/services?include_inactive=true", headers=identity).content)]
+        for size in pages:
+            payloads.append((f"orders_{size}", client.get(f"/api/orders?limit={size}", headers=identity).content))
+    return payloads
+
+
+def time_compress(compressor, body, level, min_seconds=0.2):
+    """Mean seconds per compression, repeated for at least min_seconds"""
+    runs = 0
+    started = time.perf_counter()
+    while True:
+        compressed = compressor(body, level)
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return compressed, elapsed / runs
+
+
+def transfer_ms(size, mbps):
+    return size * 8 / (mbps * 1000)
+
+
+def run_benchmark(args):
+    work_dir = prepare_workdir()
+    try:
+        seed(os.path.join(work_dir, "myclean.db"), args.orders, args.seed)
+        payloads = fetch_payloads(work_dir, args.pages)
+        from compression import COMPRESSORS, DYNAMIC_LEVELS, STATIC_LEVELS
+
+        missing = [encoding for encoding in LEVELS if encoding not in COMPRESSORS]
+        if missing:
+            print(f"Not installed, skipped: {', '.join(missing)}")
+
+        links = "".join(f"{f'ms @{mbps}Mbit':>14}" for mbps in args.links)
+        for name, body in payloads:
+            print(f"\n{name}: {len(body)} bytes")
+            print(f"{'encoding':<12}{'bytes':>9}{'ratio':>8}{'compress us':>13}{links}")
+            print(f"{'identity':<12}{len(body):>9}{1:>8.2f}{0:>13.1f}"
+                  + "".join(f"{transfer_ms(len(body), mbps):>14.2f}" for mbps in args.links))
+            for encoding, levels in LEVELS.items():
+                if encoding not in COMPRESSORS:
+                    continue
+                for level in levels:
+                    compressed, seconds = time_compress(COMPRESSORS[encoding], body, level)
+                    marks = ("*" if DYNAMIC_LEVELS[encoding] == level else "") + \
+                            ("s" if STATIC_LEVELS[encoding] == level else "")
+                    label = f"{encoding}-{level}{marks}"
+                    print(f"{label:<12}{len(compressed):>9}{len(body) / len(compressed):>8.2f}"
+                          f"{seconds * 1e6:>13.1f}"
+                          + "".join(f"{seconds * 1000 + transfer_ms(len(compressed), mbps):>14.2f}"
+                                    for mbps in args.links))
+    finally:
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response compression benchmark")
+    parser.add_argument("--orders", type=int, default=20000, help="orders seeded before fetching the payloads")
+    parser.add_argument("--pages", type=int, nargs="+", default=[20, 100, 500], help="order list page sizes")
+    parser.add_argument("--links", type=float, nargs="+", default=[1.5, 10.0],
+                        help="link speeds in Mbit/s to estimate delivery time for")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    run_benchmark(args)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+MyClean Backend Load Test
+Mixed read/write traffic against the API, reporting latency percentiles
+
+Usage: python load_test.py [--url URL] [--duration SECONDS] [--concurrency N] [--write-ratio R]
+
+If no backend is running at --url, a throwaway copy of backend/ is started
+with a freshly initialised database, so the tracked myclean.db is untouched.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+
+BACKEND_URL = "http://localhost:8000"
+# Seeded by database_setup.py; orders are placed as this customer
+TEST_CUSTOMER = {"email": "customer@test.com", "password": "password123"}
+# Also seeded; a backend started by launch_backend() makes it an administrator,
+# who may change any order's status
+TEST_ADMIN = {"email": "admin@test.com", "password": "admin123"}
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(samples, duration):
+    """Throughput and latency percentiles of one workload's samples (in ms)"""
+    return {
+        "requests": len(samples),
+        "rps": len(samples) / duration,
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "p99_ms": percentile(samples, 99),
+    }
+
+
+def prepare_workdir():
+    """Copy backend/ to a temporary directory and initialise a fresh database there"""
+    work_dir = tempfile.mkdtemp(prefix="myclean_load_")
+    for name in os.listdir(BACKEND_DIR):
+        path = os.path.join(BACKEND_DIR, name)
+        if os.path.isfile(path) and not name.startswith("myclean.db"):
+            shutil.copy(path, work_dir)
+    subprocess.run([sys.executable, "database_setup.py"], cwd=work_dir, check=True,
+                   stdout=subprocess.DEVNULL)
+    return work_dir
+
+
+def launch_backend(work_dir, port, workers=1):
+    """Run main.py from work_dir with the given number of worker processes and wait until it answers"""
+    process = subprocess.Popen(
+        [sys.executable, "main.py", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+         "--no-rate-limits", "--log-level", "warning"],
+        cwd=work_dir,
+        env={**os.environ, "MYCLEAN_ADMIN_EMAILS": TEST_ADMIN["email"]},
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        time.sleep(0.2)
+        try:
+            if requests.get(f"{url}/api/health", timeout=1).status_code == 200:
+                return process, url
+        except requests.ConnectionError:
+            continue
+    process.terminate()
+    raise RuntimeError("Backend did not start")
+
+
+def start_backend(port):
+    """Start main.py from a temporary copy of the backend directory"""
+    work_dir = prepare_workdir()
+    process, url = launch_backend(work_dir, port)
+    return process, work_dir, url
+
+
+def auth_headers(url, credentials=TEST_CUSTOMER):
+    """Authorization header for a freshly logged-in user"""
+    response = requests.post(f"{url}/api/auth/login", json=credentials, timeout=30)
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def backend_is_up(url):
+    try:
+        return requests.get(f"{url}/api/health", timeout=1).status_code == 200
+    except requests.ConnectionError:
+        return False
+
+
+class Worker(threading.Thread):
+    """Issues requests in a loop until the deadline, recording latencies per kind"""
+
+    def __init__(self, url, deadline, write_ratio, seed, headers, admin_headers):
+        super().__init__(daemon=True)
+        self.url = url
+        self.deadline = deadline
+        self.write_ratio = write_ratio
+        self.random = random.Random(seed)
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        self.admin_headers = admin_headers
+        self.latencies = {"read": [], "write": []}
+        self.errors = 0
+
+    def read(self):
+        path = self.random.choice(["/api/services", "/api/orders", "/api/services/1/durations"])
+        return self.session.get(f"{self.url}{path}", timeout=30)
+
+    def write(self):
+        if self.random.random() < 0.5:
+            service_date = datetime.now().date() + timedelta(days=self.random.randint(1, 365))
+            return self.session.post(f"{self.url}/api/orders", json={
+                "service_type_id": 1,
+                "service_duration_id": 1,
+                "service_date": service_date.isoformat(),
+                "service_time_start": f"{self.random.randint(8, 17):02d}:00:00",
+                "customer_notes": "load test",
+            }, timeout=30)
+        new_status = self.random.choice(["confirmed", "in_progress", "completed"])
+        return self.session.put(f"{self.url}/api/orders/1/status", params={"status": new_status},
+                                headers=self.admin_headers, timeout=30)
+
+    def run(self):
+        while time.perf_counter() < self.deadline:
+            kind = "write" if self.random.random() < self.write_ratio else "read"
+            started = time.perf_counter()
+            try:
+                response = self.write() if kind == "write" else self.read()
+                ok = response.status_code < 500
+            except requests.RequestException:
+                ok = False
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if ok:
+                self.latencies[kind].append(elapsed_ms)
+            else:
+                self.errors += 1
+
+
+def run_load(url, duration, concurrency, write_ratio):
+    headers = auth_headers(url)
+    admin_headers = auth_headers(url, TEST_ADMIN)
+    deadline = time.perf_counter() + duration
+    workers = [Worker(url, deadline, write_ratio, seed, headers, admin_headers) for seed in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    results = {}
+    for kind in ("read", "write"):
+        samples = [ms for worker in workers for ms in worker.latencies[kind]]
+        results[kind] = summarize(samples, duration)
+    results["errors"] = sum(worker.errors for worker in workers)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mixed read/write load test for the MyClean API")
+    parser.add_argument("--url", default=BACKEND_URL)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--port", type=int, default=8765, help="port for a backend started by this script")
+    args = parser.parse_args()
+
+    process = work_dir = None
+    url = args.url
+    if not backend_is_up(url):
+        process, work_dir, url = start_backend(args.port)
+
+    try:
+        print(f"Load test against {url}: {args.concurrency} clients, {args.duration:.0f}s, "
+              f"{args.write_ratio:.0%} writes")
+        results = run_load(url, args.duration, args.concurrency, args.write_ratio)
+        for kind in ("read", "write"):
+            r = results[kind]
+            print(f"  {kind:5}  {r['requests']:6d} req  {r['rps']:8.1f} req/s  "
+                  f"p50 {r['p50_ms']:7.1f} ms  p95 {r['p95_ms']:7.1f} ms  p99 {r['p99_ms']:7.1f} ms")
+        print(f"  errors {results['errors']}")
+        return 0 if results["errors"] == 0 else 1
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    exit(main())
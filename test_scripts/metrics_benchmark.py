@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+MyClean Metrics Overhead Benchmark
+Measures the throughput cost of MetricsMiddleware
+
+Usage: python metrics_benchmark.py [--requests 3000] [--budget 3.0]
+
+Requests are sent straight into the ASGI app, with no HTTP server or
+client in between, so the middleware's share of each request is as large
+as it can get. Comparing whole-app throughput with and without the
+middleware drowns a few microseconds in run-to-run noise, so the cost is
+measured directly instead: the middleware wraps a no-op ASGI app to get
+its per-request overhead, which is then divided by the per-request time
+of each real endpoint. Exits non-zero if the cost exceeds --budget percent
+on any endpoint.
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sqlite3
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+ENDPOINTS = ["/api/health", "/api/services", "/api/orders?limit=20", "/api/orders/1"]
+# Seeded by database_setup.py; made an administrator so the order endpoints show every order
+ADMIN_EMAIL = "admin@test.com"
+
+
+def prepare_backend():
+    """Import main.py from a temporary copy of backend/ with a fresh database"""
+    work_dir = tempfile.mkdtemp(prefix="myclean_metrics_")
+    for name in os.listdir(BACKEND_DIR):
+        path = os.path.join(BACKEND_DIR, name)
+        if os.path.isfile(path) and not name.startswith("myclean.db"):
+            shutil.copy(path, work_dir)
+    subprocess.run([sys.executable, "database_setup.py"], cwd=work_dir, check=True,
+                   stdout=subprocess.DEVNULL)
+    os.chdir(work_dir)
+    sys.path.insert(0, work_dir)
+    # Every request comes from one client address
+    os.environ.setdefault("MYCLEAN_RATE_LIMITS", "0")
+    os.environ.setdefault("MYCLEAN_ADMIN_EMAILS", ADMIN_EMAIL)
+    import main
+    return main, work_dir
+
+
+async def call(app, target, headers=()):
+    path, _, query = target.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "headers": [(b"host", b"benchmark"), *headers], "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def measure(app, target, count, headers=()):
+    started = time.perf_counter()
+    for _ in range(count):
+        await call(app, target, headers)
+    return count / (time.perf_counter() - started)
+
+
+async def middleware_overhead(metrics_module, count):
+    """Seconds the middleware adds to one request, measured around a no-op app"""
+    async def noop_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    wrapped = metrics_module.MetricsMiddleware(noop_app, metrics_module.Metrics())
+    best = float("inf")
+    for _ in range(5):
+        bare = count / await measure(noop_app, "/", count)
+        instrumented = count / await measure(wrapped, "/", count)
+        best = min(best, (instrumented - bare) / count)
+    return max(best, 0.0)
+
+
+async def run(main, args):
+    import metrics
+    from auth import ACCESS_TOKEN_SECONDS, issue_token
+
+    conn = sqlite3.connect("myclean.db")
+    admin_id = conn.execute("SELECT id FROM users WHERE email = ?", (ADMIN_EMAIL,)).fetchone()[0]
+    conn.close()
+    token, _ = issue_token(admin_id, "access", ACCESS_TOKEN_SECONDS)
+    headers = [(b"authorization", f"Bearer {token}".encode())]
+
+    overhead = await middleware_overhead(metrics, args.requests * 20)
+    print(f"MetricsMiddleware overhead: {overhead * 1e6:.2f} us/request\n")
+
+    failures = 0
+    print(f"{'endpoint':24}  {'req/s':>8}  {'us/request':>10}  {'cost':>7}")
+    for target in ENDPOINTS:
+        await measure(main.app, target, args.requests // 10, headers)  # warm up
+        rps = max([await measure(main.app, target, args.requests, headers) for _ in range(3)])
+        cost = overhead * rps * 100
+        failures += cost > args.budget
+        print(f"{target:24}  {rps:>8.0f}  {1e6 / rps:>10.1f}  {cost:>6.2f}%")
+
+    main.close_database()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MetricsMiddleware overhead benchmark")
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--budget", type=float, default=3.0, help="maximum acceptable cost in percent")
+    args = parser.parse_args()
+
+    backend, work_dir = prepare_backend()
+    try:
+        failures = asyncio.run(run(backend, args))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    exit(main())
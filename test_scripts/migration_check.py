@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+MyClean Online Migration Check
+Checks that migrations.add_column() and backfill() change a large table online and resumably
+
+Usage: python migration_check.py [--orders 200000] [--batch 10000] [--max-wait-ms 100]
+
+Seeds a throwaway copy of backend/ with --orders orders and adds a scratch
+column to orders with add_column(), which must leave the table's pages
+alone and be a no-op the second time. A backfill of the column is then
+started in a child process and killed after its first batches: the rows it
+filled must be a rowid prefix, as each batch commits on its own. Running
+the backfill again must fill exactly the rows the first run did not reach,
+in one transaction per --batch rowids, and leave every row with the right
+value. Meanwhile another connection keeps making small writes, none of
+which may wait more than --max-wait-ms for the write lock. Prints each
+check and exits non-zero if any failed.
+"""
+
+import argparse
+import math
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+from benchmark_suite import seed
+from load_test import BACKEND_DIR, prepare_workdir
+
+sys.path.insert(0, BACKEND_DIR)
+from db import BUSY_TIMEOUT_MS
+from migrations import add_column, backfill
+
+SCRATCH_COLUMN = "migration_check"
+FILLED_VALUE = "id % 97"
+ASSIGNMENTS = f"{SCRATCH_COLUMN} = {FILLED_VALUE}"
+UNFILLED = f"{SCRATCH_COLUMN} IS NULL"
+
+# Run from the work directory, so it imports that copy of migrations.py
+INTERRUPTED_BACKFILL = """
+import sqlite3, sys
+from migrations import backfill
+conn = sqlite3.connect(sys.argv[1], isolation_level=None, timeout=30)
+backfill(conn, "orders", sys.argv[2], sys.argv[3], int(sys.argv[4]))
+"""
+
+
+def connect(db_path):
+    # Autocommit, as migrate() calls the migrations with
+    return sqlite3.connect(db_path, isolation_level=None, timeout=BUSY_TIMEOUT_MS / 1000)
+
+
+def scalar(conn, sql):
+    return conn.execute(sql).fetchone()[0]
+
+
+class LockWaits:
+    """Small write transactions on their own connection, recording how long each waits for the lock"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.waits = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+
+    def _run(self):
+        conn = connect(self.db_path)
+        conn.execute("CREATE TABLE IF NOT EXISTS migration_check_writes (written_at REAL)")
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            conn.execute("BEGIN IMMEDIATE")
+            self.waits.append(time.perf_counter() - started)
+            conn.execute("INSERT INTO migration_check_writes VALUES (?)", (started,))
+            conn.execute("COMMIT")
+            time.sleep(0.002)
+        conn.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_check(args):
+    """[(check, passed, detail), ...]"""
+    results = []
+    work_dir = prepare_workdir()
+    db_path = os.path.join(work_dir, "myclean.db")
+    try:
+        seed(db_path, args.orders, args.seed)
+        conn = connect(db_path)
+        rows = scalar(conn, "SELECT count(*) FROM orders")
+        last_rowid = scalar(conn, "SELECT MAX(rowid) FROM orders")
+        print(f"Seeded {rows} orders")
+
+        pages = scalar(conn, "PRAGMA page_count")
+        started = time.perf_counter()
+        add_column(conn, "orders", SCRATCH_COLUMN, "INTEGER")
+        add_column(conn, "orders", SCRATCH_COLUMN, "INTEGER")
+        elapsed = time.perf_counter() - started
+        grown = scalar(conn, "PRAGMA page_count") - pages
+        results.append(("add_column leaves the table alone", grown <= 1,
+                        f"{grown} pages added, {elapsed * 1000:.1f} ms for both calls"))
+
+        # Kill the first backfill once it has committed a couple of batches
+        child = subprocess.Popen([sys.executable, "-c", INTERRUPTED_BACKFILL, db_path, ASSIGNMENTS, UNFILLED,
+                                  str(args.batch)], cwd=work_dir)
+        deadline = time.perf_counter() + 60
+        while (scalar(conn, f"SELECT count(*) FROM orders WHERE NOT ({UNFILLED})") < 2 * args.batch
+               and child.poll() is None and time.perf_counter() < deadline):
+            time.sleep(0.005)
+        child.kill()
+        child.wait()
+        remaining = scalar(conn, f"SELECT count(*) FROM orders WHERE {UNFILLED}")
+        if not remaining:
+            results.append(("backfill interrupted", False, "finished before it could be killed; seed more --orders"))
+            return results
+        last_filled = scalar(conn, f"SELECT COALESCE(MAX(rowid), 0) FROM orders WHERE NOT ({UNFILLED})")
+        first_unfilled = scalar(conn, f"SELECT MIN(rowid) FROM orders WHERE {UNFILLED}")
+        results.append(("interrupted backfill committed whole batches", last_filled < first_unfilled,
+                        f"{rows - remaining} rows filled up to rowid {last_filled}, "
+                        f"first unfilled rowid {first_unfilled}"))
+
+        transactions = []
+        conn.set_trace_callback(lambda sql: transactions.append(sql) if sql == "BEGIN IMMEDIATE" else None)
+        with LockWaits(db_path) as writer:
+            started = time.perf_counter()
+            updated = backfill(conn, "orders", ASSIGNMENTS, UNFILLED, args.batch)
+            elapsed = time.perf_counter() - started
+        conn.set_trace_callback(None)
+
+        results.append(("resumed backfill fills only the rest", updated == remaining,
+                        f"{updated} rows updated, {remaining} were unfilled, {elapsed:.2f}s"))
+        expected = math.ceil(last_rowid / args.batch)
+        results.append(("one transaction per batch", len(transactions) == expected,
+                        f"{len(transactions)} transactions, {expected} batches of {args.batch}"))
+        wrong = scalar(conn, f"SELECT count(*) FROM orders WHERE {UNFILLED} OR {SCRATCH_COLUMN} != {FILLED_VALUE}")
+        results.append(("every row filled correctly", wrong == 0, f"{wrong} rows unfilled or wrong"))
+        longest = max(writer.waits, default=0) * 1000
+        results.append(("writers stay unblocked", longest <= args.max_wait_ms,
+                        f"{len(writer.waits)} writes, longest wait {longest:.1f} ms"))
+        conn.close()
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MyClean online migration check")
+    parser.add_argument("--orders", type=int, default=200000, help="orders seeded before migrating")
+    parser.add_argument("--batch", type=int, default=10000, help="backfill batch size in rowids")
+    parser.add_argument("--max-wait-ms", type=float, default=100.0,
+                        help="longest a concurrent write may wait for the lock")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    results = run_check(args)
+    for check, passed, detail in results:
+        print(f"{'ok  ' if passed else 'FAIL'}  {check}: {detail}")
+    return 0 if all(passed for _, passed, _ in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+MyClean Query Plan Check
+Fails when a statement the API runs scans a large table or sorts without an index
+
+Usage: python query_plan_check.py [--orders 200000] [--output query_plans.json] [--verbose]
+
+Seeds a throwaway copy of backend/ with --orders orders, then drives every
+endpoint in-process with the statements traced (backend/query_plans.py),
+including the filter combinations of the order list. Each distinct
+statement is run through EXPLAIN QUERY PLAN on the seeded database and
+checked for full table scans and temporary sort B-trees; see SMALL_TABLES
+and BOUNDED_SORTS in query_plans.py for the accepted ones. Problems are
+printed with a suggested index, the full report is written as JSON, and the
+script exits non-zero if there were any.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+from benchmark_suite import seed
+from load_test import BACKEND_DIR, TEST_ADMIN, prepare_workdir
+
+sys.path.insert(0, BACKEND_DIR)
+from data_generator import GENERATED_PASSWORD
+
+
+def sample_users(db_path):
+    """Id and email of the generated customer and provider with the most orders"""
+    conn = sqlite3.connect(db_path)
+    customer, provider = [conn.execute(f"""
+        SELECT u.id, u.email FROM orders o JOIN users u ON u.id = o.{column}
+        WHERE u.email LIKE '%@example.com' AND u.is_active = 1
+        GROUP BY o.{column} ORDER BY count(*) DESC LIMIT 1
+    """).fetchone() for column in ("customer_id", "provider_id")]
+    conn.close()
+    return customer, provider
+
+
+def login(client, email, password=GENERATED_PASSWORD):
+    response = client.post("/api/auth/login", json={"email": email, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}, response.json()["refresh_token"]
+
+
+def drive(client, customer, provider):
+    """Call every endpoint, with the parameter combinations that change the SQL"""
+    customer_id, customer_email = customer
+    provider_id, provider_email = provider
+    headers, refresh_token = login(client, customer_email)
+    provider_headers, _ = login(client, provider_email)
+    # Sees every order and all analytics, so each filter reaches the SQL as given
+    admin_headers, _ = login(client, TEST_ADMIN["email"], TEST_ADMIN["password"])
+    today = date.today()
+    future = (today + timedelta(days=400)).isoformat()
+
+    client.post("/api/auth/register", json={"email": "plan-check@example.org", "password": "pw",
+                                            "first_name": "Plan", "last_name": "Check"})
+    client.get("/api/auth/me", headers=headers)
+    client.get("/api/services")
+    client.get("/api/services", params={"include_inactive": True})
+    client.get("/api/services/1/durations")
+    client.get("/api/services/1/availability", params={"service_date": future, "service_duration_id": 1})
+    client.get("/api/services/search", params={"q": "flow"})
+    client.get("/api/services/search", params={"q": "clean", "include_inactive": True})
+    client.put("/api/services/1", json={"description": "Checked"}, headers=provider_headers)
+    client.post("/api/services", json={"name": "Plan check", "category_name": "Cleaning", "base_price": 10},
+                headers=provider_headers)
+
+    order = client.post("/api/orders", headers=headers, json={
+        "service_type_id": 1, "service_duration_id": 1, "service_date": future,
+        "service_time_start": "10:00:00", "provider_id": provider_id,
+    }).json()
+    for _ in range(2):
+        client.post("/api/orders", headers={**headers, "Idempotency-Key": "plan-check"}, json={
+            "service_type_id": 1, "service_duration_id": 1, "service_date": future, "service_time_start": "11:00:00",
+        })
+    client.post("/api/orders/bulk", headers=admin_headers, json={"orders": [
+        {"service_type_id": 2, "service_duration_id": 3, "service_date": future, "service_time_start": "12:00:00",
+         "provider_id": provider_id, "customer_id": customer_id},
+        {"service_type_id": 1, "service_duration_id": 1, "service_date": future, "service_time_start": "15:00:00",
+         "customer_id": customer_id},
+    ]})
+    client.put(f"/api/orders/{order['id']}/status", params={"status": "confirmed"}, headers=provider_headers)
+    client.put("/api/orders/bulk/status", headers=provider_headers, json={"transitions": [
+        {"order_id": order["id"], "status": "cancelled"}, {"order_id": 1, "status": "completed"},
+    ]})
+
+    filters = [{}, {"status": "completed"}, {"customer_id": customer_id}, {"provider_id": provider_id},
+               {"service_type_id": 2}, {"created_from": (today - timedelta(days=30)).isoformat()},
+               {"created_from": (today - timedelta(days=90)).isoformat(), "created_to": today.isoformat()},
+               {"status": "pending", "customer_id": customer_id},
+               {"status": "completed", "provider_id": provider_id, "service_type_id": 3}]
+    for params in filters:
+        response = client.get("/api/orders", params=params, headers=admin_headers)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor:
+            client.get("/api/orders", params={**params, "cursor": cursor}, headers=admin_headers)
+    client.get(f"/api/orders/{order['id']}", headers=headers)
+    client.get(f"/api/orders/{order['id']}/history", headers=headers)
+    client.get("/api/orders/search", params={"q": "gift"}, headers=headers)
+    client.get("/api/orders/search", params={"q": "Smith"}, headers=provider_headers)
+    client.get("/api/orders/search", params={"q": "Smith"}, headers=admin_headers)
+
+    client.get("/api/analytics/daily", headers=admin_headers)
+    client.get("/api/analytics/daily", params={"provider_id": provider_id}, headers=admin_headers)
+    client.get("/api/analytics/services", params={"date_from": (today - timedelta(days=365)).isoformat()},
+               headers=admin_headers)
+    client.get("/api/analytics/services", params={"provider_id": provider_id}, headers=admin_headers)
+    client.get(f"/api/providers/{provider_id}/earnings", headers=provider_headers)
+
+    client.post("/api/auth/refresh", json={"refresh_token": refresh_token})
+    client.post("/api/auth/logout", headers=provider_headers)
+
+
+def replay_events(log, db_path, customer_id, provider_id):
+    """The event stream's history queries, which an in-process client cannot stream, and an archive pass"""
+    from archive import archive_batch, cutoff
+    from db import connect
+    from order_events import fetch_history, latest_history_id
+
+    conn = connect(db_path, read_only=True)
+    conn.set_trace_callback(log)
+    last = latest_history_id(conn)
+    fetch_history(conn, last - 1000, customer_id=customer_id)
+    fetch_history(conn, last - 1000, provider_id=provider_id)
+    fetch_history(conn, last - 1000)
+    conn.close()
+
+    # Rolled back, so the archived orders stay live for the plans above
+    conn = connect(db_path)
+    conn.set_trace_callback(log)
+    conn.execute("BEGIN IMMEDIATE")
+    archive_batch(conn, cutoff(30), 10)
+    conn.execute("ROLLBACK")
+    conn.close()
+
+
+def run_check(args):
+    work_dir = prepare_workdir()
+    db_path = os.path.join(work_dir, "myclean.db")
+    try:
+        seed(db_path, args.orders, args.seed)
+        customer, provider = sample_users(db_path)
+
+        os.chdir(work_dir)
+        sys.path.insert(0, work_dir)
+        from fastapi.testclient import TestClient
+        # Every request comes from one client address
+        os.environ.setdefault("MYCLEAN_RATE_LIMITS", "0")
+        os.environ.setdefault("MYCLEAN_ADMIN_EMAILS", TEST_ADMIN["email"])
+        import main
+        from query_plans import StatementLog, check
+
+        log = StatementLog()
+        with TestClient(main.app) as client:
+            main.get_database().set_trace_callback(log)
+            drive(client, customer, provider)
+            main.get_database().set_trace_callback(None)
+        replay_events(log, db_path, customer[0], provider[0])
+
+        conn = sqlite3.connect(db_path)
+        report = check(conn, log.statements)
+        conn.close()
+        return report
+    finally:
+        os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MyClean query plan check")
+    parser.add_argument("--orders", type=int, default=200000, help="orders seeded before explaining")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="query_plans.json")
+    parser.add_argument("--verbose", action="store_true", help="print every statement's plan")
+    args = parser.parse_args()
+    args.output = os.path.abspath(args.output)
+
+    report = run_check(args)
+    failures = [entry for entry in report if entry["problems"]]
+    for entry in report:
+        if not (entry["problems"] or args.verbose):
+            continue
+        print(f"\n{'FAIL' if entry['problems'] else 'ok  '}  ({entry['executions']}x) {entry['statement'][:300]}")
+        for line in entry["plan"]:
+            print(f"        {line}")
+        for problem in entry["problems"]:
+            print(f"  -> {problem['problem']}: {problem['detail']}")
+            print(f"     suggested: {problem['suggestion'] or 'no index helps; rewrite the query'}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n{len(report)} statements explained, {len(failures)} with problems; report written to {args.output}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
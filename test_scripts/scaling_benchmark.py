@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+MyClean Worker Scaling Benchmark
+Throughput of the API with 1, 2, 4, ... worker processes sharing one database
+
+Usage: python scaling_benchmark.py [--workers 1 2 4] [--orders 100000] [--duration 5]
+                                   [--concurrency 32] [--output scaling_results.json]
+
+Seeds a throwaway copy of backend/ with --orders orders, then for each worker
+count starts `main.py --workers N` on it and measures requests/sec and
+p50/p95/p99 latency for:
+
+- catalogue_browse     GET /api/services and /api/services/{id}/durations
+- order_listing        paginated GET /api/orders
+- mixed_read/write     the load_test.py mix of browsing and order writes
+
+Reads scale with the worker count up to the number of cores; writes share
+SQLite's single write lock, so mixed_write shows the ceiling of that lock.
+Each workload's speedup over the first worker count is printed and written
+with the results as JSON.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+from datetime import datetime
+
+from benchmark_suite import browse_catalogue, list_orders, run_workload, seed
+from load_test import TEST_ADMIN, auth_headers, launch_backend, prepare_workdir, run_load
+
+
+def default_worker_counts():
+    """1, 2, 4, ... up to the number of cores"""
+    counts = [1]
+    while counts[-1] * 2 <= (os.cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+    return counts
+
+
+def run_scaling(args):
+    work_dir = prepare_workdir()
+    seed(os.path.join(work_dir, "myclean.db"), args.orders, args.seed)
+
+    runs = {}
+    try:
+        for workers in args.workers:
+            print(f"{workers} worker{'s' if workers > 1 else ''}")
+            process, url = launch_backend(work_dir, args.port, workers)
+            workloads = {}
+            try:
+                def record(name, result):
+                    workloads[name] = result
+                    print(f"  {name:18} {result['rps']:9.1f} req/s  p50 {result['p50_ms']:7.1f} ms  "
+                          f"p95 {result['p95_ms']:7.1f} ms  p99 {result['p99_ms']:7.1f} ms  "
+                          f"errors {result.get('errors', 0)}")
+
+                record("catalogue_browse", run_workload(url, args.duration, args.concurrency, browse_catalogue))
+                record("order_listing", run_workload(url, args.duration, args.concurrency, list_orders,
+                                                     auth_headers(url, TEST_ADMIN)))
+                mixed = run_load(url, args.duration, args.concurrency, args.write_ratio)
+                record("mixed_read", {**mixed["read"], "errors": mixed["errors"]})
+                record("mixed_write", mixed["write"])
+            finally:
+                process.terminate()
+                process.wait()
+            runs[str(workers)] = workloads
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return runs
+
+
+def speedups(runs):
+    """req/s of each run relative to the first, per workload"""
+    first = next(iter(runs.values()))
+    return {
+        workers: {name: result["rps"] / first[name]["rps"] if first[name]["rps"] else 0.0
+                  for name, result in workloads.items()}
+        for workers, workloads in runs.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MyClean worker scaling benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=default_worker_counts(),
+                        help="worker counts to measure (default 1, 2, 4, ... up to the core count)")
+    parser.add_argument("--orders", type=int, default=100000, help="orders seeded before measuring")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per workload")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="write share of the mixed workload")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--output", default="scaling_results.json")
+    args = parser.parse_args()
+
+    print(f"Scaling benchmark: {args.concurrency} clients, {args.duration:.0f}s per workload, "
+          f"{args.orders} orders, {os.cpu_count()} cores")
+    runs = run_scaling(args)
+    ratios = speedups(runs)
+
+    print(f"\nSpeedup over {args.workers[0]} worker(s)")
+    names = list(next(iter(runs.values())))
+    print("  workers  " + "  ".join(f"{name:>16}" for name in names))
+    for workers, by_name in ratios.items():
+        print(f"  {workers:>7}  " + "  ".join(f"{by_name[name]:15.2f}x" for name in names))
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "orders": args.orders,
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+        },
+        "runs": runs,
+        "speedup": ratios,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+MyClean Serialization Benchmark
+Compares the Pydantic response_model path with pre-serialized orjson bytes
+
+Usage: python serialization_benchmark.py [--rows 10 100 1000] [--seconds 2]
+
+Both paths are mounted on an in-process FastAPI app and driven through the
+same TestClient, so the difference in requests/sec is the cost of building
+and re-validating a model per row.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from typing import List
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from main import OrderResponse  # noqa: E402
+from serialization import encode, json_response, order_row_to_dict  # noqa: E402
+
+
+def make_rows(count):
+    """sqlite3.Row objects shaped like the GET /api/orders query on order_view"""
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("""
+        CREATE TABLE o (id INTEGER, order_number TEXT, customer_name TEXT, service_day INTEGER,
+                        start_minute INTEGER, end_minute INTEGER, total_price REAL, status TEXT,
+                        service_type_name TEXT, created INTEGER)
+    """)
+    conn.executemany("INSERT INTO o VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+        (i, f"ORD{i:08d}", "John Doe", 20366, 660, 720, 21.0 + i % 7, "pending", "Fresh Flowers",
+         1759600000 + i)
+        for i in range(count)
+    ])
+    return conn.execute("SELECT * FROM o").fetchall()
+
+
+def build_app(rows):
+    app = FastAPI()
+
+    @app.get("/model", response_model=List[OrderResponse])
+    async def model_path():
+        # The pre-orjson get_orders(): a model per row, then response_model validation
+        return [OrderResponse(**order_row_to_dict(row)) for row in rows]
+
+    @app.get("/orjson", response_model=List[OrderResponse])
+    async def orjson_path():
+        return json_response(encode([order_row_to_dict(row) for row in rows]))
+
+    cached = encode([order_row_to_dict(row) for row in rows])
+
+    @app.get("/cached", response_model=List[OrderResponse])
+    async def cached_path():
+        # What the catalogue endpoints do: bytes encoded once per snapshot
+        return json_response(cached)
+
+    return app
+
+
+def measure(client, path, seconds):
+    assert client.get(path).status_code == 200
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        client.get(path)
+        count += 1
+    return count / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response serialization benchmark")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    print(f"{'rows':>6}  {'model req/s':>12}  {'orjson req/s':>12}  {'cached req/s':>12}  {'speedup':>8}")
+    for count in args.rows:
+        client = TestClient(build_app(make_rows(count)))
+        assert client.get("/model").json() == client.get("/orjson").json()
+        model_rps = measure(client, "/model", args.seconds)
+        orjson_rps = measure(client, "/orjson", args.seconds)
+        cached_rps = measure(client, "/cached", args.seconds)
+        print(f"{count:>6}  {model_rps:>12.1f}  {orjson_rps:>12.1f}  {cached_rps:>12.1f}  "
+              f"{orjson_rps / model_rps:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
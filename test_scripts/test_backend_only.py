@@ -7,6 +7,7 @@ Usage: python test_backend_only.py
 """
 
 import requests
+import base64
 import time
 import random
 import string
@@ -194,6 +195,8 @@ class BackendTester:
                 response = self.session.post(f"{BACKEND_URL}/api/auth/login", json=login_data, timeout=10)
                 if response.status_code == 200:
                     login_result = response.json()
+                    # Later requests act as the last user to log in
+                    self.session.headers["Authorization"] = f"Bearer {login_result['access_token']}"
                     self.log(f"✓ {user['role']} login successful: {user['email']}", "SUCCESS")
                     self.log(f"  User ID: {login_result.get('id')}, Is Provider: {login_result.get('is_provider')}", "INFO")
                 else:
@@ -266,13 +269,13 @@ class BackendTester:
                 self.log("✗ No available service durations", "ERROR")
                 return False
 
-            # Create order
-            tomorrow = (datetime.now() + timedelta(days=1)).date()
+            # Create order, at a random time so that repeated runs find a provider free
+            service_date = (datetime.now() + timedelta(days=random.randint(1, 365))).date()
             order_data = {
                 "service_type_id": service_id,
                 "service_duration_id": durations[0]["id"],
-                "service_date": tomorrow.isoformat(),
-                "service_time_start": "10:00:00",
+                "service_date": service_date.isoformat(),
+                "service_time_start": f"{random.randint(8, 17):02d}:00:00",
                 "customer_notes": "Test order - Created by automated testing"
             }
 
@@ -291,6 +294,41 @@ class BackendTester:
             self.log(f"✗ Order creation exception: {e}", "ERROR")
             return False
     
+    def test_availability_overlaps(self):
+        """Test the availability engine against existing bookings that overlap each other"""
+        self.log("Testing availability with overlapping bookings...")
+
+        backend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+        sys.path.insert(0, backend_dir)
+        try:
+            from availability import AvailabilityIndex
+        finally:
+            sys.path.remove(backend_dir)
+
+        # Legacy data: 08:00-14:00 overlaps 09:00-10:00, which starts later but ends first
+        index = AvailabilityIndex()
+        day = "2030-06-01"
+        index.add(1, day, 8 * 60, 14 * 60, 1)
+        index.add(1, day, 9 * 60, 10 * 60, 2)
+
+        checks = [
+            ("12:00-13:00 conflicts with the long booking", index.conflicts(1, day, 12 * 60, 13 * 60)),
+            ("14:00-15:00 is free", not index.conflicts(1, day, 14 * 60, 15 * 60)),
+            ("another provider is free", not index.conflicts(2, day, 12 * 60, 13 * 60)),
+        ]
+        slots = {start: free for start, _, free in index.free_slots([1, 2], day, 60)}
+        checks.append(("no slot before 14:00 offers the provider",
+                       all(1 not in free for start, free in slots.items() if start < 14 * 60)))
+        checks.append(("the provider is offered from 14:00", 1 in slots.get(14 * 60, [])))
+
+        failed = [name for name, passed in checks if not passed]
+        if failed:
+            for name in failed:
+                self.log(f"✗ Availability check failed: {name}", "ERROR")
+            return False
+        self.log(f"✓ Availability with overlapping bookings: {len(checks)} checks passed", "SUCCESS")
+        return True
+
     def test_orders_api(self):
         """Test orders API"""
         self.log("Testing orders API...")
@@ -312,10 +350,11 @@ class BackendTester:
                     if response.status_code == 200:
                         order_detail = response.json()
                         self.log(f"✓ Get individual order successful: {order_detail['order_number']}", "SUCCESS")
-                        return True
                     else:
                         self.log(f"✗ Get individual order failed: {response.status_code}", "ERROR")
                         return False
+
+                    return self.test_orders_pagination(orders)
                 else:
                     self.log("⚠ No orders available to test individual order retrieval", "WARNING")
                     return True
@@ -326,6 +365,44 @@ class BackendTester:
         except Exception as e:
             self.log(f"✗ Orders API test exception: {e}", "ERROR")
             return False
+
+    def test_orders_pagination(self, orders):
+        """Walk the order list one order per page using the cursor header"""
+        self.log("Testing orders pagination...")
+
+        try:
+            paged_ids = []
+            params = {"limit": 1}
+            while True:
+                response = self.session.get(f"{BACKEND_URL}/api/orders", params=params, timeout=10)
+                if response.status_code != 200:
+                    self.log(f"✗ Get orders page failed: {response.status_code}", "ERROR")
+                    return False
+                paged_ids.extend(order["id"] for order in response.json())
+                next_cursor = response.headers.get("X-Next-Cursor")
+                # `orders` is only the first page of the default listing
+                if not next_cursor or len(paged_ids) >= len(orders):
+                    break
+                params = {"limit": 1, "cursor": next_cursor}
+
+            if paged_ids != [order["id"] for order in orders]:
+                self.log("✗ Paged orders do not match the full order list", "ERROR")
+                return False
+
+            # Forged cursors: overflowing floats, Infinity, an integer beyond
+            # SQLite's 64 bits, a float and a boolean must all be rejected
+            for raw in ['[1e999,1]', '[Infinity,1]', f'[1,{2 ** 63}]', '[1.5,1]', '[true,1]', '{}']:
+                cursor = base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+                response = self.session.get(f"{BACKEND_URL}/api/orders", params={"cursor": cursor}, timeout=10)
+                if response.status_code != 400:
+                    self.log(f"✗ Forged cursor {raw} got {response.status_code}, expected 400", "ERROR")
+                    return False
+
+            self.log(f"✓ Orders pagination successful: {len(paged_ids)} pages", "SUCCESS")
+            return True
+        except Exception as e:
+            self.log(f"✗ Orders pagination exception: {e}", "ERROR")
+            return False
     
     def cleanup_database(self):
         """Clean up database for fresh testing"""
@@ -337,7 +414,7 @@ class BackendTester:
             setup_script = os.path.join(backend_dir, "database_setup.py")
 
             if os.path.exists(setup_script):
-                result = subprocess.run([sys.executable, setup_script],
+                result = subprocess.run([sys.executable, setup_script, "--reset"],
                                       cwd=backend_dir,
                                       capture_output=True,
                                       text=True,
@@ -381,6 +458,9 @@ class BackendTester:
             if not success:
                 return False
 
+            if not self.test_availability_overlaps():
+                return False
+
             if not self.test_order_creation(services):
                 return False
 
@@ -394,6 +474,7 @@ class BackendTester:
             self.log(f"✓ User registration: Passed ({len(self.test_users)} users)", "SUCCESS")
             self.log(f"✓ User login: Passed", "SUCCESS")
             self.log(f"✓ Services API: Passed", "SUCCESS")
+            self.log(f"✓ Availability with overlapping bookings: Passed", "SUCCESS")
             self.log(f"✓ Order creation: Passed", "SUCCESS")
             self.log(f"✓ Orders retrieval: Passed", "SUCCESS")
             self.log("🎉 All backend API tests passed!", "SUCCESS")